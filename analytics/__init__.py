@@ -0,0 +1,6 @@
+"""ShopVerse analytics - log parsing, metrics, reports, ML and the dashboard.
+
+Run it with `python -m analytics <command>`; see cli.py. Importing the
+package itself loads nothing else, so each command only pays for the
+modules it uses.
+"""
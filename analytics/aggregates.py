@@ -0,0 +1,513 @@
+"""Running event aggregates that can be updated, merged and persisted one bucket at a time."""
+
+import os
+import json
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from .metrics import (
+    ADD_TO_CART_ELEMENTS,
+    DEFAULT_FUNNEL_MAX_GAP,
+    ORDERED_FUNNEL_STEPS,
+    VIEW_DETAILS_ELEMENT,
+    calculate_ordered_funnel,
+    counts_df,
+    ecommerce_from_heavy_hitters,
+    ordered_funnel_units,
+)
+from .sessions import DEFAULT_SESSION_GAP, SESSION_COLUMNS, assign_sessions, build_sessions, session_kpis
+from .sketches import DEFAULT_CAPACITY, DEFAULT_PRECISION, HeavyHitters, HyperLogLog
+
+
+STATE_VERSION = 2
+UNDATED_BUCKET = 'undated'
+
+
+def _value_counts(series: pd.Series) -> Dict[Any, int]:
+    counts = series.value_counts()
+    return {key: int(count) for key, count in counts.items() if count > 0}
+
+
+def _user_values(series: pd.Series) -> set:
+    # All missing ids become None so sets compare and merge the same after a JSON round trip
+    return {None if pd.isna(user) else user for user in series.unique()}
+
+
+Users = Union[set, HyperLogLog]
+
+
+def _add_users(users: Users, series: pd.Series) -> None:
+    if isinstance(users, HyperLogLog):
+        users.add(series)
+    else:
+        users.update(_user_values(series))
+
+
+def _merge_users(users: Users, other: Users) -> None:
+    if isinstance(users, HyperLogLog):
+        users.merge(other)
+    else:
+        users |= other
+
+
+def _count_users(users: Users) -> int:
+    return users.count() if isinstance(users, HyperLogLog) else len(users)
+
+
+def _users_to_json(users: Users):
+    if isinstance(users, HyperLogLog):
+        return users.to_dict()
+    return sorted(users, key=lambda user: (user is None, str(user)))
+
+
+def _users_from_json(data) -> Users:
+    return HyperLogLog.from_dict(data) if isinstance(data, dict) else set(data)
+
+
+Products = Union[Counter, HeavyHitters]
+
+
+def _add_products(products: Products, series: pd.Series) -> None:
+    if isinstance(products, HeavyHitters):
+        products.update(series)
+    else:
+        products.update(_value_counts(series))
+
+
+def _merge_products(products: Products, other: Products) -> None:
+    if isinstance(products, HeavyHitters):
+        products.merge(other)
+    else:
+        products.update(other)
+
+
+def _products_to_json(products: Products):
+    return products.to_dict() if isinstance(products, HeavyHitters) else dict(products)
+
+
+def _products_from_json(data, approximate: bool) -> Products:
+    return HeavyHitters.from_dict(data) if approximate else Counter(data)
+
+
+class EventAggregates:
+    """Counts and user sets behind the outputs of generate_analytics.
+
+    update() only touches the rows of the new batch, so keeping the outputs
+    current costs time proportional to the incoming events, not the history.
+    States built from disjoint sets of events can be merged, and merging gives
+    the same outputs as building one state from all of the events.
+
+    With approximate=True the user sets are replaced by HyperLogLog sketches of
+    the given precision: a few KB each however many users there are, at the
+    cost of a relative standard error of 1.04 / sqrt(2**precision) on
+    unique_users and the funnel stages. The per-product counts are likewise
+    replaced by HeavyHitters summaries of at most capacity products.
+    """
+
+    def __init__(self, approximate: bool = False, precision: int = DEFAULT_PRECISION,
+                 capacity: int = DEFAULT_CAPACITY):
+        self.approximate = approximate
+        self.precision = precision
+        self.capacity = capacity
+        self.total_events = 0
+        self.events_by_type: Counter = Counter()
+        self.events_by_page: Counter = Counter()
+        self.events_by_element: Counter = Counter()
+        self.events_by_hour: Counter = Counter()
+        self.add_to_cart_by_product: Products = self._new_products()
+        self.view_details_by_product: Products = self._new_products()
+        self.users: Users = self._new_users()
+        self.funnel_users: Dict[str, Users] = {stage: self._new_users() for stage, _, _ in ORDERED_FUNNEL_STEPS}
+        self.last_event: Optional[pd.Timestamp] = None
+        self.datetime_unit: Optional[str] = None
+
+    def _new_users(self) -> Users:
+        return HyperLogLog(self.precision) if self.approximate else set()
+
+    def _new_products(self) -> Products:
+        return HeavyHitters(self.capacity) if self.approximate else Counter()
+
+    @classmethod
+    def from_events(cls, df: pd.DataFrame, approximate: bool = False,
+                    precision: int = DEFAULT_PRECISION, capacity: int = DEFAULT_CAPACITY) -> 'EventAggregates':
+        state = cls(approximate, precision, capacity)
+        state.update(df)
+        return state
+
+    def update(self, df: pd.DataFrame) -> None:
+        if df.empty:
+            return
+
+        self.total_events += len(df)
+        self.events_by_type.update(_value_counts(df['event_type']))
+        self.events_by_page.update(_value_counts(df['page']))
+        self.events_by_element.update(_value_counts(df['element']))
+        _add_users(self.users, df['user_id'].dropna())
+
+        if 'datetime' in df.columns:
+            self.datetime_unit = self.datetime_unit or df['datetime'].dt.unit
+            self.events_by_hour.update(_value_counts(df['datetime'].dt.floor('h')))
+            latest = df['datetime'].max()
+            if pd.notna(latest) and (self.last_event is None or latest > self.last_event):
+                self.last_event = latest
+
+        add_to_cart = df['element'].isin(ADD_TO_CART_ELEMENTS)
+        if 'product_id' in df.columns:
+            _add_products(self.add_to_cart_by_product, df.loc[add_to_cart, 'product_id'])
+            view_details = df['element'] == VIEW_DETAILS_ELEMENT
+            _add_products(self.view_details_by_product, df.loc[view_details, 'product_id'])
+
+        for stage, column, values in ORDERED_FUNNEL_STEPS:
+            _add_users(self.funnel_users[stage], df.loc[df[column].isin(values), 'user_id'])
+
+    def merge(self, other: 'EventAggregates') -> 'EventAggregates':
+        """Folds other into this state in place and returns it."""
+        if ((other.approximate, other.precision, other.capacity) != (self.approximate, self.precision, self.capacity)
+                and other.total_events):
+            raise ValueError("Cannot merge exact and approximate states, or sketches of different sizes")
+        self.total_events += other.total_events
+        for name in ('events_by_type', 'events_by_page', 'events_by_element', 'events_by_hour'):
+            getattr(self, name).update(getattr(other, name))
+        _merge_products(self.add_to_cart_by_product, other.add_to_cart_by_product)
+        _merge_products(self.view_details_by_product, other.view_details_by_product)
+        _merge_users(self.users, other.users)
+        for stage, users in other.funnel_users.items():
+            _merge_users(self.funnel_users[stage], users)
+        if other.last_event is not None and (self.last_event is None or other.last_event > self.last_event):
+            self.last_event = other.last_event
+        self.datetime_unit = self.datetime_unit or other.datetime_unit
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'version': STATE_VERSION,
+            'approximate': self.approximate,
+            'precision': self.precision,
+            'capacity': self.capacity,
+            'total_events': self.total_events,
+            'events_by_type': dict(self.events_by_type),
+            'events_by_page': dict(self.events_by_page),
+            'events_by_element': dict(self.events_by_element),
+            'events_by_hour': {hour.isoformat(): count for hour, count in self.events_by_hour.items()},
+            'add_to_cart_by_product': _products_to_json(self.add_to_cart_by_product),
+            'view_details_by_product': _products_to_json(self.view_details_by_product),
+            'users': _users_to_json(self.users),
+            'funnel_users': {stage: _users_to_json(users) for stage, users in self.funnel_users.items()},
+            'last_event': self.last_event.isoformat() if self.last_event is not None else None,
+            'datetime_unit': self.datetime_unit
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'EventAggregates':
+        if data.get('version') != STATE_VERSION:
+            raise ValueError(f"Unsupported aggregate state version: {data.get('version')}")
+
+        state = cls(data['approximate'], data['precision'], data['capacity'])
+        state.total_events = data['total_events']
+        state.events_by_type.update(data['events_by_type'])
+        state.events_by_page.update(data['events_by_page'])
+        state.events_by_element.update(data['events_by_element'])
+        state.events_by_hour.update({pd.Timestamp(hour): count for hour, count in data['events_by_hour'].items()})
+        state.add_to_cart_by_product = _products_from_json(data['add_to_cart_by_product'], state.approximate)
+        state.view_details_by_product = _products_from_json(data['view_details_by_product'], state.approximate)
+        state.users = _users_from_json(data['users'])
+        state.funnel_users = {stage: _users_from_json(users) for stage, users in data['funnel_users'].items()}
+        state.last_event = pd.Timestamp(data['last_event']) if data['last_event'] else None
+        state.datetime_unit = data['datetime_unit']
+        return state
+
+    @property
+    def add_to_cart_count(self) -> int:
+        return sum(self.events_by_element.get(element, 0) for element in ADD_TO_CART_ELEMENTS)
+
+    def events_by_type_df(self) -> pd.DataFrame:
+        return counts_df(self.events_by_type, 'event_type')
+
+    def events_by_page_df(self) -> pd.DataFrame:
+        return counts_df(self.events_by_page, 'page')
+
+    def _ecommerce(self) -> Dict[str, Any]:
+        if self.approximate:
+            return ecommerce_from_heavy_hitters({'added': self.add_to_cart_by_product,
+                                                 'viewed': self.view_details_by_product}, self.add_to_cart_count)
+        add_to_cart_by_product = counts_df(self.add_to_cart_by_product, 'product_id', 'add_to_cart_count')
+        return {
+            'add_to_cart_count': self.add_to_cart_count,
+            'add_to_cart_by_product': add_to_cart_by_product,
+            'view_details_by_product': counts_df(self.view_details_by_product, 'product_id', 'view_count'),
+            'top_products_added': add_to_cart_by_product.head(10)['product_id'].tolist() if not add_to_cart_by_product.empty else []
+        }
+
+    def add_to_cart_by_product_df(self) -> pd.DataFrame:
+        return self._ecommerce()['add_to_cart_by_product']
+
+    def view_details_by_product_df(self) -> pd.DataFrame:
+        return self._ecommerce()['view_details_by_product']
+
+    def events_over_time_df(self) -> pd.DataFrame:
+        if not self.events_by_hour:
+            return pd.DataFrame(columns=['datetime', 'count'])
+        hours = sorted(self.events_by_hour)
+        return pd.DataFrame({'datetime': hours, 'count': [self.events_by_hour[h] for h in hours]})
+
+    def funnel(self) -> Dict[str, int]:
+        return {stage: _count_users(users) for stage, users in self.funnel_users.items()}
+
+    def metrics(self) -> Dict[str, Any]:
+        """Same layout and values as metrics.calculate_all_metrics on the events behind this state."""
+        from .metrics import calculate_all_metrics
+
+        if self.total_events == 0:
+            return calculate_all_metrics(pd.DataFrame())
+
+        return {
+            'general': {
+                'total_events': self.total_events,
+                'total_page_visits': self.events_by_type.get('page_visit', 0),
+                'total_clicks': self.events_by_type.get('click', 0),
+                'unique_users': _count_users(self.users),
+                'events_by_type': dict(self.events_by_type.most_common()),
+                'events_by_page': dict(self.events_by_page.most_common())
+            },
+            'time': self._time_metrics(),
+            'ecommerce': self._ecommerce(),
+            'funnel': self.funnel()
+        }
+
+    def _time_metrics(self) -> Dict[str, pd.DataFrame]:
+        hours = sorted(self.events_by_hour)
+        if not hours:
+            return {
+                'events_per_hour': pd.DataFrame(),
+                'events_per_day': pd.DataFrame()
+            }
+
+        events_per_hour = pd.DataFrame({
+            'datetime': pd.to_datetime(hours).astype(f'datetime64[{self.datetime_unit or "ns"}]'),
+            'event_count': [self.events_by_hour[h] for h in hours]
+        })
+        by_day = Counter()
+        for hour in hours:
+            by_day[hour.date()] += self.events_by_hour[hour]
+        days = sorted(by_day)
+        events_per_day = pd.DataFrame({
+            'date': pd.Series(days, dtype=object),
+            'event_count': [by_day[d] for d in days]
+        })
+        return {
+            'events_per_hour': events_per_hour,
+            'events_per_day': events_per_day
+        }
+
+    def summary(self, sessions: Optional['SessionAggregates'] = None) -> Dict[str, Any]:
+        """Same fields as the summary.json written by generate_analytics.
+
+        The ordered funnels and session KPIs need the events' order, which
+        these counts do not keep; they come from sessions and are left out
+        without it.
+        """
+        summary = {
+            'total_events': self.total_events,
+            'total_page_visits': self.events_by_type.get('page_visit', 0),
+            'total_clicks': self.events_by_type.get('click', 0),
+            'unique_users': _count_users(self.users),
+            'add_to_cart_count': self.add_to_cart_count,
+            'events_by_type': dict(self.events_by_type.most_common()),
+            'events_by_page': dict(self.events_by_page.most_common()),
+            'funnel': self.funnel()
+        }
+        if sessions is not None:
+            summary['ordered_funnel'] = sessions.ordered_funnel()
+            summary['session_funnel'] = sessions.ordered_session_funnel()
+            summary['sessions'] = sessions.kpis()
+        summary['generated_at'] = str(self.last_event) if self.last_event is not None else None
+        return summary
+
+
+class SessionAggregates:
+    """Session KPIs and the ordered funnels of generate_analytics, kept current batch by batch.
+
+    A session is closed once the latest event seen is more than gap past its
+    end. Closed sessions are folded into running totals and their events
+    dropped, so what is kept is the events of the open sessions and the users
+    that reached each funnel step. A user's ordered funnel is the union of the
+    funnels of their sessions, because a step more than the session gap after
+    the previous one never counts. The results match a recomputation over all
+    events as long as events arrive in time order, as the log writers append
+    them; a late event of a closed session starts a session of its own.
+    """
+
+    def __init__(self, gap: pd.Timedelta = DEFAULT_SESSION_GAP):
+        if pd.Timedelta(gap) < DEFAULT_FUNNEL_MAX_GAP:
+            raise ValueError("The session gap must be at least the funnel's max gap")
+        self.gap = pd.Timedelta(gap)
+        self.latest: Optional[pd.Timestamp] = None
+        self.open_events = pd.DataFrame()
+        self.open_sessions = pd.DataFrame(columns=SESSION_COLUMNS)
+        self.closed = {'sessions': 0, 'duration': 0.0, 'events': 0, 'bounces': 0, 'add_to_cart': 0, 'reached_cart': 0}
+        self.session_funnel = {name: 0 for name, _, _ in ORDERED_FUNNEL_STEPS}
+        self.funnel_users: Dict[str, set] = {name: set() for name, _, _ in ORDERED_FUNNEL_STEPS}
+
+    def update(self, df: pd.DataFrame) -> None:
+        if df.empty or 'datetime' not in df.columns:
+            return
+        latest = df['datetime'].max()
+        if pd.notna(latest) and (self.latest is None or latest > self.latest):
+            self.latest = latest
+
+        events = df[['event_type', 'page', 'element', 'user_id', 'datetime']]
+        if not self.open_events.empty:
+            events = pd.concat([self.open_events.drop(columns='session_id'), events], ignore_index=True)
+        events = events.assign(session_id=assign_sessions(events, self.gap))
+        sessions = build_sessions(events, self.gap)
+        if sessions.empty:
+            return
+
+        closed = (sessions['end'] < self.latest - self.gap).to_numpy()
+        session_ids = events['session_id'].to_numpy()
+        dated = session_ids >= 0
+        closed_rows = np.zeros(len(events), dtype=bool)
+        closed_rows[dated] = closed[session_ids[dated]]
+        if closed.any():
+            self._close(sessions[closed], events[closed_rows])
+        self.open_events = events[dated & ~closed_rows].reset_index(drop=True)
+        self.open_sessions = sessions[~closed]
+
+    def _close(self, sessions: pd.DataFrame, events: pd.DataFrame) -> None:
+        self.closed['sessions'] += len(sessions)
+        self.closed['duration'] += float(sessions['duration'].sum())
+        self.closed['events'] += int(sessions['total_events'].sum())
+        self.closed['bounces'] += int((sessions['total_events'] == 1).sum())
+        self.closed['add_to_cart'] += int((sessions['add_to_cart'] > 0).sum())
+        self.closed['reached_cart'] += int(sessions['reached_cart'].sum())
+        for name, count in calculate_ordered_funnel(events, by='session_id').items():
+            self.session_funnel[name] += count
+        for name, users in ordered_funnel_units(events).items():
+            self.funnel_users[name].update(users)
+
+    def kpis(self) -> Dict[str, Any]:
+        """Same fields and values as sessions.session_kpis over every session so far."""
+        total = self.closed['sessions'] + len(self.open_sessions)
+        if total == 0:
+            return session_kpis(self.open_sessions)
+        open_sessions = self.open_sessions
+        return {
+            'total_sessions': total,
+            'avg_session_duration': (self.closed['duration'] + float(open_sessions['duration'].sum())) / total,
+            'avg_events_per_session': (self.closed['events'] + int(open_sessions['total_events'].sum())) / total,
+            'bounce_rate': (self.closed['bounces'] + int((open_sessions['total_events'] == 1).sum())) / total,
+            'add_to_cart_rate': (self.closed['add_to_cart'] + int((open_sessions['add_to_cart'] > 0).sum())) / total,
+            'cart_rate': (self.closed['reached_cart'] + int(open_sessions['reached_cart'].sum())) / total
+        }
+
+    def ordered_funnel(self) -> Dict[str, int]:
+        open_users = ordered_funnel_units(self.open_events)
+        return {name: len(users.union(open_users[name])) for name, users in self.funnel_users.items()}
+
+    def ordered_session_funnel(self) -> Dict[str, int]:
+        open_counts = calculate_ordered_funnel(self.open_events, by='session_id')
+        return {name: count + open_counts[name] for name, count in self.session_funnel.items()}
+
+
+def bucket_key(hour) -> str:
+    """YYYYMMDDHH name of an hour bucket; events without a time share one bucket."""
+    return UNDATED_BUCKET if pd.isna(hour) else hour.strftime('%Y%m%d%H')
+
+
+class HourlyAggregateStore:
+    """One EventAggregates per hour bucket, persisted as store_dir/YYYYMMDDHH.json.
+
+    Outputs for any range are rebuilt by merging the stored hours, so adding
+    the latest hour never requires the raw events of the earlier ones.
+    """
+
+    def __init__(self, store_dir: str, approximate: bool = False, precision: int = DEFAULT_PRECISION):
+        self.store_path = Path(store_dir)
+        self.approximate = approximate
+        self.precision = precision
+        self.states: Dict[str, EventAggregates] = {}
+        self.dirty: set = set()
+        self.removed: set = set()
+
+    def load(self) -> 'HourlyAggregateStore':
+        """Reads the stored hours; states of an older layout are dropped so sync() rebuilds them."""
+        if self.store_path.exists():
+            for entry in os.scandir(self.store_path):
+                if entry.name.endswith('.json'):
+                    with open(entry.path, 'r') as f:
+                        try:
+                            self.states[entry.name[:-5]] = EventAggregates.from_dict(json.load(f))
+                        except ValueError as e:
+                            print(f"  [Warning] Discarding {entry.name}: {e}")
+                            self.removed.add(entry.name[:-5])
+        return self
+
+    def add_events(self, df: pd.DataFrame) -> None:
+        if df.empty:
+            return
+        hours = df['datetime'].dt.floor('h')
+        for hour, group in df.groupby(hours, sort=False, dropna=False, observed=True):
+            key = bucket_key(hour)
+            if key not in self.states:
+                self.states[key] = EventAggregates(self.approximate, self.precision)
+            self.states[key].update(group)
+            self.dirty.add(key)
+            self.removed.discard(key)
+
+    def sync(self, df: pd.DataFrame) -> int:
+        """Brings the stored hours up to date with df, the whole event table; returns how many hours changed.
+
+        Events are only ever added, so an hour whose state holds as many events
+        as df has in that hour is unchanged and is not read again. The other
+        hours are aggregated afresh from their rows, and hours no longer in df
+        are dropped.
+        """
+        hours = df['datetime'].dt.floor('h') if not df.empty else pd.Series(dtype='datetime64[ns]')
+        counts = hours.value_counts(dropna=False)
+        keys = [bucket_key(hour) for hour in counts.index]
+        stale = [hour for hour, key, count in zip(counts.index, keys, counts)
+                 if key not in self.states or self.states[key].total_events != count]
+        removed = set(self.states) - set(keys)
+        for key in removed | {bucket_key(hour) for hour in stale}:
+            self.states.pop(key, None)
+        self.removed |= removed
+        self.dirty -= removed
+        if stale:
+            self.add_events(df[hours.isin(stale)])
+        return len(stale) + len(removed)
+
+    def add_state(self, key: str, state: EventAggregates) -> None:
+        if key in self.states:
+            self.states[key].merge(state)
+        else:
+            self.states[key] = state
+        self.dirty.add(key)
+
+    def save(self) -> None:
+        self.store_path.mkdir(parents=True, exist_ok=True)
+        for key in sorted(self.dirty):
+            path = self.store_path / f"{key}.json"
+            tmp_path = path.with_name(path.name + '.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(self.states[key].to_dict(), f)
+            os.replace(tmp_path, path)
+        for key in self.removed:
+            (self.store_path / f"{key}.json").unlink(missing_ok=True)
+        self.dirty.clear()
+        self.removed.clear()
+
+    def merged(self, start: Optional[str] = None, end: Optional[str] = None) -> EventAggregates:
+        """Merges the hours with start <= YYYYMMDDHH < end; undated events only count when unbounded."""
+        result = EventAggregates(self.approximate, self.precision)
+        for key in sorted(self.states):
+            if key == UNDATED_BUCKET:
+                if start is None and end is None:
+                    result.merge(self.states[key])
+                continue
+            if (start is None or key >= start) and (end is None or key < end):
+                result.merge(self.states[key])
+        return result
@@ -0,0 +1,551 @@
+"""Benchmarks for the analytics pipeline on synthetic event logs."""
+
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+PAGES = ['home', 'product', 'cart']
+ELEMENTS = {
+    'home': ['page_load', 'add_to_cart_button', 'view_details_button', 'nav_cart'],
+    'product': ['page_load', 'add_to_cart_detail_btn', 'nav_home'],
+    'cart': ['page_load', 'remove_from_cart_button', 'nav_home'],
+}
+
+
+def synthetic_events(n_events: int, days: int = 1, n_users: int = 1000,
+                     n_products: int = 30, seed: int = 42) -> list:
+    """Generates events shaped like the ones server.js writes, in time order."""
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1)
+    step_ms = max(1, int(days * 86_400_000 / max(n_events, 1)))
+
+    events = []
+    for i in range(n_events):
+        now = start + timedelta(milliseconds=i * step_ms)
+        page = rng.choice(PAGES)
+        element = rng.choice(ELEMENTS[page])
+        event_type = 'page_visit' if element == 'page_load' else 'click'
+        has_product = element not in ('page_load', 'nav_cart', 'nav_home') or page == 'product'
+        events.append({
+            'timestamp': now.strftime('%Y%m%d%H%M%S'),
+            'event_type': event_type,
+            'page': page,
+            'element': element,
+            'product_id': f"P{rng.randint(1, n_products):03d}" if has_product else None,
+            'user_id': f"user_{rng.randint(1, n_users)}",
+            '_ms': f"{now.microsecond // 1000:03d}",
+        })
+    return events
+
+
+def make_synthetic_logs(logs_dir: str, n_events: int, days: int = 1, seed: int = 42) -> int:
+    """Writes a logs/YYYYMMDD/*.json tree the way server.js does."""
+    for event in synthetic_events(n_events, days=days, seed=seed):
+        ms = event.pop('_ms')
+        day_dir = os.path.join(logs_dir, event['timestamp'][:8])
+        os.makedirs(day_dir, exist_ok=True)
+        with open(os.path.join(day_dir, f"{event['timestamp']}{ms}.json"), 'w') as f:
+            json.dump(event, f, indent=2)
+    return n_events
+
+
+def synthetic_frame(n_events: int, days: int = 1, n_users: int = 100_000,
+                    n_products: int = 30, seed: int = 42) -> pd.DataFrame:
+    """Builds an event table shaped like load_events_from_directory's output without
+    going through files, for benchmarks at sizes where writing them would take hours."""
+    from .log_parser import CATEGORICAL_COLUMNS
+
+    rng = np.random.default_rng(seed)
+    page_elements = [(page, element) for page in PAGES for element in ELEMENTS[page]]
+    choice = rng.integers(0, len(page_elements), n_events)
+    page = np.array([p for p, _ in page_elements], dtype=object)[choice]
+    element = np.array([e for _, e in page_elements], dtype=object)[choice]
+
+    has_product = ~np.isin(element, ['page_load', 'nav_cart', 'nav_home']) | (page == 'product')
+    product_labels = np.array([f"P{i:03d}" for i in range(1, n_products + 1)], dtype=object)
+    product_id = np.where(has_product, product_labels[rng.integers(0, n_products, n_events)], None)
+    user_labels = np.array([f"user_{i}" for i in range(1, n_users + 1)], dtype=object)
+
+    step_ms = max(1, int(days * 86_400_000 / max(n_events, 1)))
+    moments = np.datetime64('2026-01-01', 'ms') + np.arange(n_events) * step_ms
+
+    df = pd.DataFrame({
+        'timestamp': None,
+        'event_type': np.where(element == 'page_load', 'page_visit', 'click'),
+        'page': page,
+        'element': element,
+        'product_id': product_id,
+        'user_id': user_labels[rng.integers(0, n_users, n_events)],
+        'datetime': moments,
+    })
+    for col in CATEGORICAL_COLUMNS:
+        df[col] = df[col].astype('category')
+    df['hour'] = df['datetime'].dt.hour
+    return df
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_parallel_load(n_events: int = 100_000, workers: int = None, chunk_size: int = 2000) -> None:
+    from .log_parser import load_events_from_directory
+
+    workers = workers or os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"[Bench] Writing {n_events} synthetic event files...")
+        make_synthetic_logs(tmp, n_events, days=3)
+
+        serial, serial_time = _timed(load_events_from_directory, tmp)
+        parallel, parallel_time = _timed(load_events_from_directory, tmp,
+                                         workers=workers, chunk_size=chunk_size)
+
+    pd.testing.assert_frame_equal(serial, parallel)
+    print(f"[Bench] serial:   {serial_time:.2f}s")
+    print(f"[Bench] parallel: {parallel_time:.2f}s ({workers} workers, chunk {chunk_size})")
+    print(f"[Bench] speedup:  {serial_time / parallel_time:.2f}x (results identical)")
+
+
+def bench_timestamp_decode(n_events: int = 1_000_000) -> None:
+    from .log_parser import parse_timestamp, decode_timestamps
+
+    start = datetime(2026, 1, 1)
+    moments = [start + timedelta(milliseconds=37 * i) for i in range(n_events)]
+    timestamps = pd.Series([m.strftime('%Y%m%d%H%M%S') for m in moments])
+    filenames = pd.Series([f"{m.strftime('%Y%m%d%H%M%S')}{m.microsecond // 1000:03d}.json" for m in moments])
+
+    def per_row():
+        parsed = [parse_timestamp(ts) for ts in timestamps]
+        return parsed, [p.date() for p in parsed], [p.hour for p in parsed]
+
+    def vectorized():
+        dt = decode_timestamps(timestamps, filenames)
+        return dt, dt.dt.date, dt.dt.hour
+
+    (old, _, _), old_time = _timed(per_row)
+    (new, _, _), new_time = _timed(vectorized)
+
+    assert (new.dt.floor('s').to_numpy() == pd.to_datetime(old).to_numpy()).all()
+    assert (new.to_numpy() == pd.to_datetime(moments).to_numpy().astype('datetime64[ms]')).all()
+    print(f"[Bench] per-row strptime: {old_time:.2f}s ({old_time / n_events * 1e9:.0f} ns/event)")
+    print(f"[Bench] vectorized:       {new_time:.2f}s ({new_time / n_events * 1e9:.0f} ns/event, ms precision)")
+    print(f"[Bench] speedup:          {old_time / new_time:.1f}x")
+
+
+def _peak_memory(func, *args, **kwargs) -> int:
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_compaction(n_events: int = 1_000_000) -> None:
+    from .log_parser import load_events_from_directory
+    from .compact import compact_day
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"[Bench] Writing {n_events} synthetic event files for one day...")
+        make_synthetic_logs(tmp, n_events, days=1)
+        day_dir = os.path.join(tmp, sorted(os.listdir(tmp))[0])
+
+        raw, raw_time = _timed(load_events_from_directory, tmp)
+        _, compact_time = _timed(compact_day, day_dir, remove_raw=True)
+        compacted, read_time = _timed(load_events_from_directory, tmp)
+        _, projected_time = _timed(load_events_from_directory, tmp, columns=['event_type', 'user_id'])
+        size = os.path.getsize(os.path.join(day_dir, 'events.parquet'))
+
+    pd.testing.assert_frame_equal(raw, compacted)
+    print(f"[Bench] glob-and-parse:      {raw_time:.2f}s")
+    print(f"[Bench] compaction (once):   {compact_time:.2f}s -> {size / 1e6:.1f} MB partition")
+    print(f"[Bench] partition read:      {read_time:.3f}s ({raw_time / read_time:.0f}x faster)")
+    print(f"[Bench] 2-column read:       {projected_time:.3f}s ({raw_time / projected_time:.0f}x faster)")
+
+
+def bench_metrics(n_events: int = 10_000_000) -> None:
+    from .metrics import calculate_all_metrics, calculate_all_metrics_by_parts
+
+    print(f"[Bench] Building a {n_events} event table...")
+    df = synthetic_frame(n_events, days=30)
+
+    old, old_time = _timed(calculate_all_metrics_by_parts, df)
+    new, new_time = _timed(calculate_all_metrics, df)
+    old_peak = _peak_memory(calculate_all_metrics_by_parts, df)
+    new_peak = _peak_memory(calculate_all_metrics, df)
+
+    assert old['general'] == new['general'] and old['funnel'] == new['funnel']
+    for group in ('time', 'ecommerce'):
+        for key, value in old[group].items():
+            if isinstance(value, pd.DataFrame):
+                pd.testing.assert_frame_equal(value, new[group][key])
+            else:
+                assert value == new[group][key]
+    print(f"[Bench] per-metric scans: {old_time:.2f}s, peak {old_peak / 1e6:.0f} MB")
+    print(f"[Bench] single pass:      {new_time:.2f}s, peak {new_peak / 1e6:.0f} MB")
+    print(f"[Bench] speedup:          {old_time / new_time:.1f}x (results identical)")
+
+
+def bench_ordered_funnel(n_events: int = 10_000_000) -> None:
+    from .metrics import calculate_conversion_funnel, calculate_ordered_funnel
+
+    print(f"[Bench] Building a {n_events} event table...")
+    df = synthetic_frame(n_events, days=30)
+
+    independent, independent_time = _timed(calculate_conversion_funnel, df)
+    ordered, ordered_time = _timed(calculate_ordered_funnel, df)
+    print(f"[Bench] independent sets: {independent_time:.2f}s {independent}")
+    print(f"[Bench] ordered funnel:   {ordered_time:.2f}s {ordered}")
+
+
+def bench_sessionize(n_events: int = 50_000_000) -> None:
+    from .sessions import assign_sessions, build_sessions
+
+    for size in (n_events // 4, n_events // 2, n_events):
+        # About 100 events per user and day, so users come back within the gap
+        df = synthetic_frame(size, days=7, n_users=max(size // 700, 1))
+        session_ids, assign_time = _timed(assign_sessions, df)
+        df['session_id'] = session_ids
+        sessions, table_time = _timed(build_sessions, df)
+        print(f"[Bench] {size:>11,} events: assign {assign_time:.2f}s ({assign_time / size * 1e9:.0f} ns/event), "
+              f"sessions table {table_time:.2f}s, {len(sessions):,} sessions")
+        del df, sessions
+
+
+def bench_top_products(n_events: int = 10_000_000, n_products: int = 1_000_000, batch_size: int = 1_000_000) -> None:
+    from .metrics import calculate_ecommerce_metrics, calculate_top_products, product_heavy_hitters
+
+    print(f"[Bench] Building a {n_events} event table over {n_products} products...")
+    df = synthetic_frame(n_events, days=30)
+    # Skewed popularity, as in a real catalog
+    weights = 1.0 / np.arange(1, n_products + 1) ** 1.1
+    labels = np.array([f"P{i:07d}" for i in range(n_products)], dtype=object)
+    picks = np.random.default_rng(1).choice(n_products, n_events, p=weights / weights.sum())
+    df['product_id'] = np.where(df['product_id'].notna(), labels[picks], None)
+
+    def streaming():
+        summaries = None
+        for start in range(0, len(df), batch_size):
+            batch = product_heavy_hitters(df.iloc[start:start + batch_size])
+            summaries = batch if summaries is None else {
+                key: summaries[key].merge(batch[key]) for key in summaries}
+        return calculate_top_products(summaries)
+
+    full, full_time = _timed(calculate_ecommerce_metrics, df)
+    top, top_time = _timed(streaming)
+    full_peak = _peak_memory(calculate_ecommerce_metrics, df)
+    top_peak = _peak_memory(streaming)
+
+    assert set(full['top_products_added']) == set(top['top_added']['product_id'])
+    print(f"[Bench] full group tables: {full_time:.2f}s, peak {full_peak / 1e6:.0f} MB")
+    print(f"[Bench] heavy hitters:     {top_time:.2f}s, peak {top_peak / 1e6:.0f} MB "
+          f"(batches of {batch_size}, max undercount {int(top['top_added']['max_count'].iloc[0] - top['top_added']['add_to_cart_count'].iloc[0])})")
+    print("[Bench] top 10 added products identical")
+
+
+def bench_cube(n_events: int = 5_000_000, days: int = 365) -> None:
+    from . import metrics
+    from . import cube as rollup
+
+    print(f"[Bench] Building a {n_events} event table over {days} days...")
+    df = synthetic_frame(n_events, days=days)
+
+    queries = [
+        ('get_events_by_type_df', ()),
+        ('get_events_by_page_df', ()),
+        ('get_events_over_time_df', ('hour',)),
+        ('get_events_over_time_df', ('day',)),
+        ('calculate_ecommerce_metrics', ()),
+    ]
+    cube, build_time = _timed(rollup.build_cube, df)
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_path, cube_path = os.path.join(tmp, 'events.parquet'), os.path.join(tmp, rollup.CUBE_FILE)
+        df.drop(columns=['timestamp']).to_parquet(raw_path, index=False, compression='zstd')
+        rollup.save_cube(cube, cube_path)
+        cube, load_time = _timed(rollup.load_cube, cube_path)
+        raw_size, cube_size = os.path.getsize(raw_path), os.path.getsize(cube_path)
+
+    print(f"[Bench] cube: {len(cube)} rows, {cube_size / 1e6:.1f} MB vs {raw_size / 1e6:.1f} MB raw Parquet "
+          f"(built in {build_time:.2f}s, loaded in {load_time * 1000:.0f} ms)")
+    for name, args in queries:
+        expected, raw_time = _timed(getattr(metrics, name), df, *args)
+        actual, cube_time = _timed(getattr(rollup, name), cube, *args)
+        if isinstance(expected, pd.DataFrame):
+            pd.testing.assert_frame_equal(expected, actual)
+        print(f"[Bench] {name}{args}: raw {raw_time * 1000:.0f} ms, cube {cube_time * 1000:.1f} ms")
+
+
+def bench_pyramid(n_events: int = 5_000_000, days: int = 365) -> None:
+    from . import metrics
+    from .timeseries import TimeSeriesPyramid
+
+    print(f"[Bench] Building a {n_events} event table over {days} days...")
+    df = synthetic_frame(n_events, days=days)
+
+    _, copy_time = _timed(lambda: df.copy()['datetime'].dt.floor('h'))
+    for granularity in ('hour', 'day'):
+        _, time_taken = _timed(metrics.get_events_over_time_df, df, granularity)
+        print(f"[Bench] get_events_over_time_df({granularity!r}): {time_taken * 1000:.0f} ms "
+              f"(frame copy alone used to cost {copy_time * 1000:.0f} ms)")
+
+    pyramid, build_time = _timed(TimeSeriesPyramid.from_events, df)
+    sizes = ', '.join(f"{level} {len(counts)}" for level, counts in pyramid.levels.items())
+    print(f"[Bench] pyramid built in {build_time:.2f}s ({sizes} buckets)")
+
+    newest = df[df['datetime'] >= df['datetime'].max().floor('h')]
+    _, append_time = _timed(pyramid.append, newest)
+    print(f"[Bench] appending the newest hour ({len(newest)} events): {append_time * 1000:.1f} ms")
+
+    end = df['datetime'].max()
+    for span in (pd.Timedelta(hours=6), pd.Timedelta(days=7), pd.Timedelta(days=90), pd.Timedelta(days=days)):
+        result, query_time = _timed(pyramid.query, end - span, end, 500)
+        print(f"[Bench] query last {span}: {result.attrs['granularity']} level, {len(result)} points "
+              f"in {query_time * 1000:.1f} ms")
+
+
+def bench_sql(n_events: int = 4_000_000, days: int = 90) -> None:
+    from . import metrics
+    from . import sql_backend
+
+    for size in (n_events // 4, n_events // 2, n_events):
+        df = synthetic_frame(size, days=days)
+        last_day = df['datetime'].max().floor('D')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            con = sql_backend.connect(os.path.join(tmp, sql_backend.EVENTS_DB))
+            start = time.perf_counter()
+            for batch in range(0, size, sql_backend.INGEST_BATCH_SIZE):
+                sql_backend.ingest_events(con, df.iloc[batch:batch + sql_backend.INGEST_BATCH_SIZE])
+            sql_backend.create_indexes(con)
+            ingest_time = time.perf_counter() - start
+
+            _, pandas_time = _timed(metrics.calculate_all_metrics, df)
+            _, sql_time = _timed(sql_backend.calculate_all_metrics, con)
+            _, pandas_day = _timed(lambda: metrics.calculate_all_metrics(
+                df[df['datetime'] >= last_day].reset_index(drop=True)))
+            _, sql_day = _timed(sql_backend.calculate_all_metrics, con, last_day)
+            con.close()
+
+        print(f"[Bench] {size} events (ingest {ingest_time:.1f}s): all metrics pandas {pandas_time:.2f}s, "
+              f"SQL {sql_time:.2f}s; last day only pandas {pandas_day * 1000:.0f} ms, SQL {sql_day * 1000:.0f} ms")
+        del df
+
+
+def bench_sharding(n_events: int = 4_000_000, max_workers: int = None) -> None:
+    from . import sharding
+
+    max_workers = max_workers or os.cpu_count()
+    print(f"[Bench] Building a {n_events} event table over 7 days ({os.cpu_count()} CPUs)...")
+    df = synthetic_frame(n_events, days=7, n_users=max(1, n_events // 700))
+
+    expected, single_time = _timed(sharding.run_sharded, df.copy(), sharding.PARTS, 1, 1)
+    print(f"[Bench] single process: {single_time:.2f}s")
+    workers = 2
+    while workers <= max(max_workers, 2):
+        # A few shards per worker so one slow shard does not hold up the rest
+        n_shards = workers * 4
+        result, time_taken = _timed(sharding.run_sharded, df.copy(), sharding.PARTS, workers, n_shards)
+        assert result['ordered_funnel'] == expected['ordered_funnel']
+        pd.testing.assert_frame_equal(result['sessions'], expected['sessions'])
+        print(f"[Bench] {workers} workers, {n_shards} shards: {time_taken:.2f}s "
+              f"({single_time / time_taken:.1f}x)")
+        workers *= 2
+
+
+def bench_publish(n_events: int = 2_000_000, days: int = 90) -> None:
+
+    from . import cube as rollup
+    from . import metrics
+    from . import publish
+    from .generate_analytics import report_tables
+    from .timeseries import PYRAMID_FILE, TimeSeriesPyramid
+
+    print(f"[Bench] Building the report of a {n_events} event table over {days} days...")
+    df = synthetic_frame(n_events, days=days, n_users=max(1, n_events // 20))
+    all_metrics = metrics.calculate_all_metrics(df)
+    events_cube = rollup.build_cube(df)
+    pyramid = TimeSeriesPyramid.from_events(df)
+    artifacts = publish.table_artifacts(report_tables(all_metrics))
+    artifacts.update({
+        'summary.json': {'total_events': n_events},
+        rollup.CUBE_FILE: lambda path: rollup.save_cube(events_cube, path),
+        PYRAMID_FILE: pyramid.save,
+    })
+
+    with tempfile.TemporaryDirectory() as tmp:
+        def one_by_one():
+            for name, artifact in artifacts.items():
+                publish._write_artifact(Path(tmp) / name, artifact)
+
+        _, sequential_time = _timed(one_by_one)
+        version, publish_time = _timed(publish.publish, tmp, artifacts)
+        assert publish.verify(version)
+    print(f"[Bench] {len(artifacts)} files one by one: {sequential_time:.2f}s")
+    print(f"[Bench] published as one version:  {publish_time:.2f}s "
+          f"({sequential_time / publish_time:.1f}x)")
+
+
+def bench_table_load(max_rows: int = 4_000_000) -> None:
+
+    from . import publish
+
+    rng = np.random.default_rng(42)
+    sizes = [rows for rows in (10_000, 100_000, 1_000_000, 4_000_000) if rows < max_rows] + [max_rows]
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            # Shaped like events_over_time and add_to_cart_by_product, the largest report tables
+            table = pd.DataFrame({
+                'datetime': pd.date_range('2026-01-01', periods=rows, freq='min').astype('datetime64[ms]'),
+                'product_id': rng.integers(0, 100_000, rows).astype(str),
+                'count': rng.integers(0, 1000, rows),
+            })
+            csv_path, feather_path = Path(tmp) / 'table.csv', Path(tmp) / 'table.feather'
+            table.to_csv(csv_path, index=False)
+            publish.write_feather(table, feather_path)
+
+            _, csv_time = _timed(lambda: pd.read_csv(csv_path, parse_dates=['datetime']))
+            loaded, feather_time = _timed(publish.read_feather, feather_path)
+            pd.testing.assert_frame_equal(loaded.astype({'product_id': object}), table)
+            print(f"[Bench] {rows:>9} rows: CSV {csv_time * 1000:8.1f}ms, Feather {feather_time * 1000:6.1f}ms "
+                  f"({csv_time / feather_time:.0f}x)")
+
+
+def bench_refresh(n_events: int = 20_000) -> None:
+    import importlib.util
+    import subprocess
+    from contextlib import redirect_stdout
+
+    from . import refresh
+
+    # Without sklearn the ML step cannot run on either path, so both leave it out
+    ml = importlib.util.find_spec('sklearn') is not None
+    package_dir = Path(__file__).parent
+    with tempfile.TemporaryDirectory() as tmp:
+        logs_dir = Path(tmp) / 'logs'
+        print(f"[Bench] Writing {n_events} JSON event files...")
+        make_synthetic_logs(str(logs_dir), n_events)
+
+        def subprocesses():
+            output_dir, cache_dir = Path(tmp) / 'sub_output', f"--cache-dir={Path(tmp) / 'sub_cache'}"
+            commands = [['generate_analytics', str(logs_dir), str(output_dir), cache_dir],
+                        ['ga_fetcher', str(Path(tmp) / 'sub_ga')]]
+            if ml:
+                commands.append(['ml_analysis', str(logs_dir), str(output_dir), cache_dir])
+            for module, *args in commands:
+                subprocess.run([sys.executable, '-m', f"{__package__}.{module}"] + args, cwd=package_dir.parent,
+                               check=True, stdout=subprocess.DEVNULL)
+
+        _, subprocess_time = _timed(subprocesses)
+        print(f"[Bench] three subprocesses{'' if ml else ' (no ML)'}: {subprocess_time:.2f}s")
+
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            started = time.perf_counter()
+            worker = refresh.RefreshWorker(logs_dir, Path(tmp) / 'output', Path(tmp) / 'cache', Path(tmp) / 'ga',
+                                           ml=ml)
+            worker.ready.wait()
+            warm_time = time.perf_counter() - started
+            job = worker.submit()
+            job.done.wait()
+        assert not job.errors, job.errors
+        print(f"[Bench] worker warm-up, once per dashboard process: {warm_time:.2f}s")
+        print(f"[Bench] warm worker{'' if ml else ' (no ML)'}: {job.seconds:.2f}s "
+              f"({subprocess_time / job.seconds:.1f}x)")
+
+
+def bench_downsample(n_events: int = 5_000_000, budget: int = 1200) -> None:
+    from .downsample import downsample_pyramid
+    from .timeseries import TimeSeriesPyramid
+
+    for days in (1, 30, 365):
+        df = synthetic_frame(n_events, days=days, n_users=max(1, n_events // 20))
+        pyramid = TimeSeriesPyramid.from_events(df)
+        minutes = pyramid.query(granularity='minute')
+        window, time_taken = _timed(downsample_pyramid, pyramid, n_out=budget)
+        print(f"[Bench] {days:>3} days: {len(minutes):>6} minutes -> {len(window)} points "
+              f"from the {window.attrs['granularity']} level in {time_taken * 1000:.1f}ms")
+
+
+# Modules a command's --help must never load
+HEAVY_MODULES = ('pandas', 'numpy', 'pyarrow', 'sklearn', 'streamlit', 'plotly', 'google')
+STARTUP_COMMANDS = {
+    'generate': 'generate_analytics', 'fetch-ga': 'ga_fetcher', 'train': 'ml_analysis', 'compact': 'compact',
+    'watch': 'watch', 'bench': 'bench', 'dashboard': 'dashboard',
+}
+
+
+def _import_profile(args: List[str]) -> Tuple[Optional[float], Set[str]]:
+    """Total import time in ms and the top-level packages imported by python -X importtime <args>."""
+    import subprocess
+
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=Path(__file__).parent.parent,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        return None, set()
+    total_us, packages = 0, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        packages.add(name.strip().split('.')[0])
+        # Nested imports are indented and already counted in their parent's cumulative time
+        if not name[1:].startswith(' '):
+            total_us += int(cumulative)
+    return total_us / 1000, packages
+
+
+def bench_startup() -> None:
+    failures = []
+    print(f"[Bench] {'command':<10} {'--help':>9} {'its modules':>12}")
+    for command, module in STARTUP_COMMANDS.items():
+        help_ms, packages = _import_profile(['-m', __package__, command, '--help'])
+        module_ms, _ = _import_profile(['-c', f"import {__package__}.{module}"])
+        heavy = sorted(packages & set(HEAVY_MODULES))
+        if help_ms is None or heavy:
+            failures.append(f"{command} --help: {'failed' if help_ms is None else 'imports ' + ', '.join(heavy)}")
+        module_column = f"{module_ms:9.1f}ms" if module_ms is not None else "   missing deps"
+        print(f"[Bench] {command:<10} {help_ms or 0:7.1f}ms {module_column}")
+    assert not failures, failures
+
+
+BENCHMARKS = {
+    'parallel-load': bench_parallel_load,
+    'timestamps': bench_timestamp_decode,
+    'compaction': bench_compaction,
+    'metrics': bench_metrics,
+    'funnel': bench_ordered_funnel,
+    'sessions': bench_sessionize,
+    'top-products': bench_top_products,
+    'cube': bench_cube,
+    'pyramid': bench_pyramid,
+    'sql': bench_sql,
+    'sharding': bench_sharding,
+    'publish': bench_publish,
+    'table-load': bench_table_load,
+    'refresh': bench_refresh,
+    'downsample': bench_downsample,
+    'startup': bench_startup,
+}
+
+
+if __name__ == '__main__':
+
+    name = sys.argv[1] if len(sys.argv) > 1 else None
+    if name not in BENCHMARKS:
+        print(f"Usage: python -m analytics bench <{'|'.join(BENCHMARKS)}> [size]")
+        sys.exit(1)
+
+    args = [int(a) for a in sys.argv[2:]]
+    BENCHMARKS[name](*args)
@@ -0,0 +1,131 @@
+"""Command line - one entry point for the analytics package: python -m analytics <command>.
+
+Only argparse is imported up front. Each command imports the modules it
+runs when it is chosen, so `--help` and light commands do not load pandas,
+sklearn or the Google client (`python -m analytics bench startup` measures this).
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+
+PACKAGE_DIR = Path(__file__).parent
+DEFAULT_LOGS_DIR = PACKAGE_DIR.parent / 'logs'
+DEFAULT_OUTPUT_DIR = PACKAGE_DIR / 'output'
+DEFAULT_CACHE_DIR = PACKAGE_DIR / 'cache'
+DEFAULT_GA_OUTPUT_DIR = PACKAGE_DIR / 'ga_output'
+
+
+def _generate(args: argparse.Namespace) -> None:
+    from .generate_analytics import generate_analytics
+    generate_analytics(str(args.logs_dir), str(args.output_dir), str(args.cache_dir),
+                       full_rebuild=args.full_rebuild, approximate=args.approximate,
+                       workers=args.workers, csv=not args.no_csv)
+
+
+def _fetch_ga(args: argparse.Namespace) -> None:
+    from .ga_fetcher import fetch_ga
+    fetch_ga(args.output_dir, csv=not args.no_csv)
+
+
+def _train(args: argparse.Namespace) -> None:
+    from .ml_analysis import train
+    train(str(args.logs_dir), str(args.output_dir), str(args.cache_dir),
+          full_rebuild=args.full_rebuild, workers=args.workers)
+
+
+def _compact(args: argparse.Namespace) -> None:
+    from .compact import compact_logs
+    print(f"[Compact] Compacting closed day folders in: {args.logs_dir}")
+    results = compact_logs(str(args.logs_dir), remove_raw=args.remove_raw)
+    print(f"[OK] {sum(results.values())} events compacted into {len(results)} partitions")
+
+
+def _watch(args: argparse.Namespace) -> None:
+    from .watch import watch
+    watch(str(args.logs_dir), str(args.output_dir), args.interval, args.max_latency,
+          use_notifications=not args.poll, rescan_interval=args.rescan_interval, approximate=args.approximate)
+
+
+def _bench(args: argparse.Namespace) -> int:
+    from .bench import BENCHMARKS
+    if args.name not in BENCHMARKS:
+        print(f"Unknown benchmark {args.name}; choose one of: {', '.join(BENCHMARKS)}")
+        return 2
+    BENCHMARKS[args.name](*args.sizes)
+    return 0
+
+
+def _dashboard(args: argparse.Namespace) -> int:
+    # Streamlit runs the script in this process, so it imports analytics from the same sys.path
+    from streamlit.web import cli as streamlit_cli
+    sys.argv = ['streamlit', 'run', str(PACKAGE_DIR / 'dashboard.py')] + args.streamlit_args
+    return streamlit_cli.main()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m analytics', description="ShopVerse analytics pipeline.")
+    commands = parser.add_subparsers(dest='command', metavar='<command>')
+
+    def logs_and_output(command: argparse.ArgumentParser) -> None:
+        command.add_argument('logs_dir', nargs='?', type=Path, default=DEFAULT_LOGS_DIR)
+        command.add_argument('output_dir', nargs='?', type=Path, default=DEFAULT_OUTPUT_DIR)
+
+    def loading_options(command: argparse.ArgumentParser) -> None:
+        command.add_argument('--cache-dir', type=Path, default=DEFAULT_CACHE_DIR, help="incremental load checkpoint")
+        command.add_argument('--full-rebuild', action='store_true', help="discard the cache and re-parse every log")
+        command.add_argument('--workers', type=int, default=1, help="process pool size for user shards")
+
+    command = commands.add_parser('generate', help="build and publish the report")
+    logs_and_output(command)
+    loading_options(command)
+    command.add_argument('--approximate', action='store_true', help="HyperLogLog unique counts, top-product summaries")
+    command.add_argument('--no-csv', action='store_true', help="publish tables as Feather only")
+    command.set_defaults(func=_generate)
+
+    command = commands.add_parser('fetch-ga', help="fetch Google Analytics tables (mock data without credentials)")
+    command.add_argument('output_dir', nargs='?', type=Path, default=DEFAULT_GA_OUTPUT_DIR)
+    command.add_argument('--no-csv', action='store_true', help="write tables as Feather only")
+    command.set_defaults(func=_fetch_ga)
+
+    command = commands.add_parser('train', help="train the conversion model")
+    logs_and_output(command)
+    loading_options(command)
+    command.set_defaults(func=_train)
+
+    command = commands.add_parser('compact', help="compact closed day folders into Parquet")
+    command.add_argument('logs_dir', nargs='?', type=Path, default=DEFAULT_LOGS_DIR)
+    command.add_argument('--remove-raw', action='store_true', help="delete the JSON files once compacted")
+    command.set_defaults(func=_compact)
+
+    command = commands.add_parser('watch', help="keep the outputs current as events arrive")
+    logs_and_output(command)
+    command.add_argument('--interval', type=float, default=1.0, help="poll interval in seconds")
+    command.add_argument('--max-latency', type=float, default=2.0, help="publish bound in seconds")
+    command.add_argument('--poll', action='store_true', help="poll even if watchdog is installed")
+    command.add_argument('--rescan-interval', type=float, default=60.0,
+                         help="full scan interval in seconds when using notifications")
+    command.add_argument('--approximate', action='store_true', help="HyperLogLog unique counts, top-product summaries")
+    command.set_defaults(func=_watch)
+
+    command = commands.add_parser('bench', help="run a benchmark from bench.py")
+    command.add_argument('name', help="benchmark name, e.g. metrics, sessions, refresh or startup")
+    command.add_argument('sizes', nargs='*', type=int, help="sizes passed to the benchmark")
+    command.set_defaults(func=_bench)
+
+    command = commands.add_parser('dashboard', help="start the Streamlit dashboard")
+    command.add_argument('streamlit_args', nargs=argparse.REMAINDER, help="passed on to streamlit run")
+    command.set_defaults(func=_dashboard)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+    return args.func(args) or 0
@@ -0,0 +1,136 @@
+"""Compacts closed day folders of per-event JSON files into Parquet partitions."""
+
+import os
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from .log_parser import (
+    DAY_FOLDER_RE,
+    PARTITION_FILE,
+    SEGMENT_SUFFIX,
+    add_time_columns,
+    finalize_events,
+    load_event_files,
+    load_segment_range,
+    read_partition,
+)
+
+
+# Not stored; read_partition derives them from datetime
+DERIVED_COLUMNS = ['date', 'hour']
+DICTIONARY_COLUMNS = ['event_type', 'page', 'element', 'product_id', 'user_id']
+# The fields every loader produces; any other event field is checked before it is written
+LOADER_COLUMNS = DICTIONARY_COLUMNS + ['timestamp', 'datetime', 'source_file'] + DERIVED_COLUMNS
+
+
+def compact_day(day_dir: str, remove_raw: bool = False) -> int:
+    """Rolls the JSON files and NDJSON segments of one day folder into its events.parquet partition.
+
+    Files already present in an existing partition are not parsed again, so
+    the folder can be compacted repeatedly as late files arrive. The partition
+    is replaced atomically; raw files are only removed once it is written.
+    """
+    day_path = Path(day_dir)
+    partition_path = day_path / PARTITION_FILE
+    raw_files = sorted(str(p) for p in day_path.glob('*.json'))
+    segments = sorted(str(p) for p in day_path.glob('*' + SEGMENT_SUFFIX))
+
+    frames = []
+    existing = pd.DataFrame({'source_file': pd.Series(dtype=object)})
+    if partition_path.exists():
+        existing = read_partition(str(partition_path))
+        frames.append(existing)
+    compacted = set(existing['source_file'])
+
+    pending = [p for p in raw_files if os.path.basename(p) not in compacted]
+    pending_segments = [p for p in segments if os.path.basename(p) not in compacted]
+    if not pending and not pending_segments:
+        if remove_raw:
+            _remove_files(raw_files + _complete_segments(segments, existing['source_file']))
+        return 0
+
+    df_new, failed = load_event_files(pending)
+    if failed:
+        print(f"[Warn] {len(failed)} files in {day_path.name} could not be parsed and were left in place")
+    new_frames = [df_new]
+    for segment in pending_segments:
+        # The day is closed, so a last line without a newline is complete
+        columns, _, failed_lines, _ = load_segment_range(segment, closed=True)
+        if failed_lines:
+            print(f"[Warn] {len(failed_lines)} lines of {os.path.basename(segment)} could not be parsed; "
+                  f"the segment is left in place")
+        new_frames.append(add_time_columns(pd.DataFrame(columns)))
+    df_new = pd.concat(new_frames, ignore_index=True)
+    frames.append(df_new)
+
+    df = finalize_events(pd.concat(frames, ignore_index=True))
+    # Extra event fields are kept too, except ones Parquet cannot store (e.g. mixed types)
+    unstorable = [c for c in df.columns if c not in LOADER_COLUMNS and not _storable(df[c])]
+    if unstorable:
+        print(f"[Warn] {day_path.name}: fields {', '.join(map(str, unstorable))} cannot be stored in Parquet "
+              f"and are left out of the partition")
+    df = df[[c for c in df.columns if c not in DERIVED_COLUMNS and c not in unstorable]].copy()
+    for col in DICTIONARY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+
+    tmp_path = day_path / (PARTITION_FILE + '.tmp')
+    df.to_parquet(tmp_path, index=False, compression='zstd')
+    os.replace(tmp_path, partition_path)
+
+    if remove_raw:
+        failed = set(failed)
+        _remove_files([p for p in raw_files if p not in failed] + _complete_segments(segments, df['source_file']))
+
+    return len(df_new)
+
+
+def _storable(values: pd.Series) -> bool:
+    import pyarrow as pa
+    try:
+        pa.Array.from_pandas(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return False
+    return True
+
+
+def _complete_segments(segments: List[str], source_files: pd.Series) -> List[str]:
+    """The segments whose every line is in the partition, i.e. the ones that can be removed."""
+    in_partition = source_files.value_counts()
+    complete = []
+    for path in segments:
+        with open(path, 'rb') as f:
+            lines = sum(1 for line in f if line.strip())
+        if lines == in_partition.get(os.path.basename(path), 0):
+            complete.append(path)
+    return complete
+
+
+def _remove_files(paths) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def compact_logs(logs_dir: str, today: Optional[date] = None, remove_raw: bool = False) -> Dict[str, int]:
+    """Compacts every closed (before today) YYYYMMDD folder under logs_dir."""
+    today = today or date.today()
+    cutoff = today.strftime("%Y%m%d")
+
+    if not os.path.exists(logs_dir):
+        print(f"Warning: Logs directory not found: {logs_dir}")
+        return {}
+
+    results = {}
+    for entry in sorted(os.scandir(logs_dir), key=lambda e: e.name):
+        if not entry.is_dir() or not DAY_FOLDER_RE.fullmatch(entry.name) or entry.name >= cutoff:
+            continue
+        results[entry.name] = compact_day(entry.path, remove_raw=remove_raw)
+        print(f"  -> {entry.name}: {results[entry.name]} events compacted")
+
+    return results
@@ -0,0 +1,213 @@
+"""Rollup cube - event counts pre-aggregated by hour, event type, page, element and product."""
+
+import os
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+from .metrics import ADD_TO_CART_ELEMENTS, VIEW_DETAILS_ELEMENT
+from .timeseries import LEVELS, floor_times, resolve_granularity
+
+
+CUBE_DIMENSIONS = ['hour', 'event_type', 'page', 'element', 'product_id']
+CUBE_FILE = 'events_cube.parquet'
+# The cube is bucketed by hour, so it cannot count by minute
+CUBE_LEVELS = [level for level in LEVELS if level != 'minute']
+
+
+def build_cube(df: pd.DataFrame) -> pd.DataFrame:
+    """One row per (hour, event_type, page, element, product_id) seen, with its event count.
+
+    Rows without a time or product are kept (as NaT / None keys) so totals
+    match the raw events.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=CUBE_DIMENSIONS + ['count'])
+
+    keys = {
+        'hour': df['datetime'].dt.floor('h'),
+        'event_type': df['event_type'],
+        'page': df['page'],
+        'element': df['element'],
+        'product_id': df['product_id'] if 'product_id' in df.columns else pd.Series(None, index=df.index, dtype=object),
+    }
+    cube = (pd.DataFrame(keys)
+            .groupby(CUBE_DIMENSIONS, observed=True, dropna=False, sort=True)
+            .size()
+            .reset_index(name='count'))
+    return _with_dtypes(cube)
+
+
+def merge_cubes(*cubes: pd.DataFrame) -> pd.DataFrame:
+    """Combines cubes of disjoint events (e.g. the stored history and the newest hour)."""
+    cubes = [cube for cube in cubes if not cube.empty]
+    if not cubes:
+        return pd.DataFrame(columns=CUBE_DIMENSIONS + ['count'])
+    combined = pd.concat([_for_concat(cube) for cube in cubes], ignore_index=True)
+    merged = (combined
+              .groupby(CUBE_DIMENSIONS, observed=True, dropna=False, sort=True)['count']
+              .sum()
+              .reset_index())
+    return _with_dtypes(merged)
+
+
+def refresh_cube(cube: pd.DataFrame, df: pd.DataFrame) -> pd.DataFrame:
+    """Brings a stored cube up to date with df, the whole event table; equals build_cube(df).
+
+    Events are only ever added, so an hour whose cube rows count as many
+    events as df has in that hour is kept as stored. The other hours are
+    rebuilt from their rows, and hours no longer in df are dropped.
+    """
+    if df.empty or cube.empty:
+        return build_cube(df)
+    hours = df['datetime'].dt.floor('h')
+    counts = hours.value_counts(dropna=False)
+    stored = cube.groupby('hour', dropna=False)['count'].sum()
+    stale = counts.index[stored.reindex(counts.index) != counts]
+    unchanged = cube[cube['hour'].isin(counts.index.difference(stale))]
+    return merge_cubes(unchanged, build_cube(df[hours.isin(stale)]))
+
+
+def _for_concat(cube: pd.DataFrame) -> pd.DataFrame:
+    # Categoricals with different categories would concat as object anyway
+    return cube.astype({col: object for col in ('event_type', 'page', 'element')})
+
+
+def _with_dtypes(cube: pd.DataFrame) -> pd.DataFrame:
+    cube['count'] = cube['count'].astype('int64')
+    for col in ('event_type', 'page', 'element'):
+        if not isinstance(cube[col].dtype, pd.CategoricalDtype):
+            cube[col] = cube[col].astype('category')
+    cube['product_id'] = cube['product_id'].astype(object).where(cube['product_id'].notna(), None)
+    return cube
+
+
+def save_cube(cube: pd.DataFrame, path: str) -> int:
+    """Writes the cube as zstd Parquet with dictionary-encoded dimensions, replacing it atomically.
+
+    Returns the number of rows written.
+    """
+    on_disk = cube.astype({'product_id': 'category'})
+    tmp_path = path + '.tmp'
+    on_disk.to_parquet(tmp_path, index=False, compression='zstd')
+    os.replace(tmp_path, path)
+    return len(cube)
+
+
+def load_cube(path: str) -> pd.DataFrame:
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=CUBE_DIMENSIONS + ['count'])
+    return _with_dtypes(pd.read_parquet(path))
+
+
+def slice_cube(cube: pd.DataFrame, start: Optional[pd.Timestamp] = None, end: Optional[pd.Timestamp] = None,
+               **filters: Any) -> pd.DataFrame:
+    """Rows with start <= hour < end and each dimension in filters equal to (or in) the given value(s)."""
+    mask = pd.Series(True, index=cube.index)
+    if start is not None:
+        mask &= cube['hour'] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= cube['hour'] < pd.Timestamp(end)
+    for column, value in filters.items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        mask &= cube[column].isin(values)
+    return cube[mask]
+
+
+# The queries below return exactly what the metrics.py function of the same
+# name returns for the raw events behind the cube.
+
+def get_events_by_type_df(cube: pd.DataFrame) -> pd.DataFrame:
+    if cube.empty:
+        return pd.DataFrame(columns=['event_type', 'count'])
+
+    result = cube.groupby('event_type', observed=False)['count'].sum().reset_index(name='count')
+    return result.sort_values('count', ascending=False)
+
+
+def get_events_by_page_df(cube: pd.DataFrame) -> pd.DataFrame:
+    if cube.empty:
+        return pd.DataFrame(columns=['page', 'count'])
+
+    result = cube.groupby('page', observed=False)['count'].sum().reset_index(name='count')
+    return result.sort_values('count', ascending=False)
+
+
+def get_events_over_time_df(cube: pd.DataFrame, granularity: str = 'hour') -> pd.DataFrame:
+    """Like metrics.get_events_over_time_df, except that minutes also fall back to days."""
+    if cube.empty:
+        return pd.DataFrame(columns=['datetime', 'count'])
+
+    buckets = floor_times(cube['hour'], resolve_granularity(granularity, CUBE_LEVELS))
+    result = cube['count'].groupby(buckets.rename('datetime')).sum().reset_index(name='count')
+    return result
+
+
+def calculate_ecommerce_metrics(cube: pd.DataFrame) -> Dict[str, Any]:
+    if cube.empty:
+        return {
+            'add_to_cart_count': 0,
+            'add_to_cart_by_product': pd.DataFrame(),
+            'view_details_by_product': pd.DataFrame(),
+            'top_products_added': []
+        }
+
+    add_to_cart = cube[cube['element'].isin(ADD_TO_CART_ELEMENTS)]
+    add_to_cart_by_product = _by_product(add_to_cart, 'add_to_cart_count')
+    view_details_by_product = _by_product(cube[cube['element'] == VIEW_DETAILS_ELEMENT], 'view_count')
+    top_products = add_to_cart_by_product.head(10)['product_id'].tolist() if not add_to_cart_by_product.empty else []
+
+    return {
+        'add_to_cart_count': int(add_to_cart['count'].sum()),
+        'add_to_cart_by_product': add_to_cart_by_product,
+        'view_details_by_product': view_details_by_product,
+        'top_products_added': top_products
+    }
+
+
+def _by_product(rows: pd.DataFrame, count_col: str) -> pd.DataFrame:
+    if rows.empty:
+        return pd.DataFrame(columns=['product_id', count_col])
+    result = rows.groupby('product_id')['count'].sum().reset_index(name=count_col)
+    return result.sort_values(count_col, ascending=False)
+
+
+if __name__ == '__main__':
+
+    import sys
+    import tempfile
+    import warnings
+
+    from . import metrics
+    from .bench import synthetic_frame
+    from .log_parser import load_events_from_directory
+
+    warnings.simplefilter('ignore', FutureWarning)
+    print("=== Checking cube queries against raw-event metrics ===")
+
+    # Synthetic events unless a logs dir is given
+    df = load_events_from_directory(sys.argv[1]) if len(sys.argv) > 1 else synthetic_frame(200_000, days=14, n_users=10_000)
+
+    half = len(df) // 2
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, CUBE_FILE)
+        save_cube(merge_cubes(build_cube(df.iloc[:half]), build_cube(df.iloc[half:])), path)
+        cube = load_cube(path)
+        size = os.path.getsize(path)
+
+    for name in ('get_events_by_type_df', 'get_events_by_page_df'):
+        pd.testing.assert_frame_equal(getattr(metrics, name)(df), globals()[name](cube))
+    for granularity in ('hour', 'day', 'week', 'month'):
+        pd.testing.assert_frame_equal(metrics.get_events_over_time_df(df, granularity),
+                                      get_events_over_time_df(cube, granularity))
+    expected, actual = metrics.calculate_ecommerce_metrics(df), calculate_ecommerce_metrics(cube)
+    for key in ('add_to_cart_by_product', 'view_details_by_product'):
+        pd.testing.assert_frame_equal(expected[key], actual[key])
+    assert expected['add_to_cart_count'] == actual['add_to_cart_count']
+    assert expected['top_products_added'] == actual['top_products_added']
+
+    # A stored cube refreshed after more events arrived, some of them in an hour it already has
+    pd.testing.assert_frame_equal(refresh_cube(build_cube(df.iloc[:half]), df), build_cube(df))
+    pd.testing.assert_frame_equal(refresh_cube(build_cube(df), df.iloc[:half]), build_cube(df.iloc[:half]))
+
+    print(f"{len(df)} events -> {len(cube)} cube rows ({size / 1024:.0f} KB on disk); all queries identical")
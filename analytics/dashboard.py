@@ -7,7 +7,13 @@ import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from analytics.data_cache import CACHE
+from analytics.downsample import downsample_pyramid, lttb, point_budget
+from analytics.publish import CURRENT_FILE, read_feather, resolve_output
+from analytics.refresh import get_worker
+from analytics.timeseries import PYRAMID_FILE, TimeSeriesPyramid
 
 st.set_page_config(
     page_title="ShopVerse Analytics",
@@ -122,37 +128,56 @@ st.markdown(f"""
 """, unsafe_allow_html=True)
 
 
-def get_data_path() -> Path:
+def get_output_path() -> Path:
     return Path(__file__).parent / 'output'
 
+def read_json(path: str) -> dict:
+    with open(path, 'r') as f: return json.load(f)
+
+def read_version(pointer_path: str) -> Path:
+    return resolve_output(Path(pointer_path).parent)
+
+# Streamlit re-executes the script on every interaction, so this holds one version per run
+_published = {}
+
+def get_data_path() -> Path:
+    """The published report version, resolved once per run so every chart reads the same one."""
+    if 'path' not in _published:
+        # CURRENT is only read again when a publish replaces it
+        _published['path'] = CACHE.load(get_output_path() / CURRENT_FILE, read_version, get_output_path())
+    return _published['path']
+
 def get_ga_data_path() -> Path:
     return Path(__file__).parent / 'ga_output'
 
 
 def load_summary() -> dict:
-    path = get_data_path() / 'summary.json'
-    if path.exists():
-        with open(path, 'r') as f: return json.load(f)
-    return {}
+    return CACHE.load(get_data_path() / 'summary.json', read_json, {})
 
 def load_ga_summary() -> dict:
-    path = get_ga_data_path() / 'ga_summary.json'
-    if path.exists():
-        with open(path, 'r') as f: return json.load(f)
-    return {}
+    return CACHE.load(get_ga_data_path() / 'ga_summary.json', read_json, {})
 
 
-def load_csv(filename: str, source='local') -> pd.DataFrame:
+GA_TABLES = {
+    'events_by_type': 'ga_events_by_type',
+    'events_over_time': 'ga_events_over_time',
+    'add_to_cart_by_product': 'ga_add_to_cart',
+}
+
+def load_table(name: str, source='local') -> pd.DataFrame:
+    """A report table, memory-mapped from its Feather file, or parsed from the CSV export of older outputs."""
     base = get_data_path() if source == 'local' else get_ga_data_path()
     if source == 'ga':
-        if filename == 'events_by_type.csv': filename = 'ga_events_by_type.csv'
-        elif filename == 'events_over_time.csv': filename = 'ga_events_over_time.csv'
-        elif filename == 'add_to_cart_by_product.csv': filename = 'ga_add_to_cart.csv'
-    
-    filepath = base / filename
-    if filepath.exists():
-        return pd.read_csv(filepath)
-    return pd.DataFrame()
+        name = GA_TABLES.get(name, name)
+
+    table = CACHE.load(base / f"{name}.feather", read_feather)
+    if table is None:
+        table = CACHE.load(base / f"{name}.csv", pd.read_csv, pd.DataFrame())
+    return table
+
+
+def load_pyramid():
+    return CACHE.load(get_data_path() / PYRAMID_FILE, TimeSeriesPyramid.load)
 
 
 def render_metric_card(col, question, value, delta=None, help_text=None):
@@ -173,10 +198,10 @@ def render_kpi_cards(summary: dict, ga_summary: dict = None, mode="local"):
     local_visits = summary.get('total_page_visits', 0)
     
     if mode == "comparison" and ga_summary:
-        ga_df = load_csv('events_by_type.csv', source='ga')
+        ga_df = load_table('events_by_type', source='ga')
         ga_events = ga_df['count'].sum() if not ga_df.empty else 0
         ga_users = ga_summary.get('total_users', 0)
-        ga_cart_df = load_csv('add_to_cart_by_product.csv', source='ga')
+        ga_cart_df = load_table('add_to_cart_by_product', source='ga')
         ga_cart = ga_cart_df['add_to_cart_count'].sum() if not ga_cart_df.empty else 0
         
 
@@ -187,10 +212,10 @@ def render_kpi_cards(summary: dict, ga_summary: dict = None, mode="local"):
         
     elif mode == "ga":
 
-        ga_df = load_csv('events_by_type.csv', source='ga')
+        ga_df = load_table('events_by_type', source='ga')
         ga_events = ga_df['count'].sum() if not ga_df.empty else 0
         ga_users = ga_summary.get('total_users', 0)
-        ga_cart_df = load_csv('add_to_cart_by_product.csv', source='ga')
+        ga_cart_df = load_table('add_to_cart_by_product', source='ga')
         ga_cart = ga_cart_df['add_to_cart_count'].sum() if not ga_cart_df.empty else 0
         
         render_metric_card(col1, "Actions (Google)", f"{ga_events:,}")
@@ -205,8 +230,16 @@ def render_kpi_cards(summary: dict, ga_summary: dict = None, mode="local"):
         render_metric_card(col3, "Items added to cart?", f"{local_cart:,}", None, "Purchase intent signals.")
         render_metric_card(col4, "Pages viewed?", f"{local_visits:,}", None, "Total page loads.")
 
+        sessions = summary.get('sessions')
+        if sessions:
+            col1, col2, col3, col4 = st.columns(4)
+            render_metric_card(col1, "How many visits?", f"{sessions['total_sessions']:,}", None, "Sessions: a user's events with no pause longer than 30 minutes.")
+            render_metric_card(col2, "How long per visit?", f"{sessions['avg_session_duration'] / 60:.1f} min", None, "Average time between the first and last event of a session.")
+            render_metric_card(col3, "Left right away?", f"{sessions['bounce_rate']:.0%}", None, "Share of sessions with a single event.")
+            render_metric_card(col4, "Visits reaching the cart?", f"{sessions['cart_rate']:.0%}", None, "Share of sessions that opened the cart page.")
 
-def render_comparison_charts(local_type, ga_type, local_time, ga_time):
+
+def render_comparison_charts(local_type, ga_type, local_time, ga_time, budget=None):
     st.subheader("Comparing the Numbers")
     st.markdown("Here's how our server logs (Local) compare to what Google sees.")
     
@@ -242,15 +275,59 @@ def render_comparison_charts(local_type, ga_type, local_time, ga_time):
         )
         st.plotly_chart(fig, use_container_width=True)
 
+    # Each source gets the whole budget, since each is its own trace
+    budget = budget or point_budget()
+    traces = [lttb(times.assign(datetime=pd.to_datetime(times['datetime']), source=source), budget)
+              for times, source in [(local_time, 'Local Server'), (ga_time, 'Google Analytics')]
+              if not times.empty]
+    if traces:
+        fig = px.line(
+            pd.concat(traces, ignore_index=True),
+            x='datetime',
+            y='count',
+            color='source',
+            title='Who saw the traffic when?',
+            color_discrete_map={'Local Server': current_theme['accent_color'], 'Google Analytics': current_theme['secondary_accent']},
+            template=current_theme['plotly_template']
+        )
+        fig.update_layout(
+            xaxis_title=None,
+            yaxis_title=None,
+            plot_bgcolor='rgba(0,0,0,0)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            font_color=current_theme['text_color']
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
 
-def render_standard_charts(df_time, df_products, funnel_data):
+def select_time_window(pyramid: TimeSeriesPyramid, budget: int) -> pd.DataFrame:
+    """Event counts for the window picked on a range slider, re-queried from the pyramid at the
+    finest level the point budget allows, so narrowing the window shows more detail."""
+    minutes = pyramid.levels['minute'].index
+    first, last = minutes[0].to_pydatetime(), (minutes[-1] + pd.Timedelta(minutes=1)).to_pydatetime()
+    # About a thousand slider positions, in whole minutes
+    step = timedelta(minutes=max(1, round((last - first) / timedelta(minutes=1000))))
+    start, end = st.slider("Time window", min_value=first, max_value=last, value=(first, last),
+                           step=step, format="YYYY-MM-DD HH:mm")
+    window = downsample_pyramid(pyramid, start, end, budget)
+    st.caption(f"{window.attrs['granularity'].capitalize()} counts, "
+               f"{len(window)} of {window.attrs.get('downsampled_from', len(window))} points")
+    return window
+
+
+def render_standard_charts(df_time, df_products, funnel_data, pyramid=None, budget=None):
     st.markdown("### Traffic & Trends")
     
 
-    if not df_time.empty:
+    budget = budget or point_budget()
+    if pyramid is not None and not pyramid.levels['minute'].empty:
+        df_time = select_time_window(pyramid, budget)
+    elif not df_time.empty:
         if 'datetime' in df_time.columns:
             df_time['datetime'] = pd.to_datetime(df_time['datetime'])
-            
+        df_time = lttb(df_time, budget)
+
+    if not df_time.empty:
         fig = px.line(
             df_time, 
             x='datetime', 
@@ -319,16 +396,10 @@ def render_standard_charts(df_time, df_products, funnel_data):
 
 
 def load_ml_metrics():
-    path = get_data_path() / 'ml_metrics.json'
-    if path.exists():
-        with open(path, 'r') as f: return json.load(f)
-    return {}
+    return CACHE.load(get_output_path() / 'ml_metrics.json', read_json, {})
 
 def load_feature_importance():
-    path = get_data_path() / 'feature_importance.csv'
-    if path.exists():
-        return pd.read_csv(path)
-    return pd.DataFrame()
+    return CACHE.load(get_output_path() / 'feature_importance.csv', pd.read_csv, pd.DataFrame())
 
 def render_ml_dashboard():
     st.subheader("Machine Learning: Conversion Prediction")
@@ -376,6 +447,9 @@ def render_ml_dashboard():
   
 
 def main():
+    # Started on the first page load, so its imports are done before anyone clicks Refresh
+    worker = get_worker()
+
     st.title("ShopVerse Analytics")
     st.caption("Understand your customers with simple, clear data.")
     st.markdown("---")
@@ -389,6 +463,10 @@ def main():
     )
     
 
+    chart_width = st.sidebar.select_slider("Chart width (px)", options=[600, 900, 1200, 1800, 2400], value=1200,
+                                           help="Time series are downsampled to one point per pixel.")
+    budget = point_budget(chart_width)
+
     summary = load_summary()
     ga_summary = load_ga_summary()
     
@@ -400,9 +478,11 @@ def main():
         render_kpi_cards(summary, mode="local")
         st.markdown("")
         render_standard_charts(
-            load_csv('events_over_time.csv'),
-            load_csv('add_to_cart_by_product.csv'),
-            summary.get('funnel', {})
+            load_table('events_over_time'),
+            load_table('add_to_cart_by_product'),
+            summary.get('ordered_funnel') or summary.get('funnel', {}),
+            load_pyramid(),
+            budget
         )
         
     elif data_source == "Google Analytics":
@@ -415,24 +495,36 @@ def main():
     else:
         render_kpi_cards(summary, ga_summary, mode="comparison")
         render_comparison_charts(
-            load_csv('events_by_type.csv'),
-            load_csv('events_by_type.csv', source='ga'),
-            load_csv('events_over_time.csv'),
-            load_csv('events_over_time.csv', source='ga')
+            load_table('events_by_type'),
+            load_table('events_by_type', source='ga'),
+            load_table('events_over_time'),
+            load_table('events_over_time', source='ga'),
+            budget
         )
 
 
     st.sidebar.markdown("---")
+    cache_stats = CACHE.stats()
+    st.sidebar.caption(
+        f"Data cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+        f"{cache_stats['entries']}/{cache_stats['max_entries']} files held"
+    )
+    full_rebuild = st.sidebar.checkbox("Full rebuild", value=False, help="Re-parse every log file instead of only new ones.")
     if st.sidebar.button("Refresh Data"):
-        with st.sidebar.status("Crunching new numbers..."):
-            import subprocess
-            subprocess.run(['python', 'generate_analytics.py'], cwd=str(Path(__file__).parent))
-            st.write("Checked Local Logs")
-            subprocess.run(['python', 'ga_fetcher.py'], cwd=str(Path(__file__).parent))
-            st.write("Checked Google Analytics")
-            subprocess.run(['python', 'ml_analysis.py'], cwd=str(Path(__file__).parent))
-            st.write("Ran ML Models")
+        worker.submit(full_rebuild)
+
+    # A refresh runs in the worker thread, so a rerun in the middle of one picks it up again here
+    job = worker.current
+    if job is not None and not job.done.is_set():
+        with st.sidebar.status("Crunching new numbers...", expanded=True) as status:
+            for event in job.follow():
+                st.write(event['message'])
+            status.update(label=f"Refreshed in {job.seconds:.1f}s",
+                          state='error' if job.errors else 'complete')
         st.rerun()
+    elif job is not None:
+        failed = f" ({', '.join(job.errors)} failed)" if job.errors else ""
+        st.sidebar.caption(f"Last refresh took {job.seconds:.1f}s{failed}")
 
 if __name__ == '__main__':
     main()
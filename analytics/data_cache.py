@@ -0,0 +1,143 @@
+"""File cache - keeps loaded data files in memory until the file on disk changes.
+
+Entries are keyed on the path and the function that read it, and are
+only served while the file's size, modification time and inode still
+match the ones it had when it was read. Publishing a new report version
+or replacing a file therefore misses the cache on its own; nothing has to
+clear it. The least recently used entries are dropped beyond max_entries.
+
+The dashboard keeps one FileCache for the whole server process: Streamlit
+re-executes the script on every interaction, but imported modules stay
+loaded, so a rerun over unchanged files only stats them.
+"""
+
+import copy
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+import pandas as pd
+
+
+DEFAULT_MAX_ENTRIES = 64
+
+
+def file_fingerprint(stat: os.stat_result) -> Tuple[int, int, int]:
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+class FileCache:
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: 'OrderedDict[Tuple[str, str], Tuple[Tuple[int, int, int], Any]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Streamlit serves each browser session from its own thread
+        self.lock = threading.Lock()
+
+    def load(self, path: os.PathLike, reader: Callable[[str], Any], default: Any = None) -> Any:
+        """reader(path), from memory while the file is unchanged; default if the file does not exist.
+
+        Cached values are shared by every caller, so DataFrames are handed
+        out as shallow copies and dicts and lists as deep copies: callers may
+        add or replace columns and keys without changing the cache. Other
+        objects (paths, the time-series pyramid) are handed out as they are
+        and must be treated as read-only.
+        """
+        path = str(path)
+        try:
+            fingerprint = file_fingerprint(os.stat(path))
+        except OSError:
+            return default
+        key = (path, getattr(reader, '__qualname__', repr(reader)))
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == fingerprint:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return _handout(entry[1])
+
+        value = reader(path)
+        with self.lock:
+            self.misses += 1
+            self.entries[key] = (fingerprint, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return _handout(value)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self.entries), 'max_entries': self.max_entries}
+
+
+# One per process, shared by every dashboard session and rerun
+CACHE = FileCache()
+
+
+def _handout(value: Any) -> Any:
+    if isinstance(value, pd.DataFrame):
+        return value.copy(deep=False)
+    if isinstance(value, (dict, list)):
+        return copy.deepcopy(value)
+    return value
+
+
+if __name__ == '__main__':
+
+    import json
+    import tempfile
+    import time
+
+    print("=== Checking the file cache ===")
+
+    reads = []
+
+    def read_json(path):
+        reads.append(path)
+        with open(path) as f:
+            return json.load(f)
+
+    def object_reader(path):
+        return object()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = FileCache(max_entries=2)
+        paths = [os.path.join(tmp, f"{name}.json") for name in 'abc']
+        for n, path in enumerate(paths):
+            with open(path, 'w') as f:
+                json.dump({'n': n}, f)
+
+        assert cache.load(paths[0], read_json) == {'n': 0}
+        value = cache.load(paths[0], read_json)
+        value['n'] = 99
+        assert cache.load(paths[0], read_json) == {'n': 0} and len(reads) == 1
+        assert cache.load(os.path.join(tmp, 'missing.json'), read_json, {}) == {}
+        # Read-only objects are shared rather than copied
+        assert cache.load(paths[1], object_reader) is cache.load(paths[1], object_reader)
+
+        # A replaced file is read again without clearing anything
+        time.sleep(0.01)
+        with open(paths[0] + '.tmp', 'w') as f:
+            json.dump({'n': 10}, f)
+        os.replace(paths[0] + '.tmp', paths[0])
+        assert cache.load(paths[0], read_json) == {'n': 10} and len(reads) == 2
+
+        # Beyond max_entries the least recently used file goes
+        cache.load(paths[1], read_json)
+        cache.load(paths[0], read_json)
+        cache.load(paths[2], read_json)
+        assert [key[0] for key in cache.entries] == [paths[0], paths[2]]
+        print(cache.stats())
+        assert cache.stats() == {'hits': 4, 'misses': 5, 'evictions': 2, 'entries': 2, 'max_entries': 2}
+
+    print("unchanged files are served from memory, changed ones are read again")
@@ -0,0 +1,133 @@
+"""Downsampling - reduces a time series to a point budget while keeping its visual shape.
+
+Largest-Triangle-Three-Buckets (Steinarsson, 2013) keeps the first and
+last points and, from each of n - 2 equal buckets in between, the point
+that forms the largest triangle with the point kept from the previous
+bucket and the average of the next bucket. Spikes and dips survive, which
+plain striding or averaging would flatten. A chart needs about one point
+per horizontal pixel, so budgets come from the chart width.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# Plotly charts in the dashboard span the page; one point per pixel at a typical width
+DEFAULT_CHART_WIDTH = 1200
+# A pyramid level with up to this many times the budget is read and then reduced with LTTB
+OVERSAMPLE = 16
+
+
+def point_budget(width_px: int = DEFAULT_CHART_WIDTH, points_per_px: float = 1.0) -> int:
+    return max(3, int(width_px * points_per_px))
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Positions of the n_out points LTTB keeps from x, y (x ascending), in order.
+
+    The bucket bounds and the next-bucket averages are computed for all
+    buckets at once. The choice in each bucket depends on the point chosen
+    in the one before it, so buckets are still walked in turn, but each step
+    is one vectorized argmax over the bucket.
+    """
+    n = len(x)
+    if n_out >= n or n <= 2:
+        return np.arange(n)
+    if n_out < 3:
+        raise ValueError("LTTB needs a budget of at least 3 points")
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Bucket i holds points bounds[i]:bounds[i + 1]; the first and last points are buckets of their own
+    bounds = np.empty(n_out + 1, dtype=np.int64)
+    bounds[0], bounds[-1] = 0, n
+    bounds[1:-1] = 1 + (np.arange(n_out - 1) * (n - 2)) // (n_out - 2)
+
+    sizes = np.diff(bounds)
+    x_sums = np.add.reduceat(x, bounds[:-1])
+    y_sums = np.add.reduceat(y, bounds[:-1])
+    next_x = x_sums[1:] / sizes[1:]
+    next_y = y_sums[1:] / sizes[1:]
+
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for bucket in range(1, n_out - 1):
+        lo, hi = bounds[bucket], bounds[bucket + 1]
+        ax, ay = x[a], y[a]
+        cx, cy = next_x[bucket], next_y[bucket]
+        # Twice the triangle areas; the factor does not change which one is largest
+        areas = np.abs((ax - cx) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (cy - ay))
+        a = lo + int(np.argmax(areas))
+        kept[bucket] = a
+    return kept
+
+
+def lttb(df: pd.DataFrame, n_out: int, x: str = 'datetime', y: str = 'count') -> pd.DataFrame:
+    """The rows of a time-series frame that LTTB keeps for a budget of n_out points."""
+    if len(df) <= n_out:
+        return df
+    df = df.sort_values(x) if not df[x].is_monotonic_increasing else df
+    x_values = df[x].to_numpy()
+    if np.issubdtype(x_values.dtype, np.datetime64):
+        x_values = x_values.astype('datetime64[ms]').astype(np.int64)
+    keep = lttb_indices(x_values, df[y].to_numpy(), n_out)
+    result = df.iloc[keep]
+    result.attrs = dict(df.attrs, downsampled_from=len(df))
+    return result
+
+
+def downsample_pyramid(pyramid, start=None, end=None, n_out: int = None) -> pd.DataFrame:
+    """Counts between start and end from the finest pyramid level that stays within a few times
+    the budget, reduced to n_out points with LTTB."""
+    n_out = n_out or point_budget()
+    series = pyramid.query(start, end, max_points=n_out * OVERSAMPLE)
+    return lttb(series, n_out)
+
+
+if __name__ == '__main__':
+
+    import time
+
+    print("=== Checking LTTB ===")
+
+    def reference(x, y, n_out):
+        # Straight from the paper, one point at a time
+        n = len(x)
+        every = (n - 2) / (n_out - 2)
+        kept, a = [0], 0
+        for i in range(n_out - 2):
+            lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+            next_lo, next_hi = hi, min(int((i + 2) * every) + 1, n)
+            if i == n_out - 3:
+                next_lo, next_hi = n - 1, n
+            cx, cy = np.mean(x[next_lo:next_hi]), np.mean(y[next_lo:next_hi])
+            best, best_area = lo, -1.0
+            for b in range(lo, hi):
+                area = abs((x[a] - cx) * (y[b] - y[a]) - (x[a] - x[b]) * (cy - y[a]))
+                if area > best_area:
+                    best, best_area = b, area
+            kept.append(best)
+            a = best
+        kept.append(n - 1)
+        return np.array(kept)
+
+    rng = np.random.default_rng(7)
+    for n, n_out in [(10, 5), (1000, 100), (5003, 97)]:
+        x = np.arange(n, dtype=np.float64)
+        y = rng.poisson(20, n).astype(np.float64)
+        y[n // 3] += 500
+        np.testing.assert_array_equal(lttb_indices(x, y, n_out), reference(x, y, n_out))
+        # A spike is the largest triangle of its bucket, so it is always kept
+        assert n // 3 in lttb_indices(x, y, n_out)
+
+    # Half a year of minutes down to one chart width
+    n = 60 * 24 * 182
+    series = pd.DataFrame({'datetime': pd.date_range('2026-01-01', periods=n, freq='min'),
+                           'count': rng.poisson(5, n)})
+    started = time.perf_counter()
+    result = lttb(series, point_budget())
+    elapsed = time.perf_counter() - started
+    assert len(result) == point_budget() and result['datetime'].is_monotonic_increasing
+    assert result.attrs['downsampled_from'] == n
+    print(f"{n} points -> {len(result)} in {elapsed * 1000:.0f}ms; matches the reference implementation")
@@ -7,19 +7,7 @@ import pandas as pd
 from datetime import datetime, timedelta
 from pathlib import Path
 
-
-try:
-    from google.analytics.data_v1beta import BetaAnalyticsDataClient
-    from google.analytics.data_v1beta.types import (
-        DateRange,
-        Dimension,
-        Metric,
-        RunReportRequest,
-    )
-    GA_LIB_AVAILABLE = True
-except ImportError:
-    GA_LIB_AVAILABLE = False
-    print("Warning: google-analytics-data library not found. Running in mock mode.")
+from .publish import write_feather
 
 
 SCRIPT_DIR = Path(__file__).parent
@@ -28,15 +16,37 @@ OUTPUT_DIR = SCRIPT_DIR / 'ga_output'
 
 PROPERTY_ID = '523449289'
 
-def ensure_output_dir():
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+def ensure_output_dir(output_dir=OUTPUT_DIR):
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
 
-def run_real_fetch():
-    if not GA_LIB_AVAILABLE:
-        return False
-        
+def save_table(rows, name, csv=True, output_dir=OUTPUT_DIR):
+    """Saves a GA table as Feather for the dashboard, plus a CSV export if csv."""
+    df = pd.DataFrame(rows)
+    if 'datetime' in df.columns:
+        df['datetime'] = pd.to_datetime(df['datetime'])
+    # Replaced rather than rewritten in place: the dashboard may have the old file memory-mapped
+    tmp_path = Path(output_dir) / f"{name}.feather.tmp"
+    write_feather(df, tmp_path)
+    os.replace(tmp_path, Path(output_dir) / f"{name}.feather")
+    if csv:
+        df.to_csv(Path(output_dir) / f"{name}.csv", index=False)
+
+def run_real_fetch(csv=True, output_dir=OUTPUT_DIR):
     if not CREDENTIALS_PATH.exists():
         return False
+
+    # Only imported with credentials to use; mock mode never loads the Google client
+    try:
+        from google.analytics.data_v1beta import BetaAnalyticsDataClient
+        from google.analytics.data_v1beta.types import (
+            DateRange,
+            Dimension,
+            Metric,
+            RunReportRequest,
+        )
+    except ImportError:
+        print("Warning: google-analytics-data library not found. Running in mock mode.")
+        return False
         
     print(f"[Auth] Found credentials at {CREDENTIALS_PATH}")
     print("[Connect] Connecting to Google Analytics 4...")
@@ -61,7 +71,7 @@ def run_real_fetch():
                 "count": int(row.metric_values[0].value)
             })
         
-        pd.DataFrame(events_data).to_csv(OUTPUT_DIR / 'ga_events_by_type.csv', index=False)
+        save_table(events_data, 'ga_events_by_type', csv, output_dir)
         
         print("   - Fetching events over time...")
         request = RunReportRequest(
@@ -88,7 +98,7 @@ def run_real_fetch():
             except ValueError:
                 continue
                 
-        pd.DataFrame(time_data).to_csv(OUTPUT_DIR / 'ga_events_over_time.csv', index=False)
+        save_table(time_data, 'ga_events_over_time', csv, output_dir)
         
         print("   - Fetching add to cart data...")
         request = RunReportRequest(
@@ -112,7 +122,7 @@ def run_real_fetch():
                 "add_to_cart_count": int(row.metric_values[0].value)
             })
             
-        pd.DataFrame(cart_data).to_csv(OUTPUT_DIR / 'ga_add_to_cart.csv', index=False)
+        save_table(cart_data, 'ga_add_to_cart', csv, output_dir)
         
         print("[OK] Real data fetched successfully!")
         return True
@@ -121,7 +131,7 @@ def run_real_fetch():
         print(f"[Error] fetching from GA4: {e}")
         return False
 
-def run_mock_fetch():
+def run_mock_fetch(csv=True, output_dir=OUTPUT_DIR):
     print("[Warn] No credentials found or API failed. Generating MOCK data...")
     
     # 1. Events by Type (Dynamic)
@@ -133,7 +143,7 @@ def run_mock_fetch():
         {"event_type": "session_start", "count": random.randint(5, 20)},
         {"event_type": "first_visit", "count": random.randint(1, 10)}
     ]
-    pd.DataFrame(events_by_type).to_csv(OUTPUT_DIR / 'ga_events_by_type.csv', index=False)
+    save_table(events_by_type, 'ga_events_by_type', csv, output_dir)
     
     # 2. Events Over Time (Dynamic)
     time_data = []
@@ -147,7 +157,7 @@ def run_mock_fetch():
             "count": count
         })
     time_data.sort(key=lambda x: x["datetime"])
-    pd.DataFrame(time_data).to_csv(OUTPUT_DIR / 'ga_events_over_time.csv', index=False)
+    save_table(time_data, 'ga_events_over_time', csv, output_dir)
     
     # 3. Add to Cart (Dynamic)
     cart_data = [
@@ -156,7 +166,7 @@ def run_mock_fetch():
         {"product_name": "Canvas Backpack", "add_to_cart_count": random.randint(0, 4)},
         {"product_name": "Ergonomic Mouse", "add_to_cart_count": random.randint(0, 2)}
     ]
-    pd.DataFrame(cart_data).to_csv(OUTPUT_DIR / 'ga_add_to_cart.csv', index=False)
+    save_table(cart_data, 'ga_add_to_cart', csv, output_dir)
     
     # 4. Summary (Dynamic)
     summary = {
@@ -165,25 +175,30 @@ def run_mock_fetch():
         "mode": "MOCK",
         "generated_at": datetime.now().isoformat()
     }
-    with open(OUTPUT_DIR / 'ga_summary.json', 'w') as f:
+    with open(Path(output_dir) / 'ga_summary.json', 'w') as f:
         json.dump(summary, f, indent=2)
         
     print("[OK] Mock data generated successfully (Randomized)!")
 
-def main():  
+def fetch_ga(output_dir=OUTPUT_DIR, csv=True):
+    """Fetches the GA4 tables into output_dir, or generates mock ones without credentials."""
     print("[Analytics] GA4 Data Fetcher") 
-    ensure_output_dir()
+    ensure_output_dir(output_dir)
     
     success = False
     if CREDENTIALS_PATH.exists():
-        success = run_real_fetch()
+        success = run_real_fetch(csv, output_dir)
     else:
         print("[Info] No 'ga_credentials.json' found.")
     
     if not success:
-        run_mock_fetch()
+        run_mock_fetch(csv, output_dir)
         
-    print(f"\n[Output] Files saved to: {OUTPUT_DIR}")
+    print(f"\n[Output] Files saved to: {output_dir}")
+
+def main():  
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    fetch_ga(Path(args[0]) if args else OUTPUT_DIR, csv='--no-csv' not in sys.argv)
 
 if __name__ == '__main__':
     main()
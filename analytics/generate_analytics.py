@@ -1,85 +1,203 @@
 """Generates analytics CSV files from event logs."""
 
 import os
-import json
+import shutil
 import sys
 from pathlib import Path
 
+import pandas as pd
 
-sys.path.insert(0, str(Path(__file__).parent))
+from .aggregates import HourlyAggregateStore
+from .log_parser import load_events_from_directory, load_events_incremental
+from .metrics import calculate_all_metrics, calculate_ordered_funnel
+from . import cube as cube_queries
+from .cube import CUBE_FILE, build_cube, load_cube, refresh_cube, save_cube
+from .pipeline import Pipeline
+from .publish import CURRENT_FILE, MANIFEST_FILE, publish, table_artifacts
+from .sessions import assign_sessions, build_sessions, session_kpis
+from .sharding import PARTS, run_sharded
+from .timeseries import PYRAMID_FILE, TimeSeriesPyramid
 
-from log_parser import load_events_from_directory
-from metrics import (
-    calculate_all_metrics,
-    get_events_by_type_df,
-    get_events_by_page_df,
-    get_events_over_time_df,
-    calculate_ecommerce_metrics
-)
+
+# Under the cache dir: one aggregate state per hour, exact or HyperLogLog
+HOURLY_STORE_DIRS = {False: 'hourly', True: 'hourly-approximate'}
 
 
 def ensure_output_dir(output_dir: str) -> None:
     Path(output_dir).mkdir(parents=True, exist_ok=True)
 
 
-def generate_analytics(logs_dir: str, output_dir: str) -> dict:
-    print("[Analytics] E-Commerce Analytics Generator")
-  
-    ensure_output_dir(output_dir)
-    
-
-    print(f"[Load] Loading events from: {logs_dir}")
-    df = load_events_from_directory(logs_dir)
-    
-    if df.empty:
-        print("[Error] No events found. Exiting.")
-        return {}
-    
-    print(f"[OK] Loaded {len(df)} events\n")
-    
-
-    print("[Calc] Calculating metrics...")
-    all_metrics = calculate_all_metrics(df)
-    
+def hourly_metrics(df: pd.DataFrame, store_dir: str, approximate: bool = False,
+                   full_rebuild: bool = False) -> dict:
+    """calculate_all_metrics(df), merged from the hourly states kept in store_dir.
+
+    Only the hours that gained events since the last run are aggregated from
+    df; the others are read back from the store (see HourlyAggregateStore).
+    """
+    if full_rebuild:
+        shutil.rmtree(store_dir, ignore_errors=True)
+    store = HourlyAggregateStore(store_dir, approximate).load()
+    changed = store.sync(df)
+    store.save()
+    print(f"  -> Updated {changed} of {len(store.states)} hourly aggregate states")
+    return store.merged().metrics()
+
+
+def cached_cube(df: pd.DataFrame, path: str, full_rebuild: bool = False) -> pd.DataFrame:
+    """build_cube(df), refreshed from the cube kept at path so only the hours that gained events are rebuilt."""
+    stored = build_cube(pd.DataFrame()) if full_rebuild else load_cube(path)
+    cube = refresh_cube(stored, df)
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    save_cube(cube, path)
+    return cube
+
+
+def _with_sessions(df: pd.DataFrame, session_ids) -> pd.DataFrame:
+    # A shallow copy: other stages read df at the same time, so it is never modified
+    frame = df.copy(deep=False)
+    frame['session_id'] = session_ids
+    return frame
+
+
+def report_tables(cube: pd.DataFrame, all_metrics: dict, approximate: bool = False) -> dict:
+    """The report tables (name -> DataFrame), answered from the rollup cube.
+
+    With approximate the product table is the heavy-hitter one from the metrics instead.
+    """
+    if approximate:
+        add_to_cart_by_product = all_metrics['ecommerce']['add_to_cart_by_product']
+    else:
+        add_to_cart_by_product = cube_queries.calculate_ecommerce_metrics(cube)['add_to_cart_by_product']
+    return {
+        'events_by_type': cube_queries.get_events_by_type_df(cube),
+        'events_by_page': cube_queries.get_events_by_page_df(cube),
+        'events_over_time': cube_queries.get_events_over_time_df(cube, 'hour'),
+        'add_to_cart_by_product': add_to_cart_by_product,
+    }
 
-    print("  -> Generating events_by_type.csv")
-    events_by_type = get_events_by_type_df(df)
-    events_by_type.to_csv(os.path.join(output_dir, 'events_by_type.csv'), index=False)
-    
 
-    print("  -> Generating events_by_page.csv")
-    events_by_page = get_events_by_page_df(df)
-    events_by_page.to_csv(os.path.join(output_dir, 'events_by_page.csv'), index=False)
-    
+def publish_report(tables: dict, summary: dict, cube: pd.DataFrame, pyramid: TimeSeriesPyramid,
+                   output_dir: str, csv: bool = True) -> list:
+    """Publishes every artifact as one new version of output_dir (see publish.py).
 
-    print("  -> Generating events_over_time.csv")
-    events_over_time = get_events_over_time_df(df, granularity='hour')
-    events_over_time.to_csv(os.path.join(output_dir, 'events_over_time.csv'), index=False)
-    
+    Tables are written as Feather for the dashboard, and also as CSV exports if csv.
+    """
+    artifacts = table_artifacts(tables, csv)
+    artifacts.update({
+        'summary.json': summary,
+        CUBE_FILE: lambda path: save_cube(cube, path),
+        PYRAMID_FILE: pyramid.save,
+    })
+    version = publish(output_dir, artifacts)
+    print(f"  -> Published {len(artifacts)} files as version {version.name}")
+    # Cached only while CURRENT still points at this version
+    return [str(Path(output_dir) / CURRENT_FILE), str(version / MANIFEST_FILE)]
 
-    print("  -> Generating add_to_cart_by_product.csv")
-    ecom_metrics = calculate_ecommerce_metrics(df)
-    ecom_metrics['add_to_cart_by_product'].to_csv(
-        os.path.join(output_dir, 'add_to_cart_by_product.csv'), 
-        index=False
-    )
-    
 
-    print("  -> Generating summary.json")
-    summary = {
+def build_summary(all_metrics: dict, ordered_funnel: dict, session_funnel: dict,
+                  sessions_kpis: dict, last_event) -> dict:
+    return {
         'total_events': all_metrics['general']['total_events'],
         'total_page_visits': all_metrics['general']['total_page_visits'],
         'total_clicks': all_metrics['general']['total_clicks'],
         'unique_users': all_metrics['general']['unique_users'],
-        'add_to_cart_count': ecom_metrics['add_to_cart_count'],
+        'add_to_cart_count': all_metrics['ecommerce']['add_to_cart_count'],
         'events_by_type': all_metrics['general']['events_by_type'],
         'events_by_page': all_metrics['general']['events_by_page'],
         'funnel': all_metrics['funnel'],
-        'generated_at': str(df['datetime'].max()) if 'datetime' in df.columns else None
+        'ordered_funnel': ordered_funnel,
+        'session_funnel': session_funnel,
+        'sessions': sessions_kpis,
+        'generated_at': last_event
     }
+
+
+def build_pipeline(output_dir: str, cache_dir: str = None, approximate: bool = False,
+                   workers: int = 1, csv: bool = True, full_rebuild: bool = False) -> Pipeline:
+    """The report as stages over the 'events' source; see pipeline.Pipeline.
+
+    With a cache_dir the metrics are merged from stored hourly aggregates
+    and the cube is refreshed from the stored one, so a run only aggregates
+    the hours that changed. The report tables are queries on the cube.
+    """
+    pipeline = Pipeline(cache_dir)
+
+    if workers > 1:
+        # Stored hourly states are per hour, not per user, and sketches are not split by user
+        parts = [part for part in PARTS if not ((cache_dir or approximate) and part == 'metrics')]
+        pipeline.stage('user_shards', lambda df: run_sharded(df.copy(deep=False), parts, workers=workers),
+                       ['events'], params={'parts': parts}, label=f"Computing {', '.join(parts)} over {workers} user shards")
+        for part in parts:
+            pipeline.stage(part, lambda shards, part=part: shards[part], ['user_shards'], cache=False)
+    else:
+        parts = []
+        pipeline.stage('session_ids', assign_sessions, ['events'], label="Sessionizing events")
+    if 'metrics' not in parts and cache_dir:
+        store_dir = os.path.join(cache_dir, HOURLY_STORE_DIRS[approximate])
+        pipeline.stage('metrics', lambda df: hourly_metrics(df, store_dir, approximate, full_rebuild), ['events'],
+                       params={'approximate': approximate, 'store_dir': os.path.abspath(store_dir)},
+                       label="Merging hourly aggregates")
+    elif 'metrics' not in parts:
+        pipeline.stage('metrics', lambda df: calculate_all_metrics(df, approximate=approximate), ['events'],
+                       params={'approximate': approximate}, label="Calculating metrics")
+    if 'ordered_funnel' not in parts:
+        pipeline.stage('ordered_funnel', calculate_ordered_funnel, ['events'])
+    if 'sessions' not in parts:
+        pipeline.stage('sessions', lambda df, ids: build_sessions(_with_sessions(df, ids)), ['events', 'session_ids'])
+    if 'session_funnel' not in parts:
+        pipeline.stage('session_funnel', lambda df, ids: calculate_ordered_funnel(_with_sessions(df, ids), by='session_id'),
+                       ['events', 'session_ids'])
+
+    pipeline.stage('session_kpis', session_kpis, ['sessions'])
+    pipeline.stage('last_event', lambda df: str(df['datetime'].max()) if 'datetime' in df.columns else None,
+                   ['events'])
+    pipeline.stage('summary', build_summary,
+                   ['metrics', 'ordered_funnel', 'session_funnel', 'session_kpis', 'last_event'])
+
+    if cache_dir:
+        cube_path = os.path.join(cache_dir, CUBE_FILE)
+        pipeline.stage('cube', lambda df: cached_cube(df, cube_path, full_rebuild), ['events'],
+                       params={'path': os.path.abspath(cube_path)}, label=f"Refreshing rollup cube ({CUBE_FILE})")
+    else:
+        pipeline.stage('cube', build_cube, ['events'], label=f"Building rollup cube ({CUBE_FILE})")
+    pipeline.stage('tables', lambda cube, all_metrics: report_tables(cube, all_metrics, approximate),
+                   ['cube', 'metrics'], params={'approximate': approximate})
+    pipeline.stage('pyramid', TimeSeriesPyramid.from_events, ['events'],
+                   label=f"Building time-series pyramid ({PYRAMID_FILE})")
+    pipeline.stage('publish',
+                   lambda tables, summary, cube, pyramid: publish_report(tables, summary, cube, pyramid, output_dir, csv),
+                   ['tables', 'summary', 'cube', 'pyramid'], params={'output_dir': os.path.abspath(output_dir), 'csv': csv},
+                   writes=True, label="Writing and publishing the report files")
+    return pipeline
+
+
+def generate_analytics(logs_dir: str, output_dir: str, cache_dir: str = None,
+                       full_rebuild: bool = False, approximate: bool = False, workers: int = 1,
+                       csv: bool = True, df: pd.DataFrame = None) -> dict:
+    """Builds and publishes the report; df skips loading for a caller that already has the events."""
+    print("[Analytics] E-Commerce Analytics Generator")
+  
+    ensure_output_dir(output_dir)
     
-    with open(os.path.join(output_dir, 'summary.json'), 'w') as f:
-        json.dump(summary, f, indent=2, default=str)
+
+    if df is None:
+        print(f"[Load] Loading events from: {logs_dir}")
+        if cache_dir:
+            df = load_events_incremental(logs_dir, cache_dir, full_rebuild=full_rebuild)
+        else:
+            df = load_events_from_directory(logs_dir)
+    
+    if df.empty:
+        print("[Error] No events found. Exiting.")
+        return {}
+    
+    print(f"[OK] Loaded {len(df)} events\n")
+    
+
+    print("[Calc] Running the report stages...")
+    pipeline = build_pipeline(output_dir, cache_dir, approximate, workers, csv, full_rebuild)
+    summary = pipeline.run({'events': df}, targets=['summary'], use_cache=not full_rebuild)['summary']
+    pipeline.print_report()
     
 
     print("[OK] Analytics generation complete!")
@@ -88,6 +206,7 @@ def generate_analytics(logs_dir: str, output_dir: str) -> dict:
     print(f"\n[Summary]")
     print(f"   - Total Events: {summary['total_events']}")
     print(f"   - Unique Users: {summary['unique_users']}")
+    print(f"   - Sessions: {summary['sessions']['total_sessions']}")
     print(f"   - Page Visits: {summary['total_page_visits']}")
     print(f"   - Clicks: {summary['total_clicks']}")
     print(f"   - Add to Cart: {summary['add_to_cart_count']}")
@@ -100,11 +219,19 @@ if __name__ == '__main__':
     script_dir = Path(__file__).parent
     logs_dir = script_dir.parent / 'logs'
     output_dir = script_dir / 'output'
+    cache_dir = script_dir / 'cache'
     
 
-    if len(sys.argv) > 1:
-        logs_dir = Path(sys.argv[1])
-    if len(sys.argv) > 2:
-        output_dir = Path(sys.argv[2])
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    workers = next((int(arg.split('=', 1)[1]) for arg in sys.argv if arg.startswith('--workers=')), 1)
+    cache_dir = next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--cache-dir=')), cache_dir)
+    if len(args) > 0:
+        logs_dir = Path(args[0])
+    if len(args) > 1:
+        output_dir = Path(args[1])
     
-    generate_analytics(str(logs_dir), str(output_dir))
+    generate_analytics(str(logs_dir), str(output_dir), str(cache_dir),
+                       full_rebuild='--full-rebuild' in sys.argv,
+                       approximate='--approximate' in sys.argv,
+                       workers=workers,
+                       csv='--no-csv' not in sys.argv)
@@ -2,10 +2,39 @@
 
 import os
 import json
-import glob
-from datetime import datetime
+import mmap
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
+
+
+DEFAULT_CHUNK_SIZE = 2000
+FULL_LOAD_PARTITION_BATCH = 1_000_000
+
+CHECKPOINT_VERSION = 3
+MANIFEST_NAME = 'manifest.json'
+LOCK_NAME = 'checkpoint.lock'
+MAX_CACHE_SEGMENTS = 32
+
+CATEGORICAL_COLUMNS = ['event_type', 'page', 'element']
+
+# Written by compact.py into a closed YYYYMMDD folder
+PARTITION_FILE = 'events.parquet'
+
+DAY_FOLDER_RE = re.compile(r'\d{8}')
+FILE_STAMP_RE = re.compile(r'\d{14}(\d{3})?')
+
+# Rolling NDJSON layout: logs/YYYYMMDD/YYYYMMDDHH.ndjson, one event per line
+SEGMENT_SUFFIX = '.ndjson'
+SEGMENT_NAME_RE = re.compile(r'(\d{10})\.ndjson')
+SEGMENT_BYTES_PER_EVENT = 256
 
 
 def parse_timestamp(timestamp_str: str) -> datetime:
@@ -35,59 +64,806 @@ def load_single_event(filepath: str) -> dict:
     return event
 
 
-def load_events_from_directory(logs_dir: str) -> pd.DataFrame:
-    logs_path = Path(logs_dir)
-    
-    if not logs_path.exists():
-        print(f"Warning: Logs directory not found: {logs_dir}")
-        return pd.DataFrame()
-    
+def _digits_to_int(digits: np.ndarray) -> np.ndarray:
+    value = np.zeros(len(digits), dtype=np.int64)
+    for i in range(digits.shape[1]):
+        value = value * 10 + digits[:, i]
+    return value
 
-    json_files = list(logs_path.glob('**/*.json'))
-    
-    if not json_files:
-        print(f"Warning: No JSON files found in {logs_dir}")
-        return pd.DataFrame()
-    
-    print(f"Found {len(json_files)} event files")
-    
 
-    events = []
-    for filepath in json_files:
+def _timestamp_chars(values: pd.Series) -> np.ndarray:
+    """The first 17 characters of each value as an (n, 17) array of bytes, 0-padded.
+
+    Rows with a non-ASCII character are blanked, so they fail to decode and
+    become NaT instead of failing the whole column.
+    """
+    try:
+        return values.to_numpy(dtype='S17', na_value='').view(np.uint8).reshape(len(values), 17)
+    except UnicodeEncodeError:
+        codes = values.to_numpy(dtype='U17', na_value='').view(np.uint32).reshape(len(values), 17)
+        codes[(codes > 127).any(axis=1)] = 0
+        return codes.astype(np.uint8)
+
+
+def decode_timestamps(timestamps: pd.Series, filenames: Optional[pd.Series] = None) -> pd.Series:
+    """Vectorized parse_timestamp for a whole column, at millisecond precision.
+
+    The digits are decoded from a fixed-width byte view of the column instead of
+    calling strptime per row. Milliseconds come from the timestamp when it has
+    them, otherwise from a server.js file name (YYYYMMDDHHMMSSmmm.json) holding
+    the same second. Values that cannot be decoded become NaT.
+    """
+    n = len(timestamps)
+    chars = _timestamp_chars(timestamps)
+    digits = chars - np.uint8(ord('0'))  # wraps around for non-digits
+    is_digit = digits <= 9
+    lengths = (chars != 0).sum(axis=1)
+
+    has_time = lengths >= 14
+    valid = is_digit[:, :8].all(axis=1) & (~has_time | is_digit[:, 8:14].all(axis=1))
+    digits = np.where(is_digit, digits, 0)
+
+    year = _digits_to_int(digits[:, 0:4])
+    month = _digits_to_int(digits[:, 4:6])
+    day = _digits_to_int(digits[:, 6:8])
+    hours = np.where(has_time, _digits_to_int(digits[:, 8:10]), 0)
+    minutes = np.where(has_time, _digits_to_int(digits[:, 10:12]), 0)
+    secs = np.where(has_time, _digits_to_int(digits[:, 12:14]), 0)
+    valid &= (month >= 1) & (month <= 12) & (day >= 1) & (hours < 24) & (minutes < 60) & (secs < 60)
+    seconds = hours * 3600 + minutes * 60 + secs
+
+    ms = np.zeros(n, dtype=np.int64)
+    has_ms = (lengths >= 17) & is_digit[:, 14:17].all(axis=1)
+    ms[has_ms] = _digits_to_int(digits[has_ms, 14:17])
+
+    if filenames is not None:
+        name_chars = _timestamp_chars(filenames)
+        from_name = (
+            ~has_ms & has_time
+            & ((name_chars - np.uint8(ord('0'))) <= 9).all(axis=1)
+            & (name_chars[:, :14] == chars[:, :14]).all(axis=1)
+        )
+        ms[from_name] = _digits_to_int(name_chars[from_name, 14:17] - np.uint8(ord('0')))
+
+    month_start = (np.where(valid, year - 1970, 0) * 12 + np.where(valid, month - 1, 0)).astype('datetime64[M]')
+    days_in_month = ((month_start + 1).astype('datetime64[D]') - month_start.astype('datetime64[D]')).astype(np.int64)
+    valid &= day <= days_in_month
+
+    epoch_ms = (
+        (month_start.astype('datetime64[D]').astype(np.int64) + day - 1) * 86_400_000
+        + seconds * 1000 + ms
+    )
+    values = np.where(valid, epoch_ms, np.iinfo(np.int64).min).view('datetime64[ms]')
+    return pd.Series(values, index=timestamps.index)
+
+
+def add_time_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Decodes the timestamp column into datetime, date and hour columns."""
+    if df.empty or 'timestamp' not in df.columns:
+        return df
+
+    filenames = df['source_file'] if 'source_file' in df.columns else None
+    dt = decode_timestamps(df['timestamp'], filenames)
+
+    invalid = dt.isna() & df['timestamp'].notna()
+    if invalid.any():
+        print(f"Warning: dropping {int(invalid.sum())} events with unreadable timestamps")
+        df, dt = df[~invalid].reset_index(drop=True), dt[~invalid].reset_index(drop=True)
+
+    loc = df.columns.get_loc('source_file') if 'source_file' in df.columns else len(df.columns)
+    df.insert(loc, 'datetime', dt)
+    df.insert(loc + 1, 'date', dt.dt.date)
+    df.insert(loc + 2, 'hour', dt.dt.hour.astype('int64') if dt.notna().all() else dt.dt.hour)
+    return df
+
+
+def _append_event(columns: Dict[str, list], n_rows: int, event: dict) -> None:
+    for key in event:
+        if key not in columns:
+            columns[key] = [np.nan] * n_rows
+    for key, values in columns.items():
+        values.append(event.get(key, np.nan))
+
+
+def load_event_chunk(filepaths: List[str]) -> Tuple[Dict[str, list], int, List[str]]:
+    """Parses a chunk of event files into column lists (one list per field).
+
+    Timestamps are left as strings and decoded once per column afterwards.
+    Returns the columns, the number of rows and the paths that failed to parse.
+    """
+    columns: Dict[str, list] = {}
+    n_rows = 0
+    failed = []
+    for filepath in filepaths:
         try:
-            event = load_single_event(str(filepath))
-            events.append(event)
+            with open(filepath, 'r', encoding='utf-8') as f:
+                event = json.load(f)
         except Exception as e:
             print(f"Error loading {filepath}: {e}")
+            failed.append(filepath)
             continue
-    
+        event['source_file'] = os.path.basename(filepath)
 
-    df = pd.DataFrame(events)
-    
+        _append_event(columns, n_rows, event)
+        n_rows += 1
+
+    return columns, n_rows, failed
+
+
+def load_segment_range(path: str, start_offset: int = 0, end_offset: Optional[int] = None,
+                       closed: bool = False) -> Tuple[Dict[str, list], int, List[str], int]:
+    """Parses the NDJSON lines of a segment that start in [start_offset, end_offset).
 
+    The segment is scanned through a read-only memory map. A line belongs to
+    the range its first byte falls in, so adjacent ranges can be handed to
+    different workers. A trailing line without a newline is still being
+    written and is left for later, unless closed says the segment is no
+    longer written to. Returns the columns, the number of rows, the offsets
+    of unparsable lines and the offset to resume from.
+    """
+    columns: Dict[str, list] = {}
+    n_rows = 0
+    failed = []
+    name = os.path.basename(path)
+
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        end_offset = size if end_offset is None else min(end_offset, size)
+        if size == 0 or start_offset >= end_offset:
+            return columns, 0, failed, start_offset
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            pos = start_offset
+            if pos > 0 and buffer[pos - 1:pos] != b'\n':
+                newline = buffer.find(b'\n', pos)
+                pos = size if newline == -1 else newline + 1
+
+            while pos < end_offset:
+                newline = buffer.find(b'\n', pos)
+                if newline == -1:
+                    if not closed:
+                        break
+                    newline = size
+                line = buffer[pos:newline]
+                if line.strip():
+                    try:
+                        event = json.loads(line)
+                    except ValueError as e:
+                        print(f"Error loading {path} at byte {pos}: {e}")
+                        failed.append(f"{path}:{pos}")
+                    else:
+                        event['source_file'] = name
+                        _append_event(columns, n_rows, event)
+                        n_rows += 1
+                pos = newline + 1
+
+    return columns, n_rows, failed, pos
+
+
+def _run_task(kind: str, item) -> tuple:
+    if kind == 'ndjson':
+        return load_segment_range(*item)
+    return load_event_chunk(item)
+
+
+def load_event_files(paths: List[str], workers: int = 1,
+                     chunk_size: int = DEFAULT_CHUNK_SIZE) -> Tuple[pd.DataFrame, List[str]]:
+    """Parses the given event files (unsorted); returns the events and the failed paths."""
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+
+    merged: Dict[str, list] = {}
+    failed: List[str] = []
+    total = 0
+
+    def collect(results):
+        nonlocal total
+        for columns, n_rows, chunk_failed in results:
+            for key in columns:
+                if key not in merged:
+                    merged[key] = [np.nan] * total
+            for key, values in merged.items():
+                values.extend(columns.get(key, [np.nan] * n_rows))
+            total += n_rows
+            failed.extend(chunk_failed)
+
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            collect(executor.map(load_event_chunk, chunks))
+    else:
+        collect(map(load_event_chunk, chunks))
+
+    return add_time_columns(pd.DataFrame(merged)), failed
+
+
+def finalize_events(df: pd.DataFrame) -> pd.DataFrame:
+    """Sorts events by time and encodes the low-cardinality columns as categories."""
     if not df.empty:
 
         if 'datetime' in df.columns:
-            df = df.sort_values('datetime').reset_index(drop=True)
+            df = df.sort_values('datetime', kind='stable').reset_index(drop=True)
         
 
-        categorical_cols = ['event_type', 'page', 'element']
-        for col in categorical_cols:
+        for col in CATEGORICAL_COLUMNS:
             if col in df.columns:
                 df[col] = df[col].astype('category')
     
-    print(f"Loaded {len(df)} events into DataFrame")
     return df
 
 
-def get_latest_events(logs_dir: str, hours: int = 24) -> pd.DataFrame:
-    df = load_events_from_directory(logs_dir)
-    
-    if df.empty or 'datetime' not in df.columns:
+def _day_in_range(day: str, start: Optional[datetime], end: Optional[datetime]) -> bool:
+    try:
+        day_start = datetime.strptime(day, "%Y%m%d")
+    except ValueError:
+        return True
+    if start is not None and day_start + timedelta(days=1) <= start:
+        return False
+    if end is not None and day_start >= end:
+        return False
+    return True
+
+
+def _file_in_range(name: str, start_stamp: Optional[str], end_stamp: Optional[str]) -> bool:
+    """Checks a server.js file name (YYYYMMDDHHMMSS + ms) against the range.
+
+    Names without a timestamp are always kept.
+    """
+    match = FILE_STAMP_RE.match(name)
+    if not match:
+        return True
+    stamp = match.group(0).ljust(17, '0')
+    if start_stamp is not None and stamp < start_stamp:
+        return False
+    if end_stamp is not None and stamp >= end_stamp:
+        return False
+    return True
+
+
+def _to_stamp(moment: datetime) -> str:
+    # Event times have millisecond resolution, so round the bound up to a whole ms
+    moment = moment + timedelta(microseconds=-moment.microsecond % 1000)
+    return moment.strftime("%Y%m%d%H%M%S") + f"{moment.microsecond // 1000:03d}"
+
+
+def partition_source_files(path: str) -> set:
+    """Names of the raw event files already rolled into a compacted partition."""
+    import pyarrow.parquet as pq
+    return set(pq.read_table(path, columns=['source_file']).column(0).to_pylist())
+
+
+def _from_partition(df: pd.DataFrame) -> pd.DataFrame:
+    # Only the loader's usual categoricals stay dictionary-encoded in memory
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype) and col not in CATEGORICAL_COLUMNS:
+            values = df[col].astype(object)
+            df[col] = values.where(values.notna(), None)
+    if 'datetime' in df.columns:
+        dt = df['datetime'].astype('datetime64[ms]')
+        df['datetime'] = dt
+        loc = df.columns.get_loc('datetime') + 1
+        df.insert(loc, 'date', dt.dt.date)
+        df.insert(loc + 1, 'hour', dt.dt.hour.astype('int64'))
+    return df
+
+
+def read_partition(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Reads a compacted day partition with the same schema as the JSON loader."""
+    return _select_columns(_from_partition(pd.read_parquet(path, columns=_partition_columns(path, columns))),
+                           columns)
+
+
+def _partition_columns(path: str, columns: Optional[List[str]]) -> Optional[List[str]]:
+    if columns is None:
+        return None
+    import pyarrow.parquet as pq
+    stored = pq.read_schema(path).names
+    return [c for c in stored if c in columns or c == 'datetime']
+
+
+def _select_columns(df: pd.DataFrame, columns: Optional[List[str]]) -> pd.DataFrame:
+    if columns is None:
         return df
+    return df[[c for c in df.columns if c in columns or c == 'datetime']]
+
+
+def _filter_range(df: pd.DataFrame, start: Optional[datetime], end: Optional[datetime]) -> pd.DataFrame:
+    if not df.empty and 'datetime' in df.columns and (start is not None or end is not None):
+        mask = pd.Series(True, index=df.index)
+        if start is not None:
+            mask &= df['datetime'] >= start
+        if end is not None:
+            mask &= df['datetime'] < end
+        df = df[mask].reset_index(drop=True)
+    return df
+
+
+def _segment_in_range(name: str, start: Optional[datetime], end: Optional[datetime]) -> bool:
+    match = SEGMENT_NAME_RE.fullmatch(name)
+    if not match:
+        return True
+    hour_start = datetime.strptime(match.group(1), "%Y%m%d%H")
+    if start is not None and hour_start + timedelta(hours=1) <= start:
+        return False
+    if end is not None and hour_start >= end:
+        return False
+    return True
+
+
+def _is_event_source(name: str) -> bool:
+    return name.endswith('.json') or name.endswith(SEGMENT_SUFFIX)
+
+
+def _source_kind(name: str) -> str:
+    return 'ndjson' if name.endswith(SEGMENT_SUFFIX) else 'json'
+
+
+def _iter_sources(logs_path: Path, start: Optional[datetime] = None,
+                  end: Optional[datetime] = None) -> Iterator[Tuple[str, str]]:
+    """Yields ('json' | 'ndjson' | 'partition', path) folder by folder.
+
+    Files at the top level and the contents of non-day folders come first,
+    then the YYYYMMDD folders in date order. This is not strict time order:
+    non-day folders can hold any times, and in a compacted day the partition
+    comes before the raw files it does not hold, which may be earlier.
+    YYYYMMDD folders, files and hourly segments outside [start, end) are
+    skipped.
+    """
+    start_stamp = _to_stamp(start) if start is not None else None
+    end_stamp = _to_stamp(end) if end is not None else None
+
+    skipped = 0
+    day_folders = []
+    for entry in sorted(os.scandir(logs_path), key=lambda e: e.name):
+        if entry.is_dir():
+            if not DAY_FOLDER_RE.fullmatch(entry.name):
+                for p in sorted(str(p) for p in Path(entry.path).glob('**/*') if _is_event_source(p.name)):
+                    yield _source_kind(p), p
+            elif not _day_in_range(entry.name, start, end):
+                skipped += 1
+            else:
+                day_folders.append(entry.path)
+        elif _is_event_source(entry.name):
+            yield _source_kind(entry.name), entry.path
+
+    if skipped:
+        print(f"Skipped {skipped} day folders outside the requested range")
+
+    for folder in day_folders:
+        names = sorted(
+            e.name for e in os.scandir(folder)
+            if (e.name.endswith('.json') and _file_in_range(e.name, start_stamp, end_stamp))
+            or (e.name.endswith(SEGMENT_SUFFIX) and _segment_in_range(e.name, start, end))
+        )
+        partition = os.path.join(folder, PARTITION_FILE)
+        if os.path.exists(partition):
+            yield 'partition', partition
+            if names:
+                compacted = partition_source_files(partition)
+                names = [name for name in names if name not in compacted]
+        for name in names:
+            yield _source_kind(name), os.path.join(folder, name)
+
+
+def _plan_tasks(sources: Iterable[Tuple[str, str]], size: int) -> Iterator[Tuple[str, object]]:
+    """Groups consecutive JSON files into chunks of at most size files.
+
+    NDJSON segments are split into byte ranges holding roughly size events.
+    """
+    chunk = []
+    for kind, path in sources:
+        if kind == 'json':
+            chunk.append(path)
+            if len(chunk) == size:
+                yield 'json', chunk
+                chunk = []
+            continue
+
+        if chunk:
+            yield 'json', chunk
+            chunk = []
+        if kind == 'ndjson':
+            segment_size = os.path.getsize(path)
+            step = size * SEGMENT_BYTES_PER_EVENT
+            for offset in range(0, max(segment_size, 1), step):
+                yield 'ndjson', (path, offset, min(offset + step, segment_size))
+        else:
+            yield kind, path
+    if chunk:
+        yield 'json', chunk
+
+
+def _chunk_to_batch(result: tuple, start: Optional[datetime], end: Optional[datetime],
+                    columns: Optional[List[str]] = None) -> pd.DataFrame:
+    df = add_time_columns(pd.DataFrame(result[0]))
+    df = _filter_range(df, start, end)
+    return finalize_events(_select_columns(df, columns))
+
+
+def _iter_partition_batches(path: str, batch_size: int, start: Optional[datetime],
+                            end: Optional[datetime], columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    for record_batch in parquet_file.iter_batches(batch_size=batch_size,
+                                                  columns=_partition_columns(path, columns)):
+        df = _from_partition(record_batch.to_pandas())
+        df = _filter_range(df, start, end)
+        df = finalize_events(_select_columns(df, columns))
+        if not df.empty:
+            yield df
+
+
+def iter_event_batches(logs_dir: str, batch_size: int = DEFAULT_CHUNK_SIZE,
+                       start: Optional[datetime] = None, end: Optional[datetime] = None,
+                       workers: int = 1, columns: Optional[List[str]] = None,
+                       partition_batch_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """Yields the events under logs_dir as DataFrames of at most batch_size rows.
+
+    Batches follow the folder order of _iter_sources: day by day, and by
+    file name (a timestamp, for server.js) within a day, but not strictly in
+    time order, since files outside day folders come first and raw files
+    left next to a day's partition come after it. Each batch is sorted, but
+    callers that need the whole stream in time order must sort it, as
+    load_events_from_directory does. Only one batch per worker is held in
+    memory at a time, so peak memory depends on batch_size rather than on
+    the size of the log directory.
+    Compacted day partitions and hourly NDJSON segments are read alongside
+    raw JSON files; segments are split into byte ranges across workers. With
+    columns set only those columns (plus datetime) are read from partitions
+    and returned, in batches of partition_batch_size rows (default batch_size).
+    With workers > 1 JSON chunks and segment ranges are parsed ahead in a
+    process pool.
+    """
+    logs_path = Path(logs_dir)
+    if not logs_path.exists():
+        print(f"Warning: Logs directory not found: {logs_dir}")
+        return
+
+    tasks = _plan_tasks(_iter_sources(logs_path, start, end), batch_size)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    pending = deque()
+
+    def drain(limit: int) -> Iterator[pd.DataFrame]:
+        while len(pending) > limit:
+            batch = _chunk_to_batch(pending.popleft().result(), start, end, columns)
+            if not batch.empty:
+                yield batch
+
+    try:
+        for kind, item in tasks:
+            if kind == 'partition':
+                yield from drain(0)
+                yield from _iter_partition_batches(item, partition_batch_size or batch_size,
+                                                   start, end, columns)
+            elif executor is None:
+                batch = _chunk_to_batch(_run_task(kind, item), start, end, columns)
+                if not batch.empty:
+                    yield batch
+            else:
+                pending.append(executor.submit(_run_task, kind, item))
+                yield from drain(workers * 2 - 1)
+        yield from drain(0)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def load_events_from_directory(logs_dir: str, workers: int = 1,
+                               chunk_size: int = DEFAULT_CHUNK_SIZE,
+                               start: Optional[datetime] = None,
+                               end: Optional[datetime] = None,
+                               columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Loads event files under logs_dir, optionally limited to [start, end).
+
+    Concatenates the batches of iter_event_batches and sorts them by time,
+    so the batch order does not matter; compacted partitions and raw JSON
+    files are both read and columns can be projected. With a time range,
+    YYYYMMDD folders outside it are skipped without being opened and
+    boundary-day files are pruned by the timestamp in their name. With
+    workers > 1 the chunks of chunk_size files are parsed in a process pool;
+    the resulting DataFrame is identical to the serial load.
+    """
+    if not Path(logs_dir).exists():
+        print(f"Warning: Logs directory not found: {logs_dir}")
+        return pd.DataFrame()
+
+    batches = list(iter_event_batches(logs_dir, chunk_size, start, end, workers, columns,
+                                      partition_batch_size=FULL_LOAD_PARTITION_BATCH))
+    
+    if not batches:
+        print(f"Warning: No events found in {logs_dir}")
+        return pd.DataFrame()
     
+
+    df = finalize_events(pd.concat(batches, ignore_index=True))
+    
+    print(f"Loaded {len(df)} events into DataFrame")
+    return df
+
+
+def _read_manifest(cache_path: Path) -> dict:
+    manifest_path = cache_path / MANIFEST_NAME
+    if manifest_path.exists():
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == CHECKPOINT_VERSION:
+            return manifest
+    return _empty_manifest()
+
+
+def _empty_manifest() -> dict:
+    return {'version': CHECKPOINT_VERSION, 'folders': {}, 'segments': [], 'next_segment': 0}
+
+
+def _write_manifest(cache_path: Path, manifest: dict) -> None:
+    tmp_path = cache_path / (MANIFEST_NAME + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, cache_path / MANIFEST_NAME)
+
+
+@contextmanager
+def _checkpoint_lock(cache_path: Path) -> Iterator[None]:
+    """Holds an exclusive lock on the checkpoint; generate, train and the refresh worker all share it."""
+    with open(cache_path / LOCK_NAME, 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after about 10 seconds; keep waiting
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _scan_new_files(folder: Path, rel: str, folders: dict, found: dict, touched: dict) -> None:
+    """Collects JSON files, compacted partitions and segment tails not yet ingested.
+
+    Folders whose mtime is unchanged are not listed again; only their recorded
+    subfolders are visited and their known NDJSON segments checked for growth.
+    JSON files are new when their mtime is past the folder's watermark (or
+    equal to it under a name not recorded at the watermark). More files at or
+    below the watermark than were listed last time means one arrived with an
+    old mtime; those folders are listed in found['relisted'] to be checked by name.
+    """
+    state = folders.get(rel, {})
+    mtime_ns = folder.stat().st_mtime_ns
+    offsets = state.get('segments', {})
+
+    if state.get('mtime_ns') == mtime_ns:
+        subdirs = state.get('dirs', [])
+        for name, offset in offsets.items():
+            path = os.path.join(folder, name)
+            if os.path.exists(path) and os.path.getsize(path) > offset:
+                found['segments'].append((rel, path, offset))
+    else:
+        watermark = state.get('watermark_ns', -1)
+        at_watermark = set(state.get('at_watermark', []))
+        retry = set(state.get('retry', []))
+        compacted: set = set()
+        partition_mtime_ns = state.get('partition_mtime_ns')
+        subdirs, listed, segments = [], [], []
+        for entry in os.scandir(folder):
+            if entry.is_dir():
+                subdirs.append(entry.name)
+            elif entry.name == PARTITION_FILE:
+                partition_mtime_ns = entry.stat().st_mtime_ns
+                if partition_mtime_ns != state.get('partition_mtime_ns'):
+                    found['partitions'].append((rel, entry.path))
+                compacted = partition_source_files(entry.path)
+            elif entry.name.endswith('.json'):
+                listed.append((entry.name, entry.stat().st_mtime_ns))
+            elif entry.name.endswith(SEGMENT_SUFFIX):
+                segments.append(entry)
+
+        fresh = [name for name, mtime in listed
+                 if mtime > watermark or (mtime == watermark and name not in at_watermark) or name in retry]
+        if len(listed) - len(fresh) > state.get('file_count', 0):
+            fresh_names = set(fresh)
+            found['relisted'].append((rel, [os.path.join(folder, name) for name, _ in listed
+                                            if name not in fresh_names and name not in compacted]))
+        found['files'].extend(sorted(os.path.join(folder, name) for name in fresh if name not in compacted))
+        for entry in sorted(segments, key=lambda e: e.name):
+            offset = offsets.get(entry.name, 0)
+            if entry.name not in compacted and entry.stat().st_size > offset:
+                found['segments'].append((rel, entry.path, offset))
+
+        new_watermark = max([watermark] + [mtime for _, mtime in listed])
+        touched[rel] = {
+            'mtime_ns': mtime_ns,
+            'dirs': sorted(subdirs),
+            'partition_mtime_ns': partition_mtime_ns,
+            'watermark_ns': new_watermark,
+            'at_watermark': sorted(name for name, mtime in listed if mtime == new_watermark),
+            'file_count': len(listed),
+        }
+
+    for name in sorted(subdirs):
+        child = folder / name
+        if child.is_dir():
+            _scan_new_files(child, name if rel == '.' else f"{rel}/{name}", folders, found, touched)
+
+
+def _segment_entry(name: str, df: pd.DataFrame) -> dict:
+    dated = df['datetime'].dropna() if 'datetime' in df.columns else pd.Series(dtype='datetime64[ms]')
+    return {
+        'name': name,
+        'rows': len(df),
+        'first': dated.iloc[0].isoformat() if not dated.empty else None,
+        'last': dated.iloc[-1].isoformat() if not dated.empty else None,
+        'undated': len(dated) < len(df),
+    }
+
+
+def _follows(earlier: dict, later: dict) -> bool:
+    """Whether the later segment's events all sort after the earlier one's, so the two need no re-sort."""
+    if earlier['first'] is None:
+        return False
+    return not earlier['undated'] and (later['first'] is None or later['first'] >= earlier['last'])
+
+
+def _concat_in_order(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenates event tables that already follow each other in time, without sorting again.
+
+    The categorical columns are unioned directly rather than going through
+    object columns, with categories sorted as finalize_events would.
+    """
+    if len(frames) == 1:
+        return frames[0]
+    categorical = [col for col in CATEGORICAL_COLUMNS
+                   if all(isinstance(frame[col].dtype, pd.CategoricalDtype) for frame in frames if col in frame.columns)
+                   and all(col in frame.columns for frame in frames)]
+    columns = list(dict.fromkeys(col for frame in frames for col in frame.columns))
+    df = pd.concat([frame.drop(columns=categorical) for frame in frames], ignore_index=True)
+    for col in categorical:
+        df[col] = union_categoricals([frame[col] for frame in frames], sort_categories=True)
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and col not in categorical:
+            df[col] = df[col].astype('category')
+    return df[columns]
+
+
+def _write_segment(cache_path: Path, manifest: dict, df: pd.DataFrame) -> dict:
+    name = f"segment-{manifest['next_segment']:06d}.pkl"
+    manifest['next_segment'] += 1
+    tmp_path = cache_path / (name + '.tmp')
+    df.to_pickle(tmp_path)
+    os.replace(tmp_path, cache_path / name)
+    return _segment_entry(name, df)
+
+
+def load_events_incremental(logs_dir: str, cache_dir: str, full_rebuild: bool = False,
+                            workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE) -> pd.DataFrame:
+    """Loads events using a checkpoint in cache_dir so only new files are parsed.
+
+    The manifest records, per folder, its mtime (unchanged folders are not
+    even listed), an mtime watermark for the JSON files already ingested and
+    the byte offset reached in each NDJSON segment, so appended lines resume
+    from there. The cached events are kept as time-ordered pickled segments:
+    new events that all come after the cached ones are appended as a new
+    segment, and later ones are merged into just the segments they overlap.
+    Loading therefore only concatenates the segments, and a run that finds
+    nothing new neither sorts nor rewrites anything. Runs sharing cache_dir
+    take turns through a lock file. full_rebuild discards the cache.
+    """
+    logs_path = Path(logs_dir)
+    cache_path = Path(cache_dir)
+    cache_path.mkdir(parents=True, exist_ok=True)
+
+    if not logs_path.exists():
+        print(f"Warning: Logs directory not found: {logs_dir}")
+        return pd.DataFrame()
+
+    with _checkpoint_lock(cache_path):
+        manifest = _read_manifest(cache_path)
+        stale_segments = []
+        if full_rebuild:
+            print("Full rebuild requested, discarding cached events")
+            stale_segments = [segment['name'] for segment in manifest['segments']]
+            manifest = _empty_manifest()
+
+        found = {'files': [], 'partitions': [], 'segments': [], 'relisted': []}
+        touched: Dict[str, dict] = {}
+        _scan_new_files(logs_path, '.', manifest['folders'], found, touched)
+        print(f"Found {len(found['files'])} new event files, {len(found['segments'])} growing segments "
+              f"and {len(found['partitions'])} new partitions")
+
+        frames = [pd.read_pickle(cache_path / segment['name']) for segment in manifest['segments']]
+        cached_sources = None
+        if found['partitions'] or found['relisted']:
+            # Rarely needed: which sources the cache holds, and how many events of each
+            cached_sources = (pd.concat([frame['source_file'] for frame in frames], ignore_index=True).value_counts()
+                              if frames else pd.Series(dtype=np.int64))
+
+        new_frames = []
+        for rel, path in found['partitions']:
+            # Events of files and segments ingested earlier in raw form are skipped, by count per source
+            partition = read_partition(path)
+            ingested = partition['source_file'].map(cached_sources).fillna(0)
+            partition = partition[partition.groupby('source_file', sort=False).cumcount() >= ingested]
+            new_frames.append(partition)
+
+        new_files = list(found['files'])
+        for rel, paths in found['relisted']:
+            missing = [path for path in paths if os.path.basename(path) not in cached_sources.index]
+            if missing:
+                print(f"  {len(missing)} files in {rel} arrived with an old mtime")
+            new_files.extend(missing)
+
+        segment_offsets = []
+        for rel, path, offset in found['segments']:
+            columns, _, _, next_offset = load_segment_range(path, offset)
+            new_frames.append(add_time_columns(pd.DataFrame(columns)))
+            segment_offsets.append((rel, os.path.basename(path), next_offset))
+
+        failed: set = set()
+        if new_files:
+            df_files, failed_paths = load_event_files(new_files, workers, chunk_size)
+            failed = set(failed_paths)
+            new_frames.append(df_files)
+
+        changed = bool(touched or segment_offsets or stale_segments)
+        for rel, state in touched.items():
+            folder_state = manifest['folders'].setdefault(rel, {})
+            folder_state.update(state)
+            folder_state['retry'] = []
+        for rel, name, next_offset in segment_offsets:
+            manifest['folders'][rel].setdefault('segments', {})[name] = next_offset
+        for path in sorted(failed):
+            # Unreadable files (e.g. still being written) are retried next run
+            rel = os.path.relpath(os.path.dirname(path), logs_path).replace(os.sep, '/')
+            manifest['folders'][rel]['retry'].append(os.path.basename(path))
+            manifest['folders'][rel]['mtime_ns'] = None
+
+        new_frames = [frame for frame in new_frames if not frame.empty]
+        if new_frames:
+            new = finalize_events(pd.concat(new_frames, ignore_index=True))
+            entry = _segment_entry(None, new)
+            # Segments the new events overlap are merged with them; earlier ones stay as they are
+            keep = len(manifest['segments'])
+            while keep > 0 and not _follows(manifest['segments'][keep - 1], entry):
+                keep -= 1
+            if keep < len(manifest['segments']):
+                new = finalize_events(pd.concat(frames[keep:] + [new], ignore_index=True))
+                stale_segments += [segment['name'] for segment in manifest['segments'][keep:]]
+            manifest['segments'] = manifest['segments'][:keep] + [_write_segment(cache_path, manifest, new)]
+            frames = frames[:keep] + [new]
+
+        if len(manifest['segments']) > MAX_CACHE_SEGMENTS:
+            # All but the newest segment become one, which new events rarely overlap
+            stale_segments += [segment['name'] for segment in manifest['segments'][:-1]]
+            frames = [_concat_in_order(frames[:-1]), frames[-1]]
+            manifest['segments'] = [_write_segment(cache_path, manifest, frames[0]), manifest['segments'][-1]]
+
+        if changed or new_frames:
+            _write_manifest(cache_path, manifest)
+            # Also clears segments left by an older checkpoint version or an interrupted run
+            listed = {segment['name'] for segment in manifest['segments']}
+            stale_segments += [path.name for path in cache_path.glob('segment-*.pkl') if path.name not in listed]
+        for segment in set(stale_segments):
+            (cache_path / segment).unlink(missing_ok=True)
+
+    df = _concat_in_order(frames) if frames else pd.DataFrame()
+    print(f"Loaded {len(df)} events into DataFrame")
+    return df
+
+
+def get_latest_events(logs_dir: str, hours: int = 24) -> pd.DataFrame:
     cutoff = datetime.now() - pd.Timedelta(hours=hours)
-    return df[df['datetime'] >= cutoff].reset_index(drop=True)
+    return load_events_from_directory(logs_dir, start=cutoff)
 
 
 if __name__ == '__main__':
@@ -95,11 +871,12 @@ if __name__ == '__main__':
     import sys
     
     logs_dir = sys.argv[1] if len(sys.argv) > 1 else '../logs'
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 1
     
     print(f"\n=== Testing Log Parser ===")
     print(f"Logs directory: {logs_dir}\n")
     
-    df = load_events_from_directory(logs_dir)
+    df = load_events_from_directory(logs_dir, workers=workers)
     
     if not df.empty:
         print(f"\nDataFrame shape: {df.shape}")
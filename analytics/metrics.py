@@ -1,11 +1,37 @@
 """Metrics calculation from event data."""
 
+import numpy as np
 import pandas as pd
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 
+from .sketches import DEFAULT_CAPACITY, DEFAULT_PRECISION, HeavyHitters, HyperLogLog, hash_values
+from .timeseries import floor_times, resolve_granularity
 
-def calculate_general_metrics(df: pd.DataFrame) -> Dict[str, Any]:
+
+# The one definition of these events and of the funnel; the aggregates, sessions, cube
+# and SQL paths all import them from here
+ADD_TO_CART_ELEMENTS = ['add_to_cart_button', 'add_to_cart_detail_btn']
+VIEW_DETAILS_ELEMENT = 'view_details_button'
+
+# Funnel stages as (name, column, matching values), in the order the ordered funnel requires
+ORDERED_FUNNEL_STEPS = [
+    ('home_visits', 'page', ['home']),
+    ('product_views', 'page', ['product']),
+    ('add_to_cart', 'element', ADD_TO_CART_ELEMENTS),
+    ('cart_visits', 'page', ['cart']),
+]
+
+# Bit per funnel stage, in the order calculate_conversion_funnel reports them
+FUNNEL_BITS = {name: 1 << i for i, (name, _, _) in enumerate(ORDERED_FUNNEL_STEPS)}
+DEFAULT_FUNNEL_MAX_GAP = pd.Timedelta(minutes=30)
+
+# Past this many hour buckets the hourly counts are taken with np.unique instead of bincount
+MAX_DENSE_HOURS = 10_000_000
+
+
+def calculate_general_metrics(df: pd.DataFrame, approximate: bool = False,
+                              precision: int = DEFAULT_PRECISION) -> Dict[str, Any]:
     if df.empty:
         return {
             'total_events': 0,
@@ -20,7 +46,7 @@ def calculate_general_metrics(df: pd.DataFrame) -> Dict[str, Any]:
         'total_events': len(df),
         'total_page_visits': len(df[df['event_type'] == 'page_visit']),
         'total_clicks': len(df[df['event_type'] == 'click']),
-        'unique_users': df['user_id'].nunique(),
+        'unique_users': HyperLogLog.from_values(df['user_id'].dropna(), precision).count() if approximate else df['user_id'].nunique(),
         'events_by_type': df['event_type'].value_counts().to_dict(),
         'events_by_page': df['page'].value_counts().to_dict()
     }
@@ -51,7 +77,8 @@ def calculate_time_metrics(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
     }
 
 
-def calculate_ecommerce_metrics(df: pd.DataFrame) -> Dict[str, Any]:
+def calculate_ecommerce_metrics(df: pd.DataFrame, approximate: bool = False,
+                                capacity: int = DEFAULT_CAPACITY) -> Dict[str, Any]:
     if df.empty:
         return {
             'add_to_cart_count': 0,
@@ -60,8 +87,12 @@ def calculate_ecommerce_metrics(df: pd.DataFrame) -> Dict[str, Any]:
             'top_products_added': []
         }
     
+    if approximate:
+        return ecommerce_from_heavy_hitters(product_heavy_hitters(df, capacity),
+                                            int(df['element'].isin(ADD_TO_CART_ELEMENTS).sum()))
+    
 
-    add_to_cart_df = df[df['element'].isin(['add_to_cart_button', 'add_to_cart_detail_btn'])]
+    add_to_cart_df = df[df['element'].isin(ADD_TO_CART_ELEMENTS)]
     add_to_cart_count = len(add_to_cart_df)
     
 
@@ -90,35 +121,127 @@ def calculate_ecommerce_metrics(df: pd.DataFrame) -> Dict[str, Any]:
     }
 
 
-def calculate_conversion_funnel(df: pd.DataFrame) -> Dict[str, int]:
-    if df.empty:
-        return {
-            'home_visits': 0,
-            'product_views': 0,
-            'add_to_cart': 0,
-            'cart_visits': 0
-        }
-    
+def product_heavy_hitters(df: pd.DataFrame, capacity: Optional[int] = DEFAULT_CAPACITY) -> Dict[str, HeavyHitters]:
+    """Bounded summaries of added-to-cart and viewed products for one batch of events.
 
-    home_visitors = set(df[df['page'] == 'home']['user_id'].unique())
-    
+    Summaries of successive batches or of separate partitions merge with
+    HeavyHitters.merge; capacity=None counts every product exactly.
+    """
+    added = HeavyHitters(capacity)
+    viewed = HeavyHitters(capacity)
+    if not df.empty and 'product_id' in df.columns:
+        added.update(df.loc[df['element'].isin(ADD_TO_CART_ELEMENTS), 'product_id'])
+        viewed.update(df.loc[df['element'] == VIEW_DETAILS_ELEMENT, 'product_id'])
+    return {'added': added, 'viewed': viewed}
 
-    product_viewers = set(df[df['page'] == 'product']['user_id'].unique())
-    
 
-    add_to_cart_users = set(df[df['element'].isin(['add_to_cart_button', 'add_to_cart_detail_btn'])]['user_id'].unique())
-    
+def calculate_top_products(summaries: Dict[str, HeavyHitters], k: int = 10) -> Dict[str, pd.DataFrame]:
+    """Top-k added and viewed products; true counts lie between the count and max_count columns."""
+    top_added = summaries['added'].top(k).rename(columns={'item': 'product_id', 'count': 'add_to_cart_count'})
+    top_viewed = summaries['viewed'].top(k).rename(columns={'item': 'product_id', 'count': 'view_count'})
+    return {'top_added': top_added, 'top_viewed': top_viewed}
 
-    cart_visitors = set(df[df['page'] == 'cart']['user_id'].unique())
-    
+
+def ecommerce_from_heavy_hitters(summaries: Dict[str, HeavyHitters], add_to_cart_count: int) -> Dict[str, Any]:
+    """The calculate_ecommerce_metrics layout from product summaries instead of full group tables.
+
+    The by-product tables hold the products the summaries track (at most
+    their capacity each), with a max_count column bounding the true counts.
+    """
+    tracked = max(len(summaries['added'].counts), len(summaries['viewed'].counts))
+    top = calculate_top_products(summaries, k=tracked)
     return {
-        'home_visits': len(home_visitors),
-        'product_views': len(product_viewers),
-        'add_to_cart': len(add_to_cart_users),
-        'cart_visits': len(cart_visitors)
+        'add_to_cart_count': add_to_cart_count,
+        'add_to_cart_by_product': top['top_added'],
+        'view_details_by_product': top['top_viewed'],
+        'top_products_added': top['top_added'].head(10)['product_id'].tolist()
     }
 
 
+def calculate_conversion_funnel(df: pd.DataFrame, approximate: bool = False,
+                                precision: int = DEFAULT_PRECISION) -> Dict[str, int]:
+    if df.empty:
+        return {stage: 0 for stage, _, _ in ORDERED_FUNNEL_STEPS}
+    
+    if approximate:
+        return {stage: HyperLogLog.from_values(df.loc[df[column].isin(values), 'user_id'], precision).count()
+                for stage, column, values in ORDERED_FUNNEL_STEPS}
+    
+
+    # Sets of the raw ids, so missing ids count as one more user like the bincount path
+    return {stage: len(set(df.loc[df[column].isin(values), 'user_id'].unique()))
+            for stage, column, values in ORDERED_FUNNEL_STEPS}
+
+
+def calculate_ordered_funnel(df: pd.DataFrame, steps: Optional[List[Tuple[str, str, list]]] = None,
+                             max_gap: Optional[pd.Timedelta] = DEFAULT_FUNNEL_MAX_GAP,
+                             by: str = 'user_id') -> Dict[str, int]:
+    """Counts the users (or sessions, with by='session_id') that complete each step in order.
+
+    A step counts when one of its events comes after a counted event of the
+    previous step of the same user, at most max_gap later (None for no limit).
+    Works on arrays sorted by user and time: for every candidate event the
+    latest qualifying event of the previous step is found with searchsorted.
+    """
+    reached, _ = _ordered_funnel_codes(df, steps, max_gap, by)
+    return {name: len(codes) for name, codes in reached.items()}
+
+
+def ordered_funnel_units(df: pd.DataFrame, steps: Optional[List[Tuple[str, str, list]]] = None,
+                         max_gap: Optional[pd.Timedelta] = DEFAULT_FUNNEL_MAX_GAP,
+                         by: str = 'user_id') -> Dict[str, pd.Index]:
+    """The users (or sessions) that calculate_ordered_funnel counts at each step."""
+    reached, units = _ordered_funnel_codes(df, steps, max_gap, by)
+    return {name: units[codes] for name, codes in reached.items()}
+
+
+def _ordered_funnel_codes(df: pd.DataFrame, steps: Optional[List[Tuple[str, str, list]]],
+                          max_gap: Optional[pd.Timedelta], by: str) -> Tuple[Dict[str, np.ndarray], pd.Index]:
+    steps = steps or ORDERED_FUNNEL_STEPS
+    reached_units = {name: np.empty(0, dtype=np.int64) for name, _, _ in steps}
+    if df.empty:
+        return reached_units, pd.Index([])
+
+    column_codes = {}
+    step_masks = []
+    for _, column, values in steps:
+        if column not in column_codes:
+            column_codes[column] = _codes(df[column])
+        codes, labels = column_codes[column]
+        step_masks.append(_lookup(labels, values)[codes].view(bool))
+
+    rows = np.flatnonzero(np.logical_or.reduce(step_masks) & df['datetime'].notna().to_numpy())
+    # Codes of the whole column: cheaper than taking the object values of the rows first
+    unit_codes, units = _codes(df[by])
+    unit_codes = unit_codes[rows]
+    rows, unit_codes = rows[unit_codes >= 0], unit_codes[unit_codes >= 0]
+    if len(rows) == 0:
+        return reached_units, units
+
+    times = df['datetime'].to_numpy()[rows].astype('datetime64[ns]').view('i8')
+    order = unit_time_order(unit_codes, len(units), times)
+    unit_codes, times = unit_codes[order], times[order]
+    rows = rows[order]
+    gap = np.iinfo(np.int64).max if max_gap is None else pd.Timedelta(max_gap).value
+
+    reached = None
+    for (name, _, _), mask in zip(steps, step_masks):
+        candidates = np.flatnonzero(mask[rows])
+        if reached is not None:
+            # Latest event of the previous step strictly before each candidate
+            previous = np.searchsorted(reached, candidates, side='left') - 1
+            ok = previous >= 0
+            previous = reached[np.maximum(previous, 0)]
+            ok &= (unit_codes[previous] == unit_codes[candidates]) & (times[candidates] - times[previous] <= gap)
+            candidates = candidates[ok]
+        reached = candidates
+        reached_units[name] = np.flatnonzero(np.bincount(unit_codes[reached], minlength=len(units)))
+        if len(reached) == 0:
+            break
+
+    return reached_units, units
+
+
 def get_events_by_type_df(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
         return pd.DataFrame(columns=['event_type', 'count'])
@@ -136,22 +259,19 @@ def get_events_by_page_df(df: pd.DataFrame) -> pd.DataFrame:
 
 
 def get_events_over_time_df(df: pd.DataFrame, granularity: str = 'hour') -> pd.DataFrame:
+    """Event counts per minute, hour, day, week or month, grouped without copying the frame.
+
+    Any other granularity falls back to daily buckets (see timeseries.resolve_granularity).
+    """
     if df.empty or 'datetime' not in df.columns:
         return pd.DataFrame(columns=['datetime', 'count'])
-    
-    df_copy = df.copy()
-    
-    if granularity == 'hour':
-        df_copy['time_bucket'] = df_copy['datetime'].dt.floor('H')
-    else:  # day
-        df_copy['time_bucket'] = df_copy['datetime'].dt.floor('D')
-    
-    result = df_copy.groupby('time_bucket').size().reset_index(name='count')
-    result.columns = ['datetime', 'count']
-    return result
+
+    buckets = floor_times(df['datetime'], resolve_granularity(granularity)).rename('datetime')
+    return buckets.groupby(buckets).size().reset_index(name='count')
 
 
-def calculate_all_metrics(df: pd.DataFrame) -> Dict[str, Any]:
+def calculate_all_metrics_by_parts(df: pd.DataFrame) -> Dict[str, Any]:
+    """Reference implementation: one call per metric group, each with its own scans."""
     return {
         'general': calculate_general_metrics(df),
         'time': calculate_time_metrics(df),
@@ -160,6 +280,201 @@ def calculate_all_metrics(df: pd.DataFrame) -> Dict[str, Any]:
     }
 
 
+def stable_order(codes: np.ndarray, n_codes: int) -> np.ndarray:
+    """Stable argsort of non-negative codes as 16-bit radix passes: linear time, unlike a merge sort."""
+    # Category codes can be int8 or int16, too narrow for the masks below
+    codes = codes.astype(np.int64, copy=False)
+    order = np.argsort((codes & 0xFFFF).astype(np.uint16), kind='stable')
+    if n_codes > 0xFFFF:
+        order = order[np.argsort((codes[order] >> 16).astype(np.uint16), kind='stable')]
+    if n_codes > 0xFFFFFFFF:
+        order = order[np.argsort(codes[order] >> 32, kind='stable')]
+    return order
+
+
+def unit_time_order(unit_codes: np.ndarray, n_units: int, times: np.ndarray) -> np.ndarray:
+    """Order of rows by unit (user or session), then time.
+
+    Events from log_parser are already in time order, so a stable radix sort
+    on the unit codes is enough; other input falls back to a lexsort.
+    """
+    if (np.diff(times) >= 0).all():
+        return stable_order(unit_codes, n_units)
+    return np.lexsort((times, unit_codes))
+
+
+def counts_df(counts: Dict[Any, int], key_col: str, count_col: str = 'count') -> pd.DataFrame:
+    """A table of counts per key, built in key order like a groupby and then sorted by count."""
+    if not counts:
+        return pd.DataFrame(columns=[key_col, count_col])
+    table = pd.DataFrame(sorted(counts.items()), columns=[key_col, count_col])
+    return table.sort_values(count_col, ascending=False)
+
+
+def _codes(series: pd.Series, use_na_sentinel: bool = True) -> Tuple[np.ndarray, pd.Index]:
+    """Integer codes and their labels; categoricals are used as they are, without a pass."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        if not use_na_sentinel and (codes < 0).any():
+            codes = np.where(codes < 0, len(series.cat.categories), codes)
+            return codes, series.cat.categories.insert(len(series.cat.categories), np.nan)
+        return codes, series.cat.categories
+    codes, uniques = pd.factorize(series, use_na_sentinel=use_na_sentinel)
+    return codes, pd.Index(uniques)
+
+
+def _lookup(labels: pd.Index, values, bit: int = 1) -> np.ndarray:
+    """Per-code table of `bit` for labels in values; the extra last slot maps code -1 (NaN)."""
+    table = np.zeros(len(labels) + 1, dtype=np.uint8)
+    table[:-1][np.asarray(labels.isin(values))] = bit
+    return table
+
+
+def _value_counts_dict(counts: np.ndarray, labels: pd.Index, categorical: bool) -> Dict[Any, int]:
+    # Rebuilt in the order value_counts finds them so ties come out in the same order
+    if not categorical:
+        present = counts > 0
+        counts, labels = counts[present], labels[present]
+    return pd.Series(counts, index=labels).sort_values(ascending=False).to_dict()
+
+
+def _by_product(products: pd.Series, mask: np.ndarray, count_col: str) -> pd.DataFrame:
+    if not mask.any() or products is None:
+        return pd.DataFrame(columns=['product_id', count_col])
+    selected = products[mask]
+    codes, uniques = pd.factorize(selected, sort=True)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    present = counts > 0
+    result = pd.DataFrame({'product_id': np.asarray(uniques)[present], count_col: counts[present]})
+    return result.sort_values(count_col, ascending=False)
+
+
+def _sketch(hashes: np.ndarray, precision: int) -> HyperLogLog:
+    sketch = HyperLogLog(precision)
+    sketch.add_hashes(hashes)
+    return sketch
+
+
+def _time_metrics(datetimes: pd.Series) -> Dict[str, pd.DataFrame]:
+    values = datetimes.to_numpy()
+    unit = np.datetime_data(values.dtype)[0]
+    per_hour = int(np.timedelta64(1, 'h') / np.timedelta64(1, unit))
+
+    ticks = values.view('i8')
+    valid = ~np.isnat(values)
+    if not valid.all():
+        ticks = ticks[valid]
+    if len(ticks) == 0:
+        return calculate_time_metrics(datetimes.to_frame())
+
+    hours = ticks // per_hour
+    first, last = hours.min(), hours.max()
+    if last - first < MAX_DENSE_HOURS:
+        counts = np.bincount(hours - first)
+        hour_ids = np.flatnonzero(counts) + first
+        counts = counts[counts > 0]
+    else:
+        hour_ids, counts = np.unique(hours, return_counts=True)
+
+    events_per_hour = pd.DataFrame({
+        'datetime': (hour_ids * per_hour).astype(values.dtype),
+        'event_count': counts.astype(np.int64)
+    })
+
+    # Day totals come from the hour buckets, not another pass over the events
+    day_ids, day_index = np.unique(hour_ids // 24, return_inverse=True)
+    day_counts = np.bincount(day_index, weights=counts).astype(np.int64)
+    events_per_day = pd.DataFrame({
+        'date': pd.DatetimeIndex((day_ids * 24 * per_hour).astype(values.dtype)).date,
+        'event_count': day_counts
+    })
+
+    return {
+        'events_per_hour': events_per_hour,
+        'events_per_day': events_per_day
+    }
+
+
+def calculate_all_metrics(df: pd.DataFrame, approximate: bool = False,
+                          precision: int = DEFAULT_PRECISION, capacity: int = DEFAULT_CAPACITY) -> Dict[str, Any]:
+    """Every metric group in one pass over integer codes, with no copies of the frame.
+
+    Returns exactly what calculate_all_metrics_by_parts returns. With
+    approximate=True unique_users and the funnel stages come from HyperLogLog
+    sketches (relative standard error 1.04 / sqrt(2**precision)) instead of
+    exact distinct counts, and the by-product tables from heavy-hitter
+    summaries of at most capacity products instead of full group tables.
+    """
+    if df.empty:
+        return calculate_all_metrics_by_parts(df)
+
+    type_codes, types = _codes(df['event_type'])
+    page_codes, pages = _codes(df['page'])
+    element_codes, elements = _codes(df['element'])
+
+    type_counts = np.bincount(type_codes[type_codes >= 0], minlength=len(types))
+    page_counts = np.bincount(page_codes[page_codes >= 0], minlength=len(pages))
+    type_index = {label: i for i, label in enumerate(types)}
+
+    general = {
+        'total_events': len(df),
+        'total_page_visits': int(type_counts[type_index['page_visit']]) if 'page_visit' in type_index else 0,
+        'total_clicks': int(type_counts[type_index['click']]) if 'click' in type_index else 0,
+        'unique_users': 0,
+        'events_by_type': _value_counts_dict(type_counts, types, isinstance(df['event_type'].dtype, pd.CategoricalDtype)),
+        'events_by_page': _value_counts_dict(page_counts, pages, isinstance(df['page'].dtype, pd.CategoricalDtype))
+    }
+
+    add_to_cart = _lookup(elements, ADD_TO_CART_ELEMENTS)[element_codes].view(bool)
+    view_details = _lookup(elements, [VIEW_DETAILS_ELEMENT])[element_codes].view(bool)
+    products = df['product_id'] if 'product_id' in df.columns else None
+    if approximate:
+        summaries = {'added': HeavyHitters(capacity), 'viewed': HeavyHitters(capacity)}
+        if products is not None:
+            summaries['added'].update(products[add_to_cart])
+            summaries['viewed'].update(products[view_details])
+        ecommerce = ecommerce_from_heavy_hitters(summaries, int(add_to_cart.sum()))
+    else:
+        add_to_cart_by_product = _by_product(products, add_to_cart, 'add_to_cart_count')
+        ecommerce = {
+            'add_to_cart_count': int(add_to_cart.sum()),
+            'add_to_cart_by_product': add_to_cart_by_product,
+            'view_details_by_product': _by_product(products, view_details, 'view_count'),
+            'top_products_added': add_to_cart_by_product.head(10)['product_id'].tolist() if not add_to_cart_by_product.empty else []
+        }
+
+    # Stage bits per row, OR-ed per user, give the stages each user reached
+    column_codes = {'page': (page_codes, pages), 'element': (element_codes, elements)}
+    stage_bits = np.zeros(len(df), dtype=np.uint8)
+    for stage, column, values in ORDERED_FUNNEL_STEPS:
+        codes, labels = column_codes[column]
+        stage_bits |= _lookup(labels, values, FUNNEL_BITS[stage])[codes]
+    if approximate:
+        user_hashes = hash_values(df['user_id'])
+        general['unique_users'] = _sketch(user_hashes[df['user_id'].notna().to_numpy()], precision).count()
+        funnel = {stage: _sketch(user_hashes[(stage_bits & bit) != 0], precision).count()
+                  for stage, bit in FUNNEL_BITS.items()}
+    else:
+        user_codes, users = _codes(df['user_id'], use_na_sentinel=False)
+        general['unique_users'] = int(len(users) - users.isna().sum())
+        # One byte of stage bits per user rather than a users x 16 count table
+        user_bits = np.zeros(len(users), dtype=np.uint8)
+        np.bitwise_or.at(user_bits, user_codes, stage_bits)
+        funnel = {stage: int(((user_bits & bit) != 0).sum()) for stage, bit in FUNNEL_BITS.items()}
+
+    if 'datetime' in df.columns and df['datetime'].dtype.kind == 'M' and getattr(df['datetime'].dtype, 'tz', None) is None:
+        time_metrics = _time_metrics(df['datetime'])
+    else:
+        time_metrics = calculate_time_metrics(df)
+
+    return {
+        'general': general,
+        'time': time_metrics,
+        'ecommerce': ecommerce,
+        'funnel': funnel
+    }
+
+
 if __name__ == '__main__':
 
     print("=== Testing Metrics Module ===")
@@ -6,75 +6,37 @@ import pandas as pd
 import numpy as np
 import warnings
 import os
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, confusion_matrix
-from termcolor import colored
+import sys
+
+from .log_parser import load_events_incremental
+from .sessions import build_sessions
+from .sharding import build_sessions as build_sessions_sharded
 
 # Suppress warnings for cleaner output
 warnings.filterwarnings('ignore')
 
-try:
-    from log_parser import load_events_from_directory
-except ImportError:
-    # Handle direct execution vs module import
-    import sys
-    import os
-    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-    from log_parser import load_events_from_directory
+FEATURE_COLUMNS = ['total_events', 'unique_pages', 'product_views', 'duration', 'clicks']
+
+
+def colored(text, color):
+    # termcolor, like sklearn below, is imported only when the analysis actually runs
+    from termcolor import colored as termcolor_colored
+    return termcolor_colored(text, color)
 
-def prepare_features(df):
+
+def prepare_features(df, workers=1):
     """
-    Groups events by user_id to create session-level features.
-    Target: did the user visit 'cart'?
+    Builds one row of features per session (30 minutes of inactivity ends a session).
+    Target: did the session visit 'cart'?
+    With workers > 1 sessions are built over user shards in a process pool.
     """
     if df.empty:
         return pd.DataFrame(), pd.Series()
 
-    # Sort by time
-    df = df.sort_values(['user_id', 'timestamp'])
-
-    # Group by user_id
-    user_groups = df.groupby('user_id')
-
-    features = []
-    targets = []
-
-    for user_id, user_data in user_groups:
-        # Feature: Total Events
-        total_events = len(user_data)
-
-        # Feature: Unique Pages
-        unique_pages = user_data['page'].nunique()
-
-        # Feature: Product View Count
-        product_views = len(user_data[user_data['page'] == 'product'])
-
-        # Feature: Session Duration (seconds)
-        if 'datetime' in user_data.columns:
-            start_time = user_data['datetime'].min()
-            end_time = user_data['datetime'].max()
-            duration = (end_time - start_time).total_seconds()
-        else:
-            duration = 0
-
-        # Feature: Clicks
-        clicks = len(user_data[user_data['event_type'] == 'click'])
-
-        features.append({
-            'total_events': total_events,
-            'unique_pages': unique_pages,
-            'product_views': product_views,
-            'duration': duration,
-            'clicks': clicks
-        })
+    sessions = build_sessions(df) if workers <= 1 else build_sessions_sharded(df, workers=workers)
 
-        # Target: Converted? (Visited Cart)
-        is_converted = 1 if 'cart' in user_data['page'].values else 0
-        targets.append(is_converted)
-
-    X = pd.DataFrame(features)
-    y = pd.Series(targets)
+    X = sessions[FEATURE_COLUMNS].reset_index(drop=True)
+    y = sessions['reached_cart'].astype(int).reset_index(drop=True)
 
     return X, y
 
@@ -86,6 +48,10 @@ def train_and_evaluate(X, y):
         print(colored("Not enough data to train a model (need at least 5 sessions).", "red"))
         return None
 
+    from sklearn.model_selection import train_test_split
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, confusion_matrix
+
     # Split Data (80% Train, 20% Test)
     # Use stratify to maintain class balance
     try:
@@ -140,38 +106,28 @@ def show_feature_importance(model, feature_names):
     for f in range(len(feature_names)):
         print(f"{f+1}. {feature_names[indices[f]]}: {importances[indices[f]]:.4f}")
 
-def main():
-    print(colored("\n=== Machine Learning Analysis: Conversion Prediction ===", "green"))
-    
-    
-    print("Loading data...")
-    
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    logs_dir = os.path.join(script_dir, '..', 'logs')
-    
-    df = load_events_from_directory(logs_dir)
-    if df.empty:
-        print(colored("No data found. Exiting.", "red"))
-        return
-
-    
+def run_ml_analysis(df, output_dir, workers=1):
+    """Trains the conversion model on already loaded events and saves its metrics to output_dir."""
     print("Preparing features...")
-    X, y = prepare_features(df)
+    # Sessionizing adds a session_id column; a caller sharing df keeps its own columns
+    X, y = prepare_features(df.copy(deep=False), workers)
     
     print(f"Total Sessions: {len(X)}")
     print(f"Conversion Rate: {y.mean():.2%}")
 
     if len(X) == 0:
         print("No sessions extracted.")
-        return
+        return None
 
     
     print("Training model...")
-    model, metrics, X_test, y_test, y_pred = train_and_evaluate(X, y)
+    result = train_and_evaluate(X, y)
+    if result is None:
+        return None
+    model, metrics, X_test, y_test, y_pred = result
 
     
     if model:
-        output_dir = os.path.join(script_dir, 'output')
         os.makedirs(output_dir, exist_ok=True)
         
         
@@ -198,8 +154,36 @@ def main():
         print(f"Feature importance saved to {feature_importance_file}")
 
         show_feature_importance(model, X.columns)
+
+    return metrics
+
+
+def train(logs_dir, output_dir, cache_dir, full_rebuild=False, workers=1):
+    """Loads the events (reusing generate_analytics' checkpoint) and trains and saves the model."""
+    print(colored("\n=== Machine Learning Analysis: Conversion Prediction ===", "green"))
+    
+    
+    print("Loading data...")
+    
+    # Reuses the checkpoint written by generate_analytics; only new files are parsed
+    df = load_events_incremental(logs_dir, cache_dir, full_rebuild=full_rebuild)
+    if df.empty:
+        print(colored("No data found. Exiting.", "red"))
+        return
+
+    run_ml_analysis(df, output_dir, workers)
         
     print(colored("\n=== Analysis Complete ===", "green"))
 
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    logs_dir = args[0] if len(args) > 0 else os.path.join(script_dir, '..', 'logs')
+    output_dir = args[1] if len(args) > 1 else os.path.join(script_dir, 'output')
+    cache_dir = next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--cache-dir=')),
+                     os.path.join(script_dir, 'cache'))
+    workers = next((int(arg.split('=', 1)[1]) for arg in sys.argv if arg.startswith('--workers=')), 1)
+    train(logs_dir, output_dir, cache_dir, full_rebuild='--full-rebuild' in sys.argv, workers=workers)
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,210 @@
+"""Versioned publishing - all report artifacts written in parallel and made visible together.
+
+Each publish writes every artifact into a staging folder, records a
+manifest (checksum, size and row count per file), renames the folder to
+output/versions/<version>/ and then atomically replaces output/CURRENT
+with the new version's name. Readers resolve CURRENT once and read every
+file from that folder, so they never see a half-written file or a mix of
+two versions.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+
+CURRENT_FILE = 'CURRENT'
+VERSIONS_DIR = 'versions'
+MANIFEST_FILE = 'manifest.json'
+# Older versions are kept for a while so a reader that resolved one just before a publish can finish
+KEEP_VERSIONS = 3
+
+_ARROW_STRINGS = {pa.string(): pd.StringDtype('pyarrow'), pa.large_string(): pd.StringDtype('pyarrow')}
+
+# An artifact is a DataFrame (written as Feather or CSV, by file extension), a dict or
+# list (JSON), or a function that writes the file at the given path and returns its row count
+Artifact = Union[pd.DataFrame, dict, list, Callable[[str], Optional[int]]]
+
+
+def _write_artifact(path: Path, artifact: Artifact) -> Dict[str, Any]:
+    rows = None
+    if isinstance(artifact, pd.DataFrame):
+        if path.suffix == '.feather':
+            write_feather(artifact, path)
+        else:
+            artifact.to_csv(path, index=False)
+        rows = len(artifact)
+    elif isinstance(artifact, (dict, list)):
+        with open(path, 'w') as f:
+            json.dump(artifact, f, indent=2, default=str)
+    else:
+        rows = artifact(str(path))
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+        # Durable before it becomes visible; fsync releases the GIL, so files sync side by side
+        os.fsync(f.fileno())
+    return {'sha256': digest.hexdigest(), 'bytes': path.stat().st_size, 'rows': rows}
+
+
+def write_feather(df: pd.DataFrame, path: Union[str, Path]) -> None:
+    """Writes df as uncompressed Feather (Arrow IPC), which readers can memory-map instead of parsing."""
+    df.reset_index(drop=True).to_feather(path, compression='uncompressed')
+
+
+def read_feather(path: Union[str, Path]) -> pd.DataFrame:
+    """Reads a Feather file through a memory map, keeping the dtypes it was written with."""
+    # split_blocks lets numeric columns be used straight from the mapped buffers, and strings stay
+    # Arrow-backed instead of becoming one Python object per row
+    return feather.read_table(path, memory_map=True).to_pandas(split_blocks=True, types_mapper=_ARROW_STRINGS.get)
+
+
+def table_artifacts(tables: Dict[str, pd.DataFrame], csv: bool = True) -> Dict[str, pd.DataFrame]:
+    """Artifacts for report tables (name -> DataFrame): always Feather, plus a CSV export if csv."""
+    artifacts = {f"{name}.feather": table for name, table in tables.items()}
+    if csv:
+        artifacts.update({f"{name}.csv": table for name, table in tables.items()})
+    return artifacts
+
+
+def _new_version() -> str:
+    # Sorts by time; the pid keeps two publishers in the same microsecond apart
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{os.getpid()}"
+
+
+def publish(output_dir: str, artifacts: Dict[str, Artifact], keep: int = KEEP_VERSIONS) -> Path:
+    """Writes artifacts (file name -> content) as a new version and makes it current; returns its folder.
+
+    Files are written concurrently, so a publish takes about as long as its
+    slowest file rather than the sum of all of them.
+    """
+    versions_path = Path(output_dir) / VERSIONS_DIR
+    versions_path.mkdir(parents=True, exist_ok=True)
+    version = _new_version()
+    staging = versions_path / f".staging-{version}"
+    staging.mkdir()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, len(artifacts))) as executor:
+            futures = {name: executor.submit(_write_artifact, staging / name, artifact)
+                       for name, artifact in artifacts.items()}
+            files = {name: future.result() for name, future in futures.items()}
+
+        manifest = {'version': version, 'published_at': datetime.now().isoformat(), 'files': files}
+        with open(staging / MANIFEST_FILE, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        final = versions_path / version
+        os.rename(staging, final)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    pointer = Path(output_dir) / CURRENT_FILE
+    tmp_pointer = pointer.with_name(f"{CURRENT_FILE}.{version}.tmp")
+    tmp_pointer.write_text(version)
+    os.replace(tmp_pointer, pointer)
+
+    _prune(versions_path, version, keep)
+    return final
+
+
+def _prune(versions_path: Path, current: str, keep: int) -> None:
+    versions = sorted(p.name for p in versions_path.iterdir() if p.is_dir() and not p.name.startswith('.'))
+    for name in versions[:-keep] if keep > 0 else []:
+        if name != current:
+            shutil.rmtree(versions_path / name, ignore_errors=True)
+
+
+def current_version(output_dir: str) -> Optional[Path]:
+    """Folder of the version CURRENT points to, or None if nothing was published yet."""
+    pointer = Path(output_dir) / CURRENT_FILE
+    try:
+        version = pointer.read_text().strip()
+    except OSError:
+        return None
+    folder = Path(output_dir) / VERSIONS_DIR / version
+    return folder if folder.is_dir() else None
+
+
+def resolve_output(output_dir: str) -> Path:
+    """Where to read published files from: the current version, or output_dir itself for an
+    output folder written before versioned publishing."""
+    return current_version(output_dir) or Path(output_dir)
+
+
+def read_manifest(version_dir: Path) -> Dict[str, Any]:
+    with open(Path(version_dir) / MANIFEST_FILE) as f:
+        return json.load(f)
+
+
+def verify(version_dir: Path) -> bool:
+    """Whether every file in the version still matches its manifest checksum."""
+    for name, entry in read_manifest(version_dir)['files'].items():
+        digest = hashlib.sha256()
+        with open(Path(version_dir) / name, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        if digest.hexdigest() != entry['sha256']:
+            return False
+    return True
+
+
+if __name__ == '__main__':
+
+    import tempfile
+    import threading
+
+    import numpy as np
+
+    print("=== Checking that readers only ever see complete versions ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stop = threading.Event()
+        seen, errors = set(), []
+
+        def reader():
+            # Every file of one resolved version must come from the same publish
+            while not stop.is_set():
+                folder = current_version(tmp)
+                if folder is None:
+                    continue
+                try:
+                    summary = json.loads((folder / 'summary.json').read_text())
+                    table = pd.read_csv(folder / 'events.csv')
+                    if len(table) != summary['rows'] or not (table['n'] == summary['n']).all():
+                        errors.append(folder.name)
+                    seen.add(folder.name)
+                except FileNotFoundError:
+                    # Pruned while being read: only possible KEEP_VERSIONS publishes later
+                    pass
+
+        threads = [threading.Thread(target=reader) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for n in range(30):
+            rows = 1000 + n * 100
+            publish(tmp, {
+                'events.csv': pd.DataFrame({'n': np.full(rows, n)}),
+                'summary.json': {'rows': rows, 'n': n},
+            })
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        folder = current_version(tmp)
+        manifest = read_manifest(folder)
+        assert manifest['files']['events.csv']['rows'] == 3900 and verify(folder)
+        assert len(list((Path(tmp) / VERSIONS_DIR).iterdir())) == KEEP_VERSIONS
+        assert not errors, errors
+        print(f"30 publishes, {len(seen)} versions read concurrently, none mixed or partial")
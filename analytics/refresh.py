@@ -0,0 +1,199 @@
+"""Refresh worker - rebuilds everything the dashboard shows from one warm background thread.
+
+Refreshing used to start three Python processes in turn (generate_analytics,
+ga_fetcher and ml_analysis), each paying for interpreter startup and the
+pandas/sklearn imports, and two of them loading the events. The worker is
+a thread that lives as long as the dashboard's server process. It imports
+the pipeline modules once, in the background, as soon as it starts. Each
+refresh loads the events once and hands the same table to the report and
+to the ML model, while the GA fetch runs beside them. Progress is appended
+to the job as stages start and finish, for the dashboard to follow.
+"""
+
+import importlib
+import queue
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+SCRIPT_DIR = Path(__file__).parent
+
+STAGE_LABELS = {
+    'ga': "Google Analytics",
+    'load': "Loading events",
+    'report': "Local logs report",
+    'ml': "ML model",
+}
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+class RefreshJob:
+    """One refresh: its progress events so far, and whether (and how) it has finished."""
+
+    def __init__(self, full_rebuild: bool):
+        self.full_rebuild = full_rebuild
+        self.events: List[Dict[str, Any]] = []
+        self.errors: Dict[str, str] = {}
+        self.seconds: Optional[float] = None
+        self.started = time.perf_counter()
+        self.done = threading.Event()
+        self.changed = threading.Condition()
+
+    def report(self, stage: str, status: str, message: str) -> None:
+        event = {'stage': stage, 'status': status, 'message': message,
+                 'elapsed': time.perf_counter() - self.started}
+        with self.changed:
+            self.events.append(event)
+            self.changed.notify_all()
+
+    def finish(self) -> None:
+        self.seconds = time.perf_counter() - self.started
+        with self.changed:
+            self.done.set()
+            self.changed.notify_all()
+
+    def follow(self, start: int = 0) -> Iterator[Dict[str, Any]]:
+        """Yields the progress events from index start on, as they happen, until the job is done.
+
+        Any number of readers can follow a job, so a dashboard rerun can
+        pick up a refresh that an earlier run started.
+        """
+        position = start
+        while True:
+            with self.changed:
+                while position >= len(self.events) and not self.done.is_set():
+                    self.changed.wait()
+                pending = self.events[position:]
+                finished = self.done.is_set()
+            yield from pending
+            position += len(pending)
+            if finished and position >= len(self.events):
+                return
+
+
+class RefreshWorker:
+    def __init__(self, logs_dir: str = None, output_dir: str = None, cache_dir: str = None,
+                 ga_output_dir: str = None, ml: bool = True):
+        self.logs_dir = str(logs_dir or SCRIPT_DIR.parent / 'logs')
+        self.output_dir = str(output_dir or SCRIPT_DIR / 'output')
+        self.cache_dir = str(cache_dir or SCRIPT_DIR / 'cache')
+        self.ga_output_dir = ga_output_dir or SCRIPT_DIR / 'ga_output'
+        self.ml = ml
+        self.current: Optional[RefreshJob] = None
+        self.ready = threading.Event()
+        self.jobs: 'queue.Queue[RefreshJob]' = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name='refresh-worker', daemon=True)
+        self.thread.start()
+
+    def submit(self, full_rebuild: bool = False) -> RefreshJob:
+        """Queues a refresh, or returns the one already queued or running."""
+        with self.lock:
+            if self.current is None or self.current.done.is_set():
+                self.current = RefreshJob(full_rebuild)
+                self.jobs.put(self.current)
+            return self.current
+
+    def _run(self) -> None:
+        self._warm()
+        while True:
+            self._refresh(self.jobs.get())
+
+    def _warm(self) -> None:
+        # Paid once per process, while nobody is waiting on a refresh yet
+        for module in ['generate_analytics', 'ga_fetcher'] + (['ml_analysis'] if self.ml else []):
+            try:
+                importlib.import_module(f".{module}", __package__)
+            except ImportError:
+                # Reported by the stage that needs the module
+                pass
+        self.ready.set()
+
+    def _stage(self, job: RefreshJob, stage: str, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        label = STAGE_LABELS[stage]
+        job.report(stage, 'started', f"{label}...")
+        started = time.perf_counter()
+        try:
+            value = func(*args, **kwargs)
+        except Exception as error:
+            traceback.print_exc()
+            job.errors[stage] = str(error)
+            job.report(stage, 'failed', f"{label} failed: {error}")
+            return None
+        job.report(stage, 'done', f"{label} done in {time.perf_counter() - started:.1f}s")
+        return value
+
+    def _refresh(self, job: RefreshJob) -> None:
+        ga = threading.Thread(target=self._stage, args=(job, 'ga', _fetch_ga, self.ga_output_dir))
+        ga.start()
+
+        df = self._stage(job, 'load', _load_events, self.logs_dir, self.cache_dir, job.full_rebuild)
+        if df is not None and df.empty:
+            job.report('load', 'done', "No events found")
+        elif df is not None:
+            self._stage(job, 'report', _generate, self.logs_dir, self.output_dir, self.cache_dir,
+                        job.full_rebuild, df)
+            if self.ml:
+                self._stage(job, 'ml', _train, df, self.output_dir)
+
+        ga.join()
+        job.finish()
+
+
+def _fetch_ga(output_dir):
+    from .ga_fetcher import fetch_ga
+    fetch_ga(output_dir)
+
+
+def _load_events(logs_dir, cache_dir, full_rebuild):
+    from .log_parser import load_events_incremental
+    return load_events_incremental(logs_dir, cache_dir, full_rebuild=full_rebuild)
+
+
+def _generate(logs_dir, output_dir, cache_dir, full_rebuild, df):
+    from .generate_analytics import generate_analytics
+    return generate_analytics(logs_dir, output_dir, cache_dir, full_rebuild=full_rebuild, df=df)
+
+
+def _train(df, output_dir):
+    from .ml_analysis import run_ml_analysis
+    return run_ml_analysis(df, output_dir)
+
+
+def get_worker() -> RefreshWorker:
+    """The process-wide worker, started (and warming up) on first use."""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = RefreshWorker()
+        return _worker
+
+
+if __name__ == '__main__':
+
+    import sys
+    import tempfile
+
+    from .bench import make_synthetic_logs
+
+    print("=== Checking an in-process refresh ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        logs_dir = Path(tmp) / 'logs'
+        make_synthetic_logs(str(logs_dir), 2000)
+        worker = RefreshWorker(logs_dir, Path(tmp) / 'output', Path(tmp) / 'cache', Path(tmp) / 'ga_output',
+                               ml='--no-ml' not in sys.argv)
+        job = worker.submit()
+        assert worker.submit() is job
+        progress = [event['message'] for event in job.follow()]
+        print('\n'.join(progress))
+        # A late reader still sees the whole refresh
+        assert [event['message'] for event in job.follow()] == progress
+        assert not set(job.errors) - {'ml'}, job.errors
+        assert (Path(tmp) / 'output' / 'CURRENT').exists() and (Path(tmp) / 'ga_output' / 'ga_summary.json').exists()
+        print(f"refreshed in {job.seconds:.2f}s" + (f", ML failed: {job.errors['ml']}" if job.errors else ""))
@@ -0,0 +1,157 @@
+"""Sessionization - splits each user's events into sessions at gaps of inactivity."""
+
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+from .metrics import ADD_TO_CART_ELEMENTS, unit_time_order
+
+
+DEFAULT_SESSION_GAP = pd.Timedelta(minutes=30)
+
+SESSION_COLUMNS = ['session_id', 'user_id', 'start', 'end', 'duration', 'total_events', 'page_visits',
+                   'clicks', 'unique_pages', 'product_views', 'add_to_cart', 'reached_cart']
+
+
+def _factorize(series: pd.Series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy().astype(np.int64), len(series.cat.categories)
+    codes, uniques = pd.factorize(series)
+    return codes, len(uniques)
+
+
+def assign_sessions(df: pd.DataFrame, gap: pd.Timedelta = DEFAULT_SESSION_GAP,
+                    by: str = 'user_id') -> np.ndarray:
+    """Session number for every row, -1 where the user or the time is missing.
+
+    A user's next event starts a new session when it comes more than gap
+    after the previous one. Sessions are numbered in user, then time order.
+    """
+    session_ids = np.full(len(df), -1, dtype=np.int64)
+    if df.empty:
+        return session_ids
+
+    unit_codes, n_units = _factorize(df[by])
+    times = df['datetime'].to_numpy().astype('datetime64[ns]').view('i8')
+    rows = np.flatnonzero((unit_codes >= 0) & df['datetime'].notna().to_numpy())
+    if len(rows) == 0:
+        return session_ids
+    if len(rows) < len(df):
+        unit_codes, times = unit_codes[rows], times[rows]
+
+    order = unit_time_order(unit_codes, n_units, times)
+    unit_codes, times = unit_codes[order], times[order]
+
+    new_session = np.empty(len(order), dtype=bool)
+    new_session[0] = True
+    new_session[1:] = (unit_codes[1:] != unit_codes[:-1]) | (np.diff(times) > pd.Timedelta(gap).value)
+    session_ids[rows[order]] = np.cumsum(new_session) - 1
+    return session_ids
+
+
+def sessionize(df: pd.DataFrame, gap: pd.Timedelta = DEFAULT_SESSION_GAP, by: str = 'user_id') -> pd.DataFrame:
+    """Adds a session_id column to the event table in place and returns it."""
+    df['session_id'] = assign_sessions(df, gap, by)
+    return df
+
+
+def build_sessions(df: pd.DataFrame, gap: pd.Timedelta = DEFAULT_SESSION_GAP) -> pd.DataFrame:
+    """One row per session with its time span and event counts.
+
+    The event table is sessionized first if it has no session_id column.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=SESSION_COLUMNS)
+    if 'session_id' not in df.columns:
+        sessionize(df, gap)
+
+    session_ids = df['session_id'].to_numpy()
+    rows = np.flatnonzero(session_ids >= 0)
+    if len(rows) == 0:
+        return pd.DataFrame(columns=SESSION_COLUMNS)
+    s = session_ids[rows]
+    n_sessions = int(s.max()) + 1
+
+    def count(mask) -> np.ndarray:
+        return np.bincount(s, weights=np.asarray(mask)[rows], minlength=n_sessions).astype(np.int64)
+
+    times = df['datetime'].to_numpy()[rows]
+    unit = np.datetime_data(times.dtype)[0]
+    start_ticks = np.full(n_sessions, np.iinfo(np.int64).max)
+    end_ticks = np.full(n_sessions, np.iinfo(np.int64).min)
+    np.minimum.at(start_ticks, s, times.view('i8'))
+    np.maximum.at(end_ticks, s, times.view('i8'))
+
+    users = np.empty(n_sessions, dtype=object)
+    users[s] = df['user_id'].to_numpy()[rows]
+
+    page_codes, n_pages = _factorize(df['page'])
+    page_codes = page_codes[rows]
+    known_page = page_codes >= 0
+    pages_seen = np.bincount(s[known_page] * n_pages + page_codes[known_page], minlength=n_sessions * n_pages)
+
+    sessions = pd.DataFrame({
+        'session_id': np.arange(n_sessions),
+        'user_id': users,
+        'start': start_ticks.view(times.dtype),
+        'end': end_ticks.view(times.dtype),
+        'duration': (end_ticks - start_ticks) / (np.timedelta64(1, 's') / np.timedelta64(1, unit)),
+        'total_events': np.bincount(s, minlength=n_sessions),
+        'page_visits': count(df['event_type'] == 'page_visit'),
+        'clicks': count(df['event_type'] == 'click'),
+        'unique_pages': (pages_seen.reshape(n_sessions, n_pages) > 0).sum(axis=1),
+        'product_views': count(df['page'] == 'product'),
+        'add_to_cart': count(df['element'].isin(ADD_TO_CART_ELEMENTS)),
+        'reached_cart': count(df['page'] == 'cart') > 0,
+    })
+    return sessions
+
+
+def session_kpis(sessions: pd.DataFrame) -> Dict[str, Any]:
+    if sessions.empty:
+        return {
+            'total_sessions': 0,
+            'avg_session_duration': 0.0,
+            'avg_events_per_session': 0.0,
+            'bounce_rate': 0.0,
+            'add_to_cart_rate': 0.0,
+            'cart_rate': 0.0
+        }
+
+    return {
+        'total_sessions': len(sessions),
+        'avg_session_duration': float(sessions['duration'].mean()),
+        'avg_events_per_session': float(sessions['total_events'].mean()),
+        'bounce_rate': float((sessions['total_events'] == 1).mean()),
+        'add_to_cart_rate': float((sessions['add_to_cart'] > 0).mean()),
+        'cart_rate': float(sessions['reached_cart'].mean())
+    }
+
+
+if __name__ == '__main__':
+
+    print("=== Testing Sessions Module ===")
+
+    t0 = pd.Timestamp('2026-01-01 10:00')
+    minutes = pd.to_timedelta
+    sample = pd.DataFrame({
+        'event_type': ['page_visit', 'click', 'page_visit', 'page_visit', 'click', 'page_visit'],
+        'page': ['home', 'home', 'product', 'home', 'product', 'cart'],
+        'element': ['page_load', 'view_details_button', 'page_load', 'page_load', 'add_to_cart_detail_btn', 'page_load'],
+        'product_id': [None, 'P001', 'P001', None, 'P002', None],
+        'user_id': ['user1', 'user1', 'user2', 'user1', 'user2', 'user2'],
+        'datetime': [t0, t0 + minutes('5min'), t0 + minutes('6min'), t0 + minutes('50min'),
+                     t0 + minutes('20min'), t0 + minutes('40min')],
+    })
+
+    sessionize(sample)
+    # user1: 10:00, 10:05 | 10:50 (45 min gap); user2: 10:06, 10:20, 10:40 in one session
+    assert sample['session_id'].tolist() == [0, 0, 2, 1, 2, 2], sample['session_id'].tolist()
+
+    sessions = build_sessions(sample)
+    print(sessions.to_string(index=False))
+    assert sessions['total_events'].tolist() == [2, 1, 3]
+    assert sessions['reached_cart'].tolist() == [False, False, True]
+    assert sessions['duration'].tolist() == [300.0, 0.0, 2040.0]
+    print(f"\nKPIs: {session_kpis(sessions)}")
@@ -0,0 +1,268 @@
+"""User-sharded execution - metrics, funnels and sessions computed per shard of users in a process pool.
+
+Every metric here is partitionable by user: no user's events are split
+across shards, so distinct-user counts, funnels and sessions of the shards
+simply add up. Each function returns exactly what its single-process
+counterpart returns for the whole frame.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from . import metrics
+from .metrics import stable_order
+from .sessions import DEFAULT_SESSION_GAP, SESSION_COLUMNS, build_sessions as build_sessions_single
+from .sketches import hash_values
+
+
+PARTS = ['metrics', 'ordered_funnel', 'sessions', 'session_funnel']
+
+# Set in each worker by _init_worker; with fork they are inherited, not pickled
+_FRAME: Optional[pd.DataFrame] = None
+_SHARD_ROWS: List[np.ndarray] = []
+
+
+def user_codes(df: pd.DataFrame) -> Tuple[np.ndarray, pd.Index]:
+    """User codes in the order sessions and metrics number users (-1 for a missing user_id)."""
+    users = df['user_id']
+    if isinstance(users.dtype, pd.CategoricalDtype):
+        return users.cat.codes.to_numpy().astype(np.int64), users.cat.categories
+    codes, uniques = pd.factorize(users)
+    return codes.astype(np.int64), pd.Index(uniques)
+
+
+def split_users(codes: np.ndarray, users: pd.Index, n_shards: int) -> List[np.ndarray]:
+    """Row numbers of each shard, in their original order.
+
+    A user goes to shard hash(user_id) % n_shards, so the split does not
+    depend on row order or on which other users are present. Rows without
+    a user_id all go to shard 0.
+    """
+    user_shard = (hash_values(users) % np.uint64(n_shards)).astype(np.int64)
+    row_shard = np.where(codes >= 0, user_shard[codes], 0)
+    order = stable_order(row_shard, n_shards)
+    bounds = np.cumsum(np.bincount(row_shard, minlength=n_shards))[:-1]
+    return np.split(order, bounds)
+
+
+def _init_worker(df: pd.DataFrame, shard_rows: List[np.ndarray]) -> None:
+    global _FRAME, _SHARD_ROWS
+    _FRAME, _SHARD_ROWS = df, shard_rows
+
+
+def _shard_partials(shard: pd.DataFrame, parts: Iterable[str], gap: pd.Timedelta) -> Dict[str, Any]:
+    partials = {}
+    if 'metrics' in parts:
+        partials['metrics'] = metrics.calculate_all_metrics(shard)
+    if 'ordered_funnel' in parts:
+        partials['ordered_funnel'] = metrics.calculate_ordered_funnel(shard)
+    if 'sessions' in parts or 'session_funnel' in parts:
+        partials['sessions'] = build_sessions_single(shard, gap)
+        # An empty shard is never sessionized
+        partials['session_ids'] = shard['session_id'].to_numpy() if 'session_id' in shard.columns \
+            else np.full(len(shard), -1, dtype=np.int64)
+        if 'session_funnel' in parts:
+            partials['session_funnel'] = metrics.calculate_ordered_funnel(shard, by='session_id')
+    return partials
+
+
+def _take_shard(df: pd.DataFrame, rows: np.ndarray) -> pd.DataFrame:
+    shard = df.take(rows).reset_index(drop=True)
+    if isinstance(shard['user_id'].dtype, pd.CategoricalDtype):
+        # metrics counts a categorical's categories as its users
+        shard['user_id'] = shard['user_id'].cat.remove_unused_categories()
+    return shard
+
+
+def _run_shard(index: int, parts: List[str], gap: pd.Timedelta) -> Dict[str, Any]:
+    return _shard_partials(_take_shard(_FRAME, _SHARD_ROWS[index]), parts, gap)
+
+
+def _sum_counts(dicts: List[Dict[Any, int]], labels: Optional[pd.Index]) -> Dict[Any, int]:
+    totals: Dict[Any, int] = {}
+    for counts in dicts:
+        for key, count in counts.items():
+            totals[key] = totals.get(key, 0) + count
+    # Sorted from the same label order as value_counts so ties come out the same way
+    series = pd.Series(totals)
+    if labels is not None:
+        series = series.reindex([label for label in labels if label in totals])
+    return series.sort_values(ascending=False).to_dict()
+
+
+def _sum_frames(frames: List[pd.DataFrame], key: str, count_col: str) -> pd.DataFrame:
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    combined = pd.concat(frames, ignore_index=True)
+    return combined.groupby(key, sort=True)[count_col].sum().reset_index()
+
+
+def _by_product(frames: List[pd.DataFrame], count_col: str) -> pd.DataFrame:
+    result = _sum_frames(frames, 'product_id', count_col)
+    if result.empty:
+        return pd.DataFrame(columns=['product_id', count_col])
+    return result.sort_values(count_col, ascending=False)
+
+
+def _reduce_metrics(df: pd.DataFrame, partials: List[Dict[str, Any]]) -> Dict[str, Any]:
+    generals = [p['general'] for p in partials]
+    labels = {col: df[col].cat.categories if isinstance(df[col].dtype, pd.CategoricalDtype) else None
+              for col in ('event_type', 'page')}
+    general = {key: sum(g[key] for g in generals)
+               for key in ('total_events', 'total_page_visits', 'total_clicks', 'unique_users')}
+    general['events_by_type'] = _sum_counts([g['events_by_type'] for g in generals], labels['event_type'])
+    general['events_by_page'] = _sum_counts([g['events_by_page'] for g in generals], labels['page'])
+
+    time_metrics = {
+        'events_per_hour': _sum_frames([p['time']['events_per_hour'] for p in partials], 'datetime', 'event_count'),
+        'events_per_day': _sum_frames([p['time']['events_per_day'] for p in partials], 'date', 'event_count')
+    }
+
+    ecommerce = [p['ecommerce'] for p in partials]
+    add_to_cart_by_product = _by_product([e['add_to_cart_by_product'] for e in ecommerce], 'add_to_cart_count')
+    ecommerce = {
+        'add_to_cart_count': sum(e['add_to_cart_count'] for e in ecommerce),
+        'add_to_cart_by_product': add_to_cart_by_product,
+        'view_details_by_product': _by_product([e['view_details_by_product'] for e in ecommerce], 'view_count'),
+        'top_products_added': add_to_cart_by_product.head(10)['product_id'].tolist() if not add_to_cart_by_product.empty else []
+    }
+
+    funnel = {stage: sum(p['funnel'][stage] for p in partials) for stage in partials[0]['funnel']}
+    return {'general': general, 'time': time_metrics, 'ecommerce': ecommerce, 'funnel': funnel}
+
+
+def _sum_funnels(funnels: List[Dict[str, int]]) -> Dict[str, int]:
+    return {step: sum(funnel[step] for funnel in funnels) for step in funnels[0]}
+
+
+def _reduce_sessions(df: pd.DataFrame, users: pd.Index, shard_rows: List[np.ndarray],
+                     partials: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Concatenates the shard session tables, renumbered in user then time order like sessions.build_sessions.
+
+    Also writes the renumbered session_id column into df, as sessionize does.
+    """
+    tables = [p['sessions'] for p in partials]
+    offsets = np.concatenate([[0], np.cumsum([len(table) for table in tables])])
+    session_ids = np.full(len(df), -1, dtype=np.int64)
+    combined = pd.DataFrame(columns=SESSION_COLUMNS)
+    if offsets[-1] > 0:
+        combined = pd.concat([table for table in tables if not table.empty], ignore_index=True)
+        user_order = users.get_indexer(combined['user_id'])
+        order = np.lexsort((combined['start'].to_numpy().view('i8'), user_order))
+        new_ids = np.empty(len(order), dtype=np.int64)
+        new_ids[order] = np.arange(len(order))
+        combined = combined.take(order).reset_index(drop=True)
+        combined['session_id'] = np.arange(len(combined))
+
+        for rows, partial, offset in zip(shard_rows, partials, offsets):
+            local = partial['session_ids']
+            session_ids[rows] = np.where(local >= 0, new_ids[offset + np.maximum(local, 0)], -1)
+
+    df['session_id'] = session_ids
+    return combined
+
+
+def run_sharded(df: pd.DataFrame, parts: Iterable[str] = PARTS, workers: int = 1,
+                n_shards: Optional[int] = None, gap: pd.Timedelta = DEFAULT_SESSION_GAP) -> Dict[str, Any]:
+    """Computes the requested parts over user shards and reduces them to single-process results.
+
+    parts can include 'metrics' (calculate_all_metrics), 'ordered_funnel',
+    'sessions' (build_sessions, which also adds session_id to df) and
+    'session_funnel' (the ordered funnel by session). Shards are split once
+    and each worker computes all parts for its shard in one go. n_shards
+    defaults to workers; more shards than workers evens out the load.
+    """
+    parts = [part for part in PARTS if part in parts]
+    n_shards = n_shards or workers
+    if df.empty or n_shards <= 1:
+        return _run_single(df, parts, gap)
+
+    codes, users = user_codes(df)
+    shard_rows = split_users(codes, users, n_shards)
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(df, shard_rows)) as executor:
+            partials = list(executor.map(_run_shard, range(n_shards), [parts] * n_shards, [gap] * n_shards))
+    else:
+        partials = [_shard_partials(_take_shard(df, rows), parts, gap) for rows in shard_rows]
+
+    results = {}
+    if 'metrics' in parts:
+        results['metrics'] = _reduce_metrics(df, [p['metrics'] for p in partials])
+    if 'ordered_funnel' in parts:
+        results['ordered_funnel'] = _sum_funnels([p['ordered_funnel'] for p in partials])
+    if 'sessions' in parts or 'session_funnel' in parts:
+        sessions = _reduce_sessions(df, users, shard_rows, partials)
+        if 'sessions' in parts:
+            results['sessions'] = sessions
+    if 'session_funnel' in parts:
+        results['session_funnel'] = _sum_funnels([p['session_funnel'] for p in partials])
+    return results
+
+
+def _run_single(df: pd.DataFrame, parts: List[str], gap: pd.Timedelta) -> Dict[str, Any]:
+    results = {}
+    if 'metrics' in parts:
+        results['metrics'] = metrics.calculate_all_metrics(df)
+    if 'ordered_funnel' in parts:
+        results['ordered_funnel'] = metrics.calculate_ordered_funnel(df)
+    if 'sessions' in parts or 'session_funnel' in parts:
+        sessions = build_sessions_single(df, gap)
+        if 'sessions' in parts:
+            results['sessions'] = sessions
+    if 'session_funnel' in parts:
+        results['session_funnel'] = metrics.calculate_ordered_funnel(df, by='session_id')
+    return results
+
+
+def calculate_all_metrics(df: pd.DataFrame, workers: int = 1, n_shards: Optional[int] = None) -> Dict[str, Any]:
+    return run_sharded(df, ['metrics'], workers, n_shards)['metrics']
+
+
+def calculate_ordered_funnel(df: pd.DataFrame, workers: int = 1, n_shards: Optional[int] = None) -> Dict[str, int]:
+    return run_sharded(df, ['ordered_funnel'], workers, n_shards)['ordered_funnel']
+
+
+def build_sessions(df: pd.DataFrame, workers: int = 1, n_shards: Optional[int] = None,
+                   gap: pd.Timedelta = DEFAULT_SESSION_GAP) -> pd.DataFrame:
+    return run_sharded(df, ['sessions'], workers, n_shards, gap)['sessions']
+
+
+if __name__ == '__main__':
+
+    import sys
+    import warnings
+
+    from .bench import synthetic_frame
+    from .log_parser import load_events_from_directory
+
+    warnings.simplefilter('ignore', FutureWarning)
+    print("=== Checking sharded results against single-process ones ===")
+
+    # Synthetic events unless a logs dir is given
+    df = load_events_from_directory(sys.argv[1]) if len(sys.argv) > 1 else synthetic_frame(100_000, days=3, n_users=5_000)
+
+    def check(expected, actual, where):
+        if isinstance(expected, pd.DataFrame):
+            pd.testing.assert_frame_equal(expected, actual, obj=where)
+        elif isinstance(expected, dict):
+            assert list(expected) == list(actual), (where, list(expected), list(actual))
+            for key in expected:
+                check(expected[key], actual[key], f"{where}.{key}")
+        else:
+            assert expected == actual, (where, expected, actual)
+
+    expected = _run_single(df.copy(), PARTS, DEFAULT_SESSION_GAP)
+    for workers, n_shards in ((1, 3), (2, 2), (2, 7)):
+        sharded_df = df.copy()
+        actual = run_sharded(sharded_df, PARTS, workers, n_shards)
+        check(expected, actual, f"{n_shards} shards")
+        reference = df.copy()
+        build_sessions_single(reference)
+        assert (reference['session_id'] == sharded_df['session_id']).all()
+        print(f"{workers} workers, {n_shards} shards: metrics, funnels and sessions identical")
@@ -0,0 +1,286 @@
+"""SQL backend - the event table in an SQLite file, with the metrics answered as queries.
+
+Only the (small) query results are loaded into pandas, so the metrics can be
+computed over event stores larger than memory. Every query returns exactly
+what the metrics.py function of the same name returns for the same events.
+"""
+
+import os
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .log_parser import iter_event_batches
+from .metrics import ADD_TO_CART_ELEMENTS, ORDERED_FUNNEL_STEPS, VIEW_DETAILS_ELEMENT
+from .timeseries import resolve_granularity
+
+
+EVENTS_DB = 'events.sqlite'
+INGEST_BATCH_SIZE = 200_000
+
+# datetime is stored as integer milliseconds since the epoch (NULL for NaT)
+EVENT_COLUMNS = ['event_type', 'page', 'element', 'product_id', 'user_id', 'ts']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    event_type TEXT,
+    page TEXT,
+    element TEXT,
+    product_id TEXT,
+    user_id TEXT,
+    ts INTEGER
+)
+"""
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts)",
+    "CREATE INDEX IF NOT EXISTS idx_events_user ON events (user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_events_page ON events (page)",
+]
+
+MS_PER = {'minute': 60_000, 'hour': 3_600_000, 'day': 86_400_000}
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """Opens (or creates) the event database. Call create_indexes once a bulk load is done."""
+    con = sqlite3.connect(db_path)
+    con.execute(SCHEMA)
+    return con
+
+
+def create_indexes(con: sqlite3.Connection) -> None:
+    """Indexes on time, user_id and page, plus the statistics the query planner uses to pick them."""
+    with con:
+        for statement in INDEXES:
+            con.execute(statement)
+        con.execute("ANALYZE")
+
+
+def _column_values(df: pd.DataFrame, column: str) -> List[Any]:
+    if column == 'ts':
+        times = df['datetime'].to_numpy().astype('datetime64[ms]')
+        values = times.view('i8').astype(object)
+        values[np.isnat(times)] = None
+        return values.tolist()
+    if column not in df.columns:
+        return [None] * len(df)
+    values = df[column].to_numpy(dtype=object)
+    values[pd.isna(values)] = None
+    return values.tolist()
+
+
+def ingest_events(con: sqlite3.Connection, df: pd.DataFrame) -> int:
+    """Appends a batch of events (as produced by log_parser) and returns the number of rows."""
+    if df.empty:
+        return 0
+    rows = zip(*(_column_values(df, column) for column in EVENT_COLUMNS))
+    placeholders = ', '.join('?' for _ in EVENT_COLUMNS)
+    with con:
+        con.executemany(f"INSERT INTO events ({', '.join(EVENT_COLUMNS)}) VALUES ({placeholders})", rows)
+    return len(df)
+
+
+def build_database(logs_dir: str, db_path: str, batch_size: int = INGEST_BATCH_SIZE) -> int:
+    """Streams every event under logs_dir into a fresh database at db_path.
+
+    Batches are inserted as they are parsed, so memory use depends on
+    batch_size rather than on the size of the logs. Batches need not come in
+    time order: every query aggregates or orders explicitly. The indexes are
+    built after the load and the file replaces db_path atomically.
+    """
+    tmp_path = db_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    con = sqlite3.connect(tmp_path)
+    # Nothing reads the temporary file until it is complete
+    con.execute("PRAGMA journal_mode = OFF")
+    con.execute("PRAGMA synchronous = OFF")
+    con.execute(SCHEMA)
+    total = 0
+    for batch in iter_event_batches(logs_dir, batch_size=batch_size, partition_batch_size=batch_size):
+        total += ingest_events(con, batch)
+    create_indexes(con)
+    con.close()
+
+    os.replace(tmp_path, db_path)
+    print(f"Loaded {total} events into {db_path}")
+    return total
+
+
+def _where(start: Optional[pd.Timestamp], end: Optional[pd.Timestamp],
+           *conditions: str) -> Tuple[str, List[Any]]:
+    """WHERE clause for start <= datetime < end plus extra conditions, with its parameters."""
+    clauses, params = list(conditions), []
+    if start is not None:
+        clauses.append("ts >= ?")
+        params.append(int(pd.Timestamp(start).value // 1_000_000))
+    if end is not None:
+        clauses.append("ts < ?")
+        params.append(int(pd.Timestamp(end).value // 1_000_000))
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def _in_list(values: List[str]) -> str:
+    return ', '.join("'" + value.replace("'", "''") + "'" for value in values)
+
+
+def _to_datetimes(ms: pd.Series) -> np.ndarray:
+    return ms.to_numpy(dtype=np.int64).astype('datetime64[ms]')
+
+
+def _bucket_sql(granularity: str) -> str:
+    granularity = resolve_granularity(granularity)
+    if granularity in MS_PER:
+        return f"ts - ts % {MS_PER[granularity]}"
+    if granularity == 'week':
+        # 1970-01-01 was a Thursday; weeks start on Monday
+        return "(ts / 86400000 - (ts / 86400000 + 3) % 7) * 86400000"
+    # month, the only level left
+    return "CAST(strftime('%s', ts / 1000, 'unixepoch', 'start of month') AS INTEGER) * 1000"
+
+
+def _counts_by_type_and_page(con: sqlite3.Connection, start=None, end=None) -> pd.DataFrame:
+    where, params = _where(start, end)
+    return pd.read_sql_query(
+        f"SELECT event_type, page, COUNT(*) AS count FROM events{where} GROUP BY event_type, page",
+        con, params=params)
+
+
+def _counts_of(counts: pd.DataFrame, column: str) -> pd.DataFrame:
+    """Per-value totals of one column, in value order like a pandas groupby."""
+    return counts.groupby(column, sort=True)['count'].sum().reset_index(name='count')
+
+
+def calculate_general_metrics(con: sqlite3.Connection, start=None, end=None) -> Dict[str, Any]:
+    counts = _counts_by_type_and_page(con, start, end)
+    if counts.empty:
+        return {
+            'total_events': 0,
+            'total_page_visits': 0,
+            'total_clicks': 0,
+            'unique_users': 0,
+            'events_by_type': {},
+            'events_by_page': {}
+        }
+
+    where, params = _where(start, end)
+    users = con.execute(f"SELECT COUNT(DISTINCT user_id) FROM events{where}", params).fetchone()[0]
+    by_type = _counts_of(counts, 'event_type').sort_values('count', ascending=False)
+    by_page = _counts_of(counts, 'page').sort_values('count', ascending=False)
+    type_totals = dict(zip(by_type['event_type'], by_type['count'].tolist()))
+    return {
+        'total_events': int(counts['count'].sum()),
+        'total_page_visits': type_totals.get('page_visit', 0),
+        'total_clicks': type_totals.get('click', 0),
+        'unique_users': users,
+        'events_by_type': type_totals,
+        'events_by_page': dict(zip(by_page['page'], by_page['count'].tolist()))
+    }
+
+
+def calculate_time_metrics(con: sqlite3.Connection, start=None, end=None) -> Dict[str, pd.DataFrame]:
+    where, params = _where(start, end, "ts IS NOT NULL")
+    hourly = pd.read_sql_query(
+        f"SELECT {_bucket_sql('hour')} AS bucket, COUNT(*) AS event_count FROM events{where} "
+        "GROUP BY bucket ORDER BY bucket", con, params=params)
+    if hourly.empty:
+        return {
+            'events_per_hour': pd.DataFrame(),
+            'events_per_day': pd.DataFrame()
+        }
+
+    events_per_hour = pd.DataFrame({
+        'datetime': _to_datetimes(hourly['bucket']),
+        'event_count': hourly['event_count'].astype(np.int64)
+    })
+    days = hourly.groupby(hourly['bucket'] // MS_PER['day'], sort=True)['event_count'].sum()
+    events_per_day = pd.DataFrame({
+        'date': pd.DatetimeIndex(_to_datetimes(pd.Series(days.index * MS_PER['day']))).date,
+        'event_count': days.to_numpy().astype(np.int64)
+    })
+    return {
+        'events_per_hour': events_per_hour,
+        'events_per_day': events_per_day
+    }
+
+
+def _by_product(counts: pd.DataFrame, elements: List[str], count_col: str) -> pd.DataFrame:
+    rows = counts[counts['element'].isin(elements) & counts['product_id'].notna()]
+    if rows.empty:
+        return pd.DataFrame(columns=['product_id', count_col])
+    result = rows.groupby('product_id', sort=True)['count'].sum().reset_index(name=count_col)
+    return result.sort_values(count_col, ascending=False)
+
+
+def calculate_ecommerce_metrics(con: sqlite3.Connection, start=None, end=None) -> Dict[str, Any]:
+    where, params = _where(start, end)
+    if con.execute(f"SELECT 1 FROM events{where} LIMIT 1", params).fetchone() is None:
+        return {
+            'add_to_cart_count': 0,
+            'add_to_cart_by_product': pd.DataFrame(),
+            'view_details_by_product': pd.DataFrame(),
+            'top_products_added': []
+        }
+
+    where, params = _where(start, end, f"element IN ({_in_list(ADD_TO_CART_ELEMENTS + [VIEW_DETAILS_ELEMENT])})")
+    counts = pd.read_sql_query(
+        f"SELECT element, product_id, COUNT(*) AS count FROM events{where} GROUP BY element, product_id",
+        con, params=params)
+    add_to_cart_by_product = _by_product(counts, ADD_TO_CART_ELEMENTS, 'add_to_cart_count')
+    return {
+        'add_to_cart_count': int(counts.loc[counts['element'].isin(ADD_TO_CART_ELEMENTS), 'count'].sum()),
+        'add_to_cart_by_product': add_to_cart_by_product,
+        'view_details_by_product': _by_product(counts, [VIEW_DETAILS_ELEMENT], 'view_count'),
+        'top_products_added': add_to_cart_by_product.head(10)['product_id'].tolist() if not add_to_cart_by_product.empty else []
+    }
+
+
+def calculate_conversion_funnel(con: sqlite3.Connection, start=None, end=None) -> Dict[str, int]:
+    stages = {name: f"{column} IN ({_in_list(values)})" for name, column, values in ORDERED_FUNNEL_STEPS}
+    # Stages reached per user; like metrics, rows without a user_id count as
+    # one more user (the NULL group). "+user_id" keeps SQLite from walking the
+    # user_id index in random row order: a scan (or the ts index for a range)
+    # and a temporary B-tree is several times faster.
+    reached = ', '.join(f"MAX({condition}) AS stage_{i}" for i, condition in enumerate(stages.values()))
+    totals = ', '.join(f"COALESCE(SUM(stage_{i}), 0)" for i in range(len(stages)))
+    where, params = _where(start, end)
+    values = con.execute(f"SELECT {totals} FROM (SELECT {reached} FROM events{where} GROUP BY +user_id)",
+                         params).fetchone()
+    return dict(zip(stages, values))
+
+
+def get_events_by_type_df(con: sqlite3.Connection, start=None, end=None) -> pd.DataFrame:
+    result = _counts_of(_counts_by_type_and_page(con, start, end), 'event_type')
+    if result.empty:
+        return pd.DataFrame(columns=['event_type', 'count'])
+    result['event_type'] = result['event_type'].astype('category')
+    return result.sort_values('count', ascending=False)
+
+
+def get_events_by_page_df(con: sqlite3.Connection, start=None, end=None) -> pd.DataFrame:
+    result = _counts_of(_counts_by_type_and_page(con, start, end), 'page')
+    if result.empty:
+        return pd.DataFrame(columns=['page', 'count'])
+    result['page'] = result['page'].astype('category')
+    return result.sort_values('count', ascending=False)
+
+
+def get_events_over_time_df(con: sqlite3.Connection, granularity: str = 'hour', start=None, end=None) -> pd.DataFrame:
+    where, params = _where(start, end, "ts IS NOT NULL")
+    result = pd.read_sql_query(
+        f"SELECT {_bucket_sql(granularity)} AS bucket, COUNT(*) AS count FROM events{where} "
+        "GROUP BY bucket ORDER BY bucket", con, params=params)
+    if result.empty:
+        return pd.DataFrame(columns=['datetime', 'count'])
+    return pd.DataFrame({'datetime': _to_datetimes(result['bucket']), 'count': result['count'].astype(np.int64)})
+
+
+def calculate_all_metrics(con: sqlite3.Connection, start=None, end=None) -> Dict[str, Any]:
+    return {
+        'general': calculate_general_metrics(con, start, end),
+        'time': calculate_time_metrics(con, start, end),
+        'ecommerce': calculate_ecommerce_metrics(con, start, end),
+        'funnel': calculate_conversion_funnel(con, start, end)
+    }
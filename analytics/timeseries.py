@@ -0,0 +1,204 @@
+"""Time-series pyramid - event counts at minute, hour, day, week and month resolution."""
+
+import os
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+
+LEVELS = ['minute', 'hour', 'day', 'week', 'month']
+PYRAMID_FILE = 'events_pyramid.parquet'
+
+# Approximate bucket widths, used to pick a level for a point budget
+LEVEL_WIDTHS = {
+    'minute': pd.Timedelta(minutes=1),
+    'hour': pd.Timedelta(hours=1),
+    'day': pd.Timedelta(days=1),
+    'week': pd.Timedelta(days=7),
+    'month': pd.Timedelta(days=30.44),
+}
+# Each level is built from the one before it
+PARENT_LEVEL = {'hour': 'minute', 'day': 'hour', 'week': 'day', 'month': 'day'}
+FILL_FREQ = {'minute': 'min', 'hour': 'h', 'day': 'D', 'week': 'W-MON', 'month': 'MS'}
+
+
+def resolve_granularity(granularity: str, levels=LEVELS) -> str:
+    """The level events over time are counted at: granularity if it is one of levels, else day.
+
+    Shared by the pandas, cube and SQL backends so they agree on what an
+    unknown granularity (or one a backend is too coarse for) returns.
+    """
+    if granularity in levels:
+        return granularity
+    print(f"Warning: no {granularity} buckets here, counting events by day")
+    return 'day'
+
+
+def floor_times(times: pd.Series, granularity: str) -> pd.Series:
+    """Start of the bucket each timestamp falls in; weeks start on Monday."""
+    if granularity == 'minute':
+        return times.dt.floor('min')
+    if granularity == 'hour':
+        return times.dt.floor('h')
+    if granularity == 'day':
+        return times.dt.floor('D')
+    # Whole days are subtracted as timedelta64[D] so the result keeps the input's unit
+    if granularity == 'week':
+        day = times.dt.floor('D')
+        return day - day.dt.dayofweek.fillna(0).to_numpy(dtype=np.int64) * np.timedelta64(1, 'D')
+    if granularity == 'month':
+        day = times.dt.floor('D')
+        return day - (day.dt.day.fillna(1).to_numpy(dtype=np.int64) - 1) * np.timedelta64(1, 'D')
+    raise ValueError(f"Unknown granularity: {granularity} (expected one of {', '.join(LEVELS)})")
+
+
+def _rollup(counts: pd.Series, granularity: str) -> pd.Series:
+    buckets = floor_times(counts.index.to_series(), granularity)
+    return counts.groupby(buckets.to_numpy()).sum()
+
+
+def _bucket_end(bucket: pd.Timestamp, granularity: str) -> pd.Timestamp:
+    if granularity == 'month':
+        return bucket + pd.offsets.MonthBegin(1)
+    return bucket + LEVEL_WIDTHS[granularity]
+
+
+def _splice(counts: pd.Series, first: pd.Timestamp, end: pd.Timestamp, replace) -> pd.Series:
+    """Replaces the buckets in [first, end) with replace(those buckets), leaving the rest untouched."""
+    lo, hi = counts.index.searchsorted(first), counts.index.searchsorted(end)
+    parts = [counts.iloc[:lo], replace(counts.iloc[lo:hi]), counts.iloc[hi:]]
+    parts = [part for part in parts if not part.empty]
+    if not parts:
+        return counts
+    return pd.concat(parts).astype(np.int64) if len(parts) > 1 else parts[0].astype(np.int64)
+
+
+class TimeSeriesPyramid:
+    """Event counts per bucket at every level, each coarser level summed from a finer one.
+
+    append() adds the counts of new events and rebuilds only the coarser
+    buckets they touch, so keeping the pyramid current costs time in
+    proportion to the new events. query() picks the finest level that fits
+    the point budget for the requested range, so any zoom level returns
+    about the same number of points.
+    """
+
+    def __init__(self):
+        self.levels: Dict[str, pd.Series] = {level: pd.Series(dtype=np.int64) for level in LEVELS}
+
+    @classmethod
+    def from_events(cls, df: pd.DataFrame) -> 'TimeSeriesPyramid':
+        pyramid = cls()
+        pyramid.append(df)
+        return pyramid
+
+    def append(self, df: pd.DataFrame) -> None:
+        if df.empty or 'datetime' not in df.columns:
+            return
+        times = df['datetime'].dropna()
+        if times.empty:
+            return
+
+        new_minutes = times.dt.floor('min').value_counts().sort_index().astype(np.int64)
+        first, end = new_minutes.index[0], new_minutes.index[-1] + LEVEL_WIDTHS['minute']
+        self.levels['minute'] = _splice(self.levels['minute'], first, end,
+                                        lambda stored: stored.add(new_minutes, fill_value=0))
+
+        touched = new_minutes.index.to_series()
+        for level in LEVELS[1:]:
+            parent = self.levels[PARENT_LEVEL[level]]
+            buckets = floor_times(touched, level)
+            first, end = buckets.iloc[0], _bucket_end(buckets.iloc[-1], level)
+            # Recompute the touched buckets from the finer level instead of adding, so
+            # appending overlapping or late events gives the same pyramid as a rebuild
+            lo, hi = parent.index.searchsorted(first), parent.index.searchsorted(end)
+            rebuilt = _rollup(parent.iloc[lo:hi], level)
+            self.levels[level] = _splice(self.levels[level], first, end, lambda stored: rebuilt)
+
+    def choose_level(self, start: pd.Timestamp, end: pd.Timestamp, max_points: int) -> str:
+        span = pd.Timestamp(end) - pd.Timestamp(start)
+        for level in LEVELS:
+            if span / LEVEL_WIDTHS[level] <= max_points:
+                return level
+        return LEVELS[-1]
+
+    def query(self, start: Optional[pd.Timestamp] = None, end: Optional[pd.Timestamp] = None,
+              max_points: int = 500, granularity: Optional[str] = None) -> pd.DataFrame:
+        """Counts for start <= bucket < end as a datetime/count frame, empty buckets filled with 0.
+
+        The level is the finest one with at most max_points buckets in the
+        range, unless granularity is given. The level used is in
+        result.attrs['granularity'].
+        """
+        minutes = self.levels['minute']
+        if minutes.empty:
+            result = pd.DataFrame(columns=['datetime', 'count'])
+            result.attrs['granularity'] = granularity or LEVELS[0]
+            return result
+
+        start = pd.Timestamp(start) if start is not None else minutes.index[0]
+        end = pd.Timestamp(end) if end is not None else minutes.index[-1] + LEVEL_WIDTHS['minute']
+        level = granularity or self.choose_level(start, end, max_points)
+
+        counts = self.levels[level]
+        first = floor_times(pd.Series([start]), level).iloc[0]
+        counts = counts[(counts.index >= first) & (counts.index < end)]
+        index = pd.date_range(first, end, freq=FILL_FREQ[level], inclusive='left', unit=counts.index.unit)
+        counts = counts.reindex(index, fill_value=0)
+
+        result = pd.DataFrame({'datetime': counts.index, 'count': counts.to_numpy()})
+        result.attrs['granularity'] = level
+        return result
+
+    def save(self, path: str) -> int:
+        """Writes every level to one Parquet file, replacing it atomically; returns the rows written."""
+        frames = [pd.DataFrame({'level': level, 'datetime': counts.index, 'count': counts.to_numpy()})
+                  for level, counts in self.levels.items()]
+        tmp_path = path + '.tmp'
+        pd.concat(frames, ignore_index=True).astype({'level': 'category'}).to_parquet(
+            tmp_path, index=False, compression='zstd')
+        os.replace(tmp_path, path)
+        return sum(len(counts) for counts in self.levels.values())
+
+    @classmethod
+    def load(cls, path: str) -> 'TimeSeriesPyramid':
+        pyramid = cls()
+        if os.path.exists(path):
+            table = pd.read_parquet(path)
+            for level, rows in table.groupby('level', observed=True):
+                pyramid.levels[level] = pd.Series(rows['count'].to_numpy(), index=pd.DatetimeIndex(rows['datetime']))
+        return pyramid
+
+
+if __name__ == '__main__':
+
+    print("=== Checking the pyramid against direct counts ===")
+
+    rng = np.random.default_rng(5)
+    start = np.datetime64('2025-11-20', 'ms')
+    times = np.sort(start + rng.integers(0, 90 * 86_400_000, 200_000).astype('timedelta64[ms]'))
+    df = pd.DataFrame({'datetime': times})
+
+    # Appended in uneven slices, including one slice that overlaps an hour already stored
+    pyramid = TimeSeriesPyramid()
+    for cut in np.array_split(np.arange(len(df)), 7):
+        pyramid.append(df.iloc[cut])
+    rebuilt = TimeSeriesPyramid.from_events(df)
+
+    for level in LEVELS:
+        direct = floor_times(df['datetime'], level).value_counts().sort_index()
+        assert (pyramid.levels[level].to_numpy() == direct.to_numpy()).all(), level
+        assert (pyramid.levels[level].index == direct.index).all(), level
+        assert pyramid.levels[level].equals(rebuilt.levels[level]), level
+
+    for span, budget in ((pd.Timedelta(hours=3), 500), (pd.Timedelta(days=5), 500),
+                         (pd.Timedelta(days=60), 500), (pd.Timedelta(days=90), 20)):
+        begin = pd.Timestamp('2025-12-01 06:30')
+        result = pyramid.query(begin, begin + span, max_points=budget)
+        buckets = floor_times(df['datetime'], result.attrs['granularity'])
+        in_range = buckets[(buckets >= result['datetime'].iloc[0]) & (buckets < begin + span)]
+        assert len(result) <= budget + 1 and result['count'].sum() == len(in_range)
+        print(f"{span} at <= {budget} points: {result.attrs['granularity']} level, {len(result)} points")
+
+    print("all levels match direct counts")
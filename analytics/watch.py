@@ -0,0 +1,280 @@
+"""Watch mode - keeps analytics outputs current as new event files arrive."""
+
+import os
+import time
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from .log_parser import (
+    PARTITION_FILE,
+    SEGMENT_SUFFIX,
+    add_time_columns,
+    finalize_events,
+    load_event_files,
+    load_segment_range,
+    read_partition,
+)
+from .aggregates import EventAggregates, SessionAggregates
+from .cube import CUBE_FILE, build_cube, merge_cubes, save_cube
+from .publish import publish as publish_version, table_artifacts
+from .timeseries import PYRAMID_FILE, TimeSeriesPyramid
+
+
+# With notifications, folders are still scanned this often in case an event was dropped
+DEFAULT_RESCAN_INTERVAL = 60.0
+
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+
+
+class LogWatcher:
+    """Finds event files under logs_dir that have not been read yet.
+
+    Without hints every folder whose mtime changed is listed again (polling);
+    with hints from file-system notifications only the named paths are checked.
+    NDJSON segments are read from the last offset reached.
+    """
+
+    def __init__(self, logs_dir: str):
+        self.logs_path = Path(logs_dir)
+        self.known: Dict[str, Set[str]] = {}
+        self.folder_mtimes: Dict[str, int] = {}
+        self.subfolders: Dict[str, List[str]] = {}
+        self.segment_offsets: Dict[str, int] = {}
+        self.partitions: Set[str] = set()
+        self.retry: Set[str] = set()
+
+    def _scan_folder(self, folder: str, files: List[str], partitions: List[str]) -> None:
+        mtime_ns = os.stat(folder).st_mtime_ns
+        if self.folder_mtimes.get(folder) != mtime_ns:
+            self.folder_mtimes[folder] = mtime_ns
+            known = self.known.setdefault(folder, set())
+            subfolders = []
+            for entry in os.scandir(folder):
+                if entry.is_dir():
+                    subfolders.append(entry.path)
+                elif entry.name == PARTITION_FILE and entry.path not in self.partitions:
+                    partitions.append(entry.path)
+                elif entry.name.endswith('.json') and entry.name not in known:
+                    files.append(entry.path)
+                elif entry.name.endswith(SEGMENT_SUFFIX):
+                    self.segment_offsets.setdefault(entry.path, 0)
+            self.subfolders[folder] = sorted(subfolders)
+
+        for subfolder in self.subfolders.get(folder, []):
+            if os.path.isdir(subfolder):
+                self._scan_folder(subfolder, files, partitions)
+
+    def collect(self, hints: Optional[Set[str]] = None) -> Tuple[List[str], List[str], List[Tuple[str, int]]]:
+        files: List[str] = []
+        partitions: List[str] = []
+
+        if hints is None:
+            if self.logs_path.exists():
+                self._scan_folder(str(self.logs_path), files, partitions)
+        else:
+            for path in hints:
+                name = os.path.basename(path)
+                folder = os.path.dirname(path)
+                if name.endswith('.json') and name not in self.known.get(folder, ()):
+                    files.append(path)
+                elif name.endswith(SEGMENT_SUFFIX):
+                    self.segment_offsets.setdefault(path, 0)
+                elif name == PARTITION_FILE and path not in self.partitions:
+                    partitions.append(path)
+
+        files = sorted(set(files) | self.retry)
+        segments = [(path, offset) for path, offset in self.segment_offsets.items()
+                    if os.path.exists(path) and os.path.getsize(path) > offset]
+        return files, partitions, segments
+
+    def read_new(self, hints: Optional[Set[str]] = None) -> pd.DataFrame:
+        files, partitions, segments = self.collect(hints)
+        frames = []
+
+        for path in partitions:
+            self.partitions.add(path)
+            partition = read_partition(path)
+            known = self.known.setdefault(os.path.dirname(path), set())
+            frames.append(partition[~partition['source_file'].isin(known)])
+            known.update(partition['source_file'].unique())
+
+        # Raw files left next to a partition found in the same pass are already in it
+        files = [path for path in files if os.path.basename(path) not in self.known.get(os.path.dirname(path), ())]
+        if files:
+            df_files, failed = load_event_files(files)
+            # Files caught mid-write are picked up again on the next pass
+            self.retry = set(failed)
+            for path in files:
+                if path not in self.retry:
+                    self.known.setdefault(os.path.dirname(path), set()).add(os.path.basename(path))
+            frames.append(df_files)
+
+        for path, offset in segments:
+            columns, _, _, next_offset = load_segment_range(path, offset)
+            self.segment_offsets[path] = next_offset
+            frames.append(add_time_columns(pd.DataFrame(columns)))
+
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame()
+        return finalize_events(pd.concat(frames, ignore_index=True))
+
+
+class _ChangeHandler(FileSystemEventHandler if WATCHDOG_AVAILABLE else object):
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.paths: Set[str] = set()
+        self.changed = threading.Event()
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        for path in (getattr(event, 'src_path', None), getattr(event, 'dest_path', None)):
+            if path:
+                with self.lock:
+                    self.paths.add(os.fsdecode(path))
+        self.changed.set()
+
+    def take(self) -> Set[str]:
+        with self.lock:
+            paths, self.paths = self.paths, set()
+        self.changed.clear()
+        return paths
+
+
+def publish(aggregates: EventAggregates, output_dir: str, cube: Optional[pd.DataFrame] = None,
+            pyramid: Optional[TimeSeriesPyramid] = None, sessions: Optional[SessionAggregates] = None) -> None:
+    """Publishes the same files as generate_analytics as one new version (see publish.py)."""
+    artifacts = table_artifacts({
+        'events_by_type': aggregates.events_by_type_df(),
+        'events_by_page': aggregates.events_by_page_df(),
+        'events_over_time': aggregates.events_over_time_df(),
+        'add_to_cart_by_product': aggregates.add_to_cart_by_product_df(),
+    })
+    artifacts['summary.json'] = aggregates.summary(sessions)
+    if cube is not None:
+        artifacts[CUBE_FILE] = lambda path: save_cube(cube, path)
+    if pyramid is not None:
+        artifacts[PYRAMID_FILE] = pyramid.save
+    publish_version(output_dir, artifacts)
+
+
+class WatchSession:
+    """Running aggregates, sessions, cube and pyramid fed by a LogWatcher; each batch of events is dropped once folded in."""
+
+    def __init__(self, logs_dir: str, output_dir: str, approximate: bool = False):
+        self.output_dir = output_dir
+        self.watcher = LogWatcher(logs_dir)
+        self.aggregates = EventAggregates(approximate)
+        self.sessions = SessionAggregates()
+        # Kept current batch by batch so every published version has all of the report's files
+        self.cube = build_cube(pd.DataFrame())
+        self.pyramid = TimeSeriesPyramid()
+
+    def ingest(self, hints: Optional[Set[str]] = None) -> int:
+        new = self.watcher.read_new(hints)
+        if new.empty:
+            return 0
+        self.aggregates.update(new)
+        self.sessions.update(new)
+        self.cube = merge_cubes(self.cube, build_cube(new))
+        self.pyramid.append(new)
+        return len(new)
+
+    def publish(self) -> None:
+        publish(self.aggregates, self.output_dir, self.cube, self.pyramid, self.sessions)
+
+
+def watch(logs_dir: str, output_dir: str, poll_interval: float = 1.0, max_latency: float = 2.0,
+          use_notifications: bool = True, stop: Optional[threading.Event] = None,
+          rescan_interval: float = DEFAULT_RESCAN_INTERVAL, approximate: bool = False) -> None:
+    """Tails logs_dir and republishes outputs at most max_latency seconds after new events.
+
+    File-system notifications (watchdog/inotify) are used when available,
+    with a full scan every rescan_interval seconds in case any were missed;
+    otherwise folders are polled every poll_interval seconds. New events are
+    folded into running aggregates and not kept, so each pass costs time in
+    proportion to the new events only. With approximate, unique users and
+    per-product counts are kept in bounded sketches (see EventAggregates).
+    """
+    stop = stop or threading.Event()
+    session = WatchSession(logs_dir, output_dir, approximate)
+
+    handler = None
+    observer = None
+    if use_notifications and WATCHDOG_AVAILABLE and Path(logs_dir).exists():
+        # Started before the initial scan, so a file written during it is still notified
+        handler = _ChangeHandler()
+        observer = Observer()
+        observer.schedule(handler, logs_dir, recursive=True)
+        observer.start()
+        print(f"[Watch] Using file-system notifications, rescanning every {rescan_interval}s")
+    else:
+        print(f"[Watch] Polling every {poll_interval}s")
+
+    print(f"[Watch] Initial load from: {logs_dir}")
+    session.ingest()
+    session.publish()
+    print(f"[Watch] {session.aggregates.total_events} events loaded, outputs published to {output_dir}")
+
+    pending = 0
+    last_publish = last_rescan = time.monotonic()
+    try:
+        while not stop.is_set():
+            if handler is not None:
+                handler.changed.wait(poll_interval)
+                if time.monotonic() - last_rescan >= rescan_interval:
+                    # Dropped or overflowed notifications are caught by a full scan now and then
+                    handler.take()
+                    pending += session.ingest()
+                    last_rescan = time.monotonic()
+                else:
+                    # Retries and segment growth are checked even without notifications
+                    pending += session.ingest(handler.take())
+            else:
+                stop.wait(poll_interval)
+                pending += session.ingest()
+
+            # New events are seen within poll_interval, so publishing this often keeps the bound
+            now = time.monotonic()
+            if pending and now - last_publish >= max(max_latency - poll_interval, 0):
+                session.publish()
+                print(f"[Watch] +{pending} events, {session.aggregates.total_events} total, published")
+                pending = 0
+                last_publish = now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
+        print("[Watch] Stopped")
+
+
+if __name__ == '__main__':
+
+    script_dir = Path(__file__).parent
+    parser = argparse.ArgumentParser(description="Keep analytics outputs current as events arrive.")
+    parser.add_argument('logs_dir', nargs='?', default=str(script_dir.parent / 'logs'))
+    parser.add_argument('output_dir', nargs='?', default=str(script_dir / 'output'))
+    parser.add_argument('--interval', type=float, default=1.0, help="poll interval in seconds")
+    parser.add_argument('--max-latency', type=float, default=2.0, help="publish bound in seconds")
+    parser.add_argument('--poll', action='store_true', help="poll even if watchdog is installed")
+    parser.add_argument('--rescan-interval', type=float, default=DEFAULT_RESCAN_INTERVAL,
+                        help="full scan interval in seconds when using notifications")
+    args = parser.parse_args()
+
+    watch(args.logs_dir, args.output_dir, args.interval, args.max_latency, use_notifications=not args.poll,
+          rescan_interval=args.rescan_interval)
@@ -0,0 +1,101 @@
+"""Merging aggregate states must give the same outputs as recomputing them from all of the events."""
+
+import json
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analytics.aggregates import EventAggregates, HourlyAggregateStore, SessionAggregates
+from analytics.bench import synthetic_frame
+from analytics.metrics import (
+    ADD_TO_CART_ELEMENTS,
+    VIEW_DETAILS_ELEMENT,
+    calculate_all_metrics,
+    calculate_ordered_funnel,
+)
+from analytics.sessions import assign_sessions, build_sessions, session_kpis
+
+
+def assert_same(expected, actual, path='metrics'):
+    if isinstance(expected, dict):
+        assert expected.keys() == actual.keys(), path
+        for key in expected:
+            assert_same(expected[key], actual[key], f"{path}.{key}")
+    elif isinstance(expected, pd.DataFrame):
+        pd.testing.assert_frame_equal(expected, actual, obj=path)
+    else:
+        assert expected == actual, f"{path}: {expected!r} != {actual!r}"
+
+
+def random_events(rng, n):
+    df = pd.DataFrame({
+        'event_type': rng.choice(['page_visit', 'click'], n),
+        'page': rng.choice(['home', 'product', 'cart'], n),
+        'element': rng.choice(['page_load', 'nav_home', VIEW_DETAILS_ELEMENT] + ADD_TO_CART_ELEMENTS, n),
+        'product_id': rng.choice(['P001', 'P002', 'P003', 'P004', None], n),
+        'user_id': rng.choice([f"user_{i}" for i in range(20)] + [None], n),
+        'datetime': (np.datetime64('2026-01-01', 'ms')
+                     + rng.integers(0, 3 * 86_400_000, n).astype('timedelta64[ms]')),
+    })
+    return df.sort_values('datetime', kind='stable').reset_index(drop=True)
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_random_splits_merge_to_the_recomputed_metrics(seed):
+    rng = np.random.default_rng(seed)
+    df = random_events(rng, int(rng.integers(1, 400)))
+
+    # Arbitrary row splits, through JSON, merged in a random order
+    cuts = [0] + sorted(rng.integers(0, len(df), int(rng.integers(0, 6)))) + [len(df)]
+    parts = [EventAggregates.from_events(df.iloc[a:b]) for a, b in zip(cuts, cuts[1:])]
+    random.Random(seed).shuffle(parts)
+    merged = EventAggregates()
+    for part in parts:
+        merged.merge(EventAggregates.from_dict(json.loads(json.dumps(part.to_dict()))))
+
+    assert_same(calculate_all_metrics(df), merged.metrics())
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_stored_hourly_states_merge_to_the_recomputed_metrics(seed, tmp_path):
+    rng = np.random.default_rng(1000 + seed)
+    df = random_events(rng, int(rng.integers(1, 400)))
+    store = HourlyAggregateStore(str(tmp_path))
+    store.add_events(df)
+    store.save()
+
+    assert_same(calculate_all_metrics(df), HourlyAggregateStore(str(tmp_path)).load().merged().metrics())
+
+
+def test_hourly_store_sync_matches_a_rebuild(tmp_path):
+    rng = np.random.default_rng(5)
+    df = random_events(rng, 600)
+    first = df.iloc[:400]
+    store = HourlyAggregateStore(str(tmp_path))
+    store.sync(first)
+    store.save()
+
+    # More events, some in hours already stored
+    store = HourlyAggregateStore(str(tmp_path)).load()
+    changed = store.sync(df)
+    store.save()
+
+    assert 0 < changed < len(store.states)
+    assert_same(calculate_all_metrics(df), HourlyAggregateStore(str(tmp_path)).load().merged().metrics())
+
+
+def test_session_aggregates_fed_in_batches_match_recomputation():
+    df = synthetic_frame(100_000, days=3, n_users=2_000)
+    sessions = SessionAggregates()
+    for batch in np.array_split(np.arange(len(df)), 37):
+        sessions.update(df.iloc[batch])
+
+    events = df.copy(deep=False)
+    events['session_id'] = assign_sessions(events)
+    expected = session_kpis(build_sessions(events))
+    for name, value in sessions.kpis().items():
+        assert np.isclose(value, expected[name]), name
+    assert sessions.ordered_funnel() == calculate_ordered_funnel(df)
+    assert sessions.ordered_session_funnel() == calculate_ordered_funnel(events, by='session_id')
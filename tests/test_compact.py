@@ -0,0 +1,49 @@
+"""Compacting a day folder must not lose events or fields."""
+
+import json
+import os
+
+import pandas as pd
+
+from analytics.compact import compact_day
+from analytics.log_parser import PARTITION_FILE, load_events_from_directory
+
+
+def write_events(day_dir, events):
+    os.makedirs(day_dir, exist_ok=True)
+    for i, event in enumerate(events):
+        with open(os.path.join(day_dir, f"{event['timestamp']}{i:03d}.json"), 'w') as f:
+            json.dump(event, f)
+
+
+def test_compaction_keeps_extra_event_fields(tmp_path):
+    day_dir = str(tmp_path / '20260101')
+    write_events(day_dir, [
+        {'timestamp': f"2026010110{i:02d}00", 'event_type': 'click', 'page': 'home', 'element': 'nav_home',
+         'user_id': f"user_{i % 3}", 'session_ref': f"s{i}", 'scroll_depth': i * 10}
+        for i in range(12)
+    ])
+    expected = load_events_from_directory(str(tmp_path))
+
+    assert compact_day(day_dir, remove_raw=True) == 12
+    assert os.listdir(day_dir) == [PARTITION_FILE]
+    actual = load_events_from_directory(str(tmp_path))
+
+    assert list(actual.columns) == list(expected.columns)
+    for col in ('session_ref', 'scroll_depth', 'user_id', 'datetime'):
+        pd.testing.assert_series_equal(actual[col].astype(object), expected[col].astype(object))
+
+
+def test_fields_parquet_cannot_store_are_dropped_with_a_warning(tmp_path, capsys):
+    day_dir = str(tmp_path / '20260101')
+    write_events(day_dir, [
+        {'timestamp': '20260101100000', 'event_type': 'click', 'page': 'home', 'element': 'nav_home', 'mixed': 'a'},
+        {'timestamp': '20260101100100', 'event_type': 'click', 'page': 'home', 'element': 'nav_home', 'mixed': 5},
+    ])
+
+    compact_day(day_dir)
+    df = load_events_from_directory(str(tmp_path))
+
+    assert 'mixed' not in df.columns
+    assert len(df) == 2
+    assert 'fields mixed cannot be stored' in capsys.readouterr().out
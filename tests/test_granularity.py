@@ -0,0 +1,26 @@
+"""Every backend must bucket events over time the same way, unknown granularities included."""
+
+import pandas as pd
+import pytest
+
+from analytics import cube, metrics
+from analytics.bench import synthetic_frame
+
+
+@pytest.fixture(scope='module')
+def events():
+    return synthetic_frame(20_000, days=40, n_users=500)
+
+
+@pytest.mark.parametrize('granularity', ['hour', 'day', 'week', 'month', 'fortnight'])
+def test_cube_counts_over_time_match_pandas(granularity, events):
+    pd.testing.assert_frame_equal(metrics.get_events_over_time_df(events, granularity),
+                                  cube.get_events_over_time_df(cube.build_cube(events), granularity))
+
+
+@pytest.mark.parametrize('granularity', ['minute', 'fortnight'])
+def test_granularities_a_backend_cannot_answer_fall_back_to_days(granularity, events, capsys):
+    daily = metrics.get_events_over_time_df(events, 'day')
+
+    pd.testing.assert_frame_equal(cube.get_events_over_time_df(cube.build_cube(events), granularity), daily)
+    assert f"no {granularity} buckets" in capsys.readouterr().out
@@ -0,0 +1,109 @@
+"""Sketch estimates must stay within their stated error bounds of the exact counts."""
+
+import os
+
+import numpy as np
+import pytest
+
+from analytics.aggregates import EventAggregates, HourlyAggregateStore
+from analytics.bench import synthetic_frame
+from analytics.metrics import ORDERED_FUNNEL_STEPS, calculate_all_metrics
+from analytics.sketches import DEFAULT_PRECISION, HeavyHitters, HyperLogLog
+
+
+# 4 standard errors: a check fails by chance far less than once in 10,000 runs
+STANDARD_ERRORS = 4
+
+
+@pytest.mark.parametrize('precision', [10, 12, 14])
+@pytest.mark.parametrize('n', [100, 10_000, 200_000])
+def test_hyperloglog_is_within_its_error_bound(precision, n):
+    rng = np.random.default_rng(precision * n)
+    ids = np.array([f"user_{i}" for i in rng.integers(0, n * 2, n * 3)], dtype=object)
+    exact = len(set(ids))
+
+    # Per-day sketches merged into one total
+    total = HyperLogLog(precision)
+    for day in np.array_split(ids, 7):
+        total.merge(HyperLogLog.from_values(day, precision))
+
+    assert total.count() == HyperLogLog.from_values(ids, precision).count()
+    assert abs(total.count() - exact) / exact <= STANDARD_ERRORS * total.relative_error
+
+
+def test_merged_heavy_hitters_bound_the_true_counts():
+    # Zipf-like catalog: a few products take most of the traffic
+    rng = np.random.default_rng(11)
+    catalog = np.array([f"P{i:06d}" for i in range(200_000)], dtype=object)
+    weights = 1.0 / np.arange(1, len(catalog) + 1) ** 1.1
+    stream = catalog[rng.choice(len(catalog), 2_000_000, p=weights / weights.sum())]
+
+    exact = HeavyHitters(capacity=None)
+    partitions = []
+    for part in np.array_split(stream, 8):
+        summary = HeavyHitters(capacity=500)
+        for batch in np.array_split(part, 10):
+            summary.update(batch)
+        exact.update(part)
+        partitions.append(summary)
+    merged = partitions[0]
+    for summary in partitions[1:]:
+        merged.merge(summary)
+
+    assert merged.total == len(stream)
+    assert merged.error <= merged.error_bound
+    true_counts = exact.counts
+    for item, count in merged.counts.items():
+        assert count <= true_counts[item] <= count + merged.error, item
+    assert exact.top(10)['item'].tolist() == merged.top(10)['item'].tolist()
+
+
+@pytest.fixture(scope='module')
+def events():
+    return synthetic_frame(200_000, days=14, n_users=100_000)
+
+
+@pytest.fixture(scope='module')
+def merged_hourly_states(events, tmp_path_factory):
+    tmp = str(tmp_path_factory.mktemp('hourly'))
+    store = HourlyAggregateStore(tmp, approximate=True)
+    store.add_events(events)
+    store.save()
+    assert os.listdir(tmp)
+
+    # Hourly sketches merged into daily ones, then the days into the two weeks
+    days = {}
+    for key, state in HourlyAggregateStore(tmp, approximate=True).load().states.items():
+        days.setdefault(key[:8], EventAggregates(approximate=True)).merge(state)
+    total = EventAggregates(approximate=True)
+    for state in days.values():
+        total.merge(state)
+    return total.metrics()
+
+
+@pytest.mark.parametrize('source', ['merged states', 'calculate_all_metrics'])
+def test_approximate_unique_counts_are_within_the_error_bound(source, events, merged_hourly_states):
+    exact = calculate_all_metrics(events)
+    approximate = merged_hourly_states if source == 'merged states' else calculate_all_metrics(events, approximate=True)
+    bound = STANDARD_ERRORS * HyperLogLog(DEFAULT_PRECISION).relative_error
+
+    checks = {'unique_users': (exact['general']['unique_users'], approximate['general']['unique_users'])}
+    checks.update({stage: (exact['funnel'][stage], approximate['funnel'][stage]) for stage, _, _ in ORDERED_FUNNEL_STEPS})
+    for name, (true_count, estimate) in checks.items():
+        assert abs(estimate - true_count) / true_count <= bound, (name, true_count, estimate)
+
+
+@pytest.mark.parametrize('source', ['merged states', 'capacity 10'])
+def test_approximate_product_counts_bound_the_true_counts(source, events, merged_hourly_states):
+    exact = calculate_all_metrics(events)
+    true_added = exact['ecommerce']['add_to_cart_by_product'].set_index('product_id')['add_to_cart_count']
+    approximate = (merged_hourly_states if source == 'merged states'
+                   else calculate_all_metrics(events, approximate=True, capacity=10))
+
+    added = approximate['ecommerce']['add_to_cart_by_product']
+    if source == 'merged states':
+        # Fewer products than the capacity are counted exactly
+        assert len(added) == len(true_added)
+    true_counts = true_added.loc[added['product_id']].to_numpy()
+    assert (added['add_to_cart_count'] <= true_counts).all()
+    assert (true_counts <= added['max_count']).all()
@@ -0,0 +1,88 @@
+"""Every SQL report must return exactly what the metrics.py function of the same name returns."""
+
+import os
+
+import pandas as pd
+import pytest
+
+from analytics import metrics, sql_backend
+from analytics.bench import make_synthetic_logs
+from analytics.log_parser import load_events_from_directory
+
+
+REPORTS = [
+    'calculate_general_metrics',
+    'calculate_time_metrics',
+    'calculate_ecommerce_metrics',
+    'calculate_conversion_funnel',
+    'get_events_by_type_df',
+    'get_events_by_page_df',
+    'calculate_all_metrics',
+]
+GRANULARITIES = ['minute', 'hour', 'day', 'week', 'month', 'fortnight']
+
+# pandas' groupby(observed=...) deprecation, raised by metrics.py itself
+pytestmark = pytest.mark.filterwarnings('ignore::FutureWarning')
+
+
+def assert_same(expected, actual, path='report'):
+    if isinstance(expected, dict):
+        assert expected.keys() == actual.keys(), path
+        for key in expected:
+            assert_same(expected[key], actual[key], f"{path}.{key}")
+    elif isinstance(expected, pd.DataFrame):
+        pd.testing.assert_frame_equal(expected, actual, obj=path)
+    else:
+        assert expected == actual, f"{path}: {expected!r} != {actual!r}"
+
+
+@pytest.fixture(scope='module')
+def events_and_db(tmp_path_factory):
+    logs_dir = str(tmp_path_factory.mktemp('logs'))
+    make_synthetic_logs(logs_dir, 20_000, days=3)
+    df = load_events_from_directory(logs_dir)
+
+    path = os.path.join(str(tmp_path_factory.mktemp('db')), sql_backend.EVENTS_DB)
+    # Several batches, so the database is built the way a large store would be
+    sql_backend.build_database(logs_dir, path, batch_size=max(1, len(df) // 7))
+    con = sql_backend.connect(path)
+    yield df, con
+    con.close()
+
+
+@pytest.fixture(params=['all', 'from middle', 'until middle', 'five hours'])
+def time_range(request, events_and_db):
+    df, con = events_and_db
+    middle = df['datetime'].quantile(0.5).floor('h')
+    start, end = {
+        'all': (None, None),
+        'from middle': (middle, None),
+        'until middle': (None, middle),
+        'five hours': (middle, middle + pd.Timedelta(hours=5)),
+    }[request.param]
+
+    subset = df
+    if start is not None:
+        subset = subset[subset['datetime'] >= start]
+    if end is not None:
+        subset = subset[subset['datetime'] < end]
+    return subset.reset_index(drop=True), con, start, end
+
+
+@pytest.mark.parametrize('report', REPORTS)
+def test_sql_report_matches_pandas(report, time_range):
+    subset, con, start, end = time_range
+    assert_same(getattr(metrics, report)(subset), getattr(sql_backend, report)(con, start, end), report)
+
+
+@pytest.mark.parametrize('granularity', GRANULARITIES)
+def test_sql_events_over_time_matches_pandas(granularity, time_range):
+    subset, con, start, end = time_range
+    assert_same(metrics.get_events_over_time_df(subset, granularity),
+                sql_backend.get_events_over_time_df(con, granularity, start, end), granularity)
+
+
+def test_time_range_queries_use_the_time_index(events_and_db):
+    _, con = events_and_db
+    plan = con.execute("EXPLAIN QUERY PLAN SELECT COUNT(*) FROM events WHERE ts >= ?", (0,)).fetchall()
+    assert any('idx_events_ts' in row[-1] for row in plan), plan
@@ -0,0 +1,41 @@
+"""A command's --help must start without loading any heavy dependency."""
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from analytics.bench import HEAVY_MODULES
+from analytics.cli import build_parser
+
+
+ROOT = Path(__file__).parent.parent
+
+
+def subcommands():
+    parser = build_parser()
+    choices = next(action.choices for action in parser._actions if isinstance(action, argparse._SubParsersAction))
+    return sorted(choices)
+
+
+def imported_modules(stderr: str):
+    modules = set()
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and 'cumulative' not in line:
+            modules.add(line.split('|')[-1].strip())
+    return modules
+
+
+@pytest.mark.parametrize('command', subcommands())
+def test_help_does_not_import_heavy_modules(command):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'analytics', command, '--help'],
+                            cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr[-2000:]
+    assert 'usage:' in result.stdout
+
+    modules = imported_modules(result.stderr)
+    assert 'analytics.cli' in modules
+    heavy = sorted(module for module in modules if module.split('.')[0] in HEAVY_MODULES)
+    assert not heavy, f"{command} --help imports {', '.join(heavy)}"